@@ -1,19 +1,24 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, request, jsonify, make_response, render_template, session, stream_with_context
 from flask_cors import CORS
 import os
+import csv
+import io
 import json
 import logging
+import math
 from datetime import datetime, timedelta
 import redis
 import psycopg2
 from psycopg2.extras import RealDictCursor
+import atexit
 import threading
 import time
 import uuid
 import requests
-from models import DatabaseManager, SecurityEvent, NetworkAnalytics, ThreatIntelligence, UserSession, TrafficEmbeddings, ClaudeGuidanceResponse
+from models import DatabaseManager, SecurityEvent, NetworkAnalytics, MetricWriteBuffer, MetricRollups, PartitionManager, ThreatIntelligence, UserSession, TrafficEmbeddings, ClaudeGuidanceResponse, decode_cursor, next_cursor
 from cache_manager import CacheManager
 from embedding_manager import EmbeddingManager
+from threat_lookup import ThreatLookup
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,13 +30,79 @@ CORS(app)
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+app.config['REDIS_SOCKET_TIMEOUT'] = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+app.config['REDIS_BREAKER_THRESHOLD'] = int(os.environ.get('REDIS_BREAKER_THRESHOLD', 5))
+app.config['REDIS_BREAKER_RESET'] = float(os.environ.get('REDIS_BREAKER_RESET', 30))
+app.config['CACHE_L1_MAX_ENTRIES'] = int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1024))
+app.config['CACHE_L1_TTL'] = float(os.environ.get('CACHE_L1_TTL', 5))
+app.config['CACHE_SERIALIZER'] = os.environ.get('CACHE_SERIALIZER', 'auto')
+app.config['CACHE_COMPRESSION'] = os.environ.get('CACHE_COMPRESSION', 'auto')
+app.config['CACHE_COMPRESS_MIN_BYTES'] = int(os.environ.get('CACHE_COMPRESS_MIN_BYTES', 1024))
+app.config['EVENT_STREAM_MAXLEN'] = int(os.environ.get('EVENT_STREAM_MAXLEN', 10000))
+app.config['THREAT_FILTER_CAPACITY'] = int(os.environ.get('THREAT_FILTER_CAPACITY', 100000))
+app.config['THREAT_FILTER_ERROR_RATE'] = float(os.environ.get('THREAT_FILTER_ERROR_RATE', 0.001))
+app.config['THREAT_FILTER_REFRESH'] = float(os.environ.get('THREAT_FILTER_REFRESH', 10))
+app.config['THREAT_NEGATIVE_TTL'] = int(os.environ.get('THREAT_NEGATIVE_TTL', 300))
+app.config['RATE_LIMIT_GUIDANCE'] = int(os.environ.get('RATE_LIMIT_GUIDANCE', 10))
+app.config['RATE_LIMIT_EMBEDDINGS'] = int(os.environ.get('RATE_LIMIT_EMBEDDINGS', 60))
+app.config['RATE_LIMIT_AI_INFERENCE'] = int(os.environ.get('RATE_LIMIT_AI_INFERENCE', 30))
 app.config['DATABASE_URL'] = os.environ.get('DATABASE_URL')
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+app.config['MAX_REPLICA_LAG'] = float(os.environ.get('MAX_REPLICA_LAG', 30))
+app.config['PREPARED_STATEMENTS'] = os.environ.get('PREPARED_STATEMENTS', 'true').lower() == 'true'
+app.config['DB_POOL_MIN'] = int(os.environ.get('DB_POOL_MIN', 1))
+app.config['DB_POOL_MAX'] = int(os.environ.get('DB_POOL_MAX', 10))
+app.config['DB_POOL_MAX_IDLE'] = int(os.environ.get('DB_POOL_MAX_IDLE', 300))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', 'false').lower() == 'true'
+app.config['VECTOR_INDEX_TYPE'] = os.environ.get('VECTOR_INDEX_TYPE', 'ivfflat')
+app.config['VECTOR_STORAGE'] = os.environ.get('VECTOR_STORAGE', 'halfvec')
+app.config['VECTOR_RERANK_FACTOR'] = int(os.environ.get('VECTOR_RERANK_FACTOR', 4))
+app.config['HNSW_EF_SEARCH'] = int(os.environ.get('HNSW_EF_SEARCH', 40))
+app.config['IVFFLAT_PROBES'] = int(os.environ.get('IVFFLAT_PROBES', 10))
+app.config['MAX_BULK_EVENTS'] = int(os.environ.get('MAX_BULK_EVENTS', 100000))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+app.config['MAX_SEARCH_RESULTS'] = int(os.environ.get('MAX_SEARCH_RESULTS', 100))
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 2000))
+app.config['EVENT_RETENTION_DAYS'] = int(os.environ.get('EVENT_RETENTION_DAYS', 90))
+app.config['METRIC_RETENTION_DAYS'] = int(os.environ.get('METRIC_RETENTION_DAYS', 30))
+app.config['PARTITION_DAYS_AHEAD'] = int(os.environ.get('PARTITION_DAYS_AHEAD', 3))
+app.config['ROLLUP_SETTLE_SECONDS'] = int(os.environ.get('ROLLUP_SETTLE_SECONDS', 60))
+app.config['METRIC_BUFFER_SIZE'] = int(os.environ.get('METRIC_BUFFER_SIZE', 10000))
+app.config['METRIC_BATCH_SIZE'] = int(os.environ.get('METRIC_BATCH_SIZE', 500))
+app.config['METRIC_FLUSH_INTERVAL'] = float(os.environ.get('METRIC_FLUSH_INTERVAL', 1.0))
 
 # Initialize database manager
-db_manager = DatabaseManager(app.config['DATABASE_URL']) if app.config['DATABASE_URL'] else None
+db_manager = DatabaseManager(
+    app.config['DATABASE_URL'],
+    min_connections=app.config['DB_POOL_MIN'],
+    max_connections=app.config['DB_POOL_MAX'],
+    max_idle=app.config['DB_POOL_MAX_IDLE'],
+    checkout_timeout=app.config['DB_POOL_TIMEOUT'],
+    vector_index=app.config['VECTOR_INDEX_TYPE'],
+    hnsw_ef_search=app.config['HNSW_EF_SEARCH'],
+    ivfflat_probes=app.config['IVFFLAT_PROBES'],
+    vector_storage=app.config['VECTOR_STORAGE'],
+    rerank_factor=app.config['VECTOR_RERANK_FACTOR'],
+    replica_url=app.config['DATABASE_REPLICA_URL'],
+    max_replica_lag=app.config['MAX_REPLICA_LAG'],
+    prepare_statements=app.config['PREPARED_STATEMENTS'],
+    auto_migrate=app.config['AUTO_MIGRATE']
+) if app.config['DATABASE_URL'] else None
 
 # Initialize cache manager
-cache_manager = CacheManager(app.config['REDIS_URL'])
+cache_manager = CacheManager(
+    app.config['REDIS_URL'],
+    socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+    failure_threshold=app.config['REDIS_BREAKER_THRESHOLD'],
+    reset_timeout=app.config['REDIS_BREAKER_RESET'],
+    l1_max_entries=app.config['CACHE_L1_MAX_ENTRIES'],
+    l1_ttl=app.config['CACHE_L1_TTL'],
+    serializer=app.config['CACHE_SERIALIZER'],
+    compression=app.config['CACHE_COMPRESSION'],
+    compress_min_bytes=app.config['CACHE_COMPRESS_MIN_BYTES'],
+    stream_maxlen=app.config['EVENT_STREAM_MAXLEN']
+)
 
 # Initialize model classes
 security_event = SecurityEvent(db_manager) if db_manager else None
@@ -41,6 +112,42 @@ user_session = UserSession(db_manager) if db_manager else None
 traffic_embeddings = TrafficEmbeddings(db_manager) if db_manager else None
 claude_guidance = ClaudeGuidanceResponse(db_manager) if db_manager else None
 
+# Threat checks: Bloom filter, then cache, then threat_intelligence
+threat_lookup = ThreatLookup(
+    threat_intelligence,
+    cache_manager,
+    capacity=app.config['THREAT_FILTER_CAPACITY'],
+    error_rate=app.config['THREAT_FILTER_ERROR_RATE'],
+    refresh_interval=app.config['THREAT_FILTER_REFRESH'],
+    negative_ttl=app.config['THREAT_NEGATIVE_TTL']
+) if threat_intelligence else None
+
+# Daily partition creation and retention for the time-series tables
+partition_manager = PartitionManager(
+    db_manager,
+    retention_days={
+        'security_events': app.config['EVENT_RETENTION_DAYS'],
+        'network_analytics': app.config['METRIC_RETENTION_DAYS']
+    },
+    days_ahead=app.config['PARTITION_DAYS_AHEAD']
+) if db_manager else None
+
+# Incremental minute/hour/day aggregates served for coarse analytics periods
+metric_rollups = MetricRollups(
+    db_manager,
+    settle_lag=app.config['ROLLUP_SETTLE_SECONDS']
+) if db_manager else None
+
+# Write-behind buffer keeps analytics inserts off the request path
+metric_buffer = MetricWriteBuffer(
+    network_analytics,
+    max_size=app.config['METRIC_BUFFER_SIZE'],
+    batch_size=app.config['METRIC_BATCH_SIZE'],
+    flush_interval=app.config['METRIC_FLUSH_INTERVAL']
+) if network_analytics else None
+if metric_buffer:
+    atexit.register(metric_buffer.close)
+
 # Initialize embedding manager
 embedding_manager = EmbeddingManager()
 
@@ -77,9 +184,9 @@ class NetworkMonitor:
             'recommendations': []
         }
         
-        # Check threat intelligence cache first
-        if cache_manager and traffic_data.get('source_ip'):
-            threat_check = cache_manager.check_threat_indicator(traffic_data['source_ip'])
+        # Check threat intelligence first; clean IPs are answered in memory
+        if threat_lookup and traffic_data.get('source_ip'):
+            threat_check = threat_lookup.check(traffic_data['source_ip'])
             if threat_check:
                 analysis['risk_score'] += 80
                 analysis['threats_detected'].append(f"Known threat IP: {traffic_data['source_ip']}")
@@ -102,8 +209,8 @@ class NetworkMonitor:
             analysis['recommendations'].append('Review firewall rules and port access')
         
         # Store analysis in database
-        if network_analytics:
-            network_analytics.record_metric({
+        if metric_buffer:
+            metric_buffer.enqueue({
                 'metric_name': 'traffic_analysis_risk_score',
                 'metric_value': analysis['risk_score'],
                 'metric_unit': 'score',
@@ -139,7 +246,7 @@ class NetworkMonitor:
                 'metadata': alert_data
             })
         
-        # Store in Redis for real-time access
+        # Append to the security_alerts stream for consumer groups
         if cache_manager:
             cache_manager.publish_event('security_alerts', alert)
         
@@ -203,6 +310,157 @@ class NetworkMonitor:
 # Initialize network monitor
 network_monitor = NetworkMonitor()
 
+def get_page_size(default):
+    """Read the limit query parameter, capped at MAX_PAGE_SIZE"""
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+def get_search_limit(data, default):
+    """Read limit from a similarity search body, capped at MAX_SEARCH_RESULTS"""
+    try:
+        limit = int(data.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, app.config['MAX_SEARCH_RESULTS']))
+
+def get_time_param(name):
+    """Parse an ISO-8601 query parameter (raises ValueError)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value!r}")
+
+def encode_ndjson(rows, chunk_size=65536):
+    """Encode rows as newline-delimited JSON, yielding ~chunk_size pieces"""
+    chunk = []
+    size = 0
+    for row in rows:
+        line = json.dumps(row, default=str) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+def encode_csv(rows, chunk_size=65536):
+    """Encode rows as CSV with a header row; JSON columns are serialized inline"""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow({
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in row.items()
+        })
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+# Export format -> (encoder, mimetype)
+EXPORT_FORMATS = {
+    'ndjson': (encode_ndjson, 'application/x-ndjson'),
+    'csv': (encode_csv, 'text/csv')
+}
+
+def get_event_filters():
+    """Build SecurityEvent filters from query parameters (raises ValueError)"""
+    filters = {}
+    for name in ('severity', 'source_ip', 'event_type', 'status'):
+        if request.args.get(name):
+            filters[name] = request.args.get(name)
+    for name in ('start_time', 'end_time'):
+        if request.args.get(name):
+            filters[name] = get_time_param(name)
+    return filters
+
+def get_fields():
+    """Read the comma-separated fields query parameter (None means default columns)"""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+def store_traffic_embedding(embedding_data):
+    """Store a traffic embedding and invalidate the cached embedding stats once it commits"""
+    stored_embedding = traffic_embeddings.store_embedding(embedding_data)
+    if stored_embedding and cache_manager:
+        # Invalidating before the commit would let a concurrent reader re-cache the old stats
+        db_manager.after_commit(cache_manager.invalidate_embedding_stats)
+    return stored_embedding
+
+def get_page_cursor():
+    """Read and validate the cursor query parameter (raises ValueError)"""
+    cursor = request.args.get('cursor')
+    if cursor:
+        decode_cursor(cursor)
+    return cursor
+
+# Per-client request limits (requests per minute) for routes that call paid
+# model APIs or do heavy work; the first matching path prefix applies
+RATE_LIMITS = [
+    ('/api/guidance/generate', 'guidance', app.config['RATE_LIMIT_GUIDANCE']),
+    ('/api/embeddings/', 'embeddings', app.config['RATE_LIMIT_EMBEDDINGS']),
+    ('/api/ai-inference', 'ai_inference', app.config['RATE_LIMIT_AI_INFERENCE'])
+]
+
+def get_client_id():
+    """Client address; Heroku's router appends the real peer last to X-Forwarded-For"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return request.remote_addr or 'unknown'
+
+@app.before_request
+def enforce_rate_limits():
+    if not cache_manager:
+        return None
+    
+    for prefix, name, limit in RATE_LIMITS:
+        if request.path.startswith(prefix):
+            allowed, retry_after = cache_manager.check_rate_limit(f"{name}:{get_client_id()}", limit, 60)
+            if not allowed:
+                response = make_response(jsonify({'error': 'Rate limit exceeded', 'retry_after': retry_after}), 429)
+                response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                return response
+            break
+    return None
+
+# Per-request unit of work: model writes made while handling a request share
+# one connection and are committed together
+@app.before_request
+def begin_unit_of_work():
+    if db_manager:
+        db_manager.begin_unit_of_work()
+
+@app.after_request
+def commit_unit_of_work(response):
+    if not db_manager:
+        return response
+    # Flask also runs this for unhandled exceptions (as a 500), and views
+    # that catch an error return 500 themselves; neither may commit
+    if response.status_code >= 500:
+        db_manager.end_unit_of_work(commit=False)
+    elif not db_manager.end_unit_of_work(commit=True):
+        return make_response(jsonify({'error': 'Internal server error'}), 500)
+    return response
+
+@app.teardown_request
+def rollback_unit_of_work(exc):
+    # Releases the connection when after_request was skipped (propagated exceptions)
+    if db_manager:
+        db_manager.end_unit_of_work(commit=False)
+
 # API Routes
 @app.route('/')
 def index():
@@ -223,9 +481,14 @@ def health_check():
         'version': '1.0.0',
         'services': {
             'redis': redis_health['status'] == 'healthy',
-            'database': db_manager is not None and db_manager.get_connection() is not None
+            'database': db_manager is not None and db_manager.ping()
         },
-        'cache_stats': cache_manager.get_cache_stats() if cache_manager else {}
+        'cache_stats': cache_manager.get_cache_stats() if cache_manager else {},
+        'database_pool': db_manager.get_pool_stats() if db_manager else {},
+        'database_statements': db_manager.get_statement_stats() if db_manager else {},
+        'schema_version': db_manager.schema_version if db_manager else None,
+        'metric_buffer': metric_buffer.get_stats() if metric_buffer else {},
+        'threat_lookup': threat_lookup.get_stats() if threat_lookup else {}
     }
     
     print(f"DEBUG: health_check returning: {response_data}")
@@ -325,9 +588,9 @@ def analyze_network_traffic():
         analysis = network_monitor.analyze_traffic(traffic_data)
         
         # Store analysis results in database
-        if network_analytics:
+        if metric_buffer:
             # Store the risk score as a metric
-            network_analytics.record_metric({
+            metric_buffer.enqueue({
                 'metric_name': 'traffic_analysis_risk_score',
                 'metric_value': analysis['risk_score'],
                 'metric_unit': 'score',
@@ -342,7 +605,7 @@ def analyze_network_traffic():
             })
             
             # Store the analysis timestamp
-            network_analytics.record_metric({
+            metric_buffer.enqueue({
                 'metric_name': 'traffic_analysis_timestamp',
                 'metric_value': datetime.now().timestamp(),
                 'metric_unit': 'unix_timestamp',
@@ -395,40 +658,50 @@ def analyze_network_traffic():
 def get_traffic_analysis_history():
     """Get traffic analysis history from database"""
     try:
-        limit = int(request.args.get('limit', 20))
-        offset = int(request.args.get('offset', 0))
+        limit = get_page_size(20)
+        offset = request.args.get('offset', 0, type=int)
+        cursor = get_page_cursor()
         source_ip = request.args.get('source_ip')
+        start_time = get_time_param('start_time')
+        end_time = get_time_param('end_time')
         
+        history = []
+        total = 0
+        page_cursor = None
         if network_analytics:
-            # Get risk score metrics for traffic analysis
-            metrics = network_analytics.get_metrics('traffic_analysis_risk_score', 'realtime', limit * 2)
-            
-            # Filter by source IP if provided
-            if source_ip:
-                metrics = [m for m in metrics if m.get('tags', {}).get('source_ip') == source_ip]
+            # Risk score metrics recorded by traffic analysis
+            metrics = network_analytics.get_metric_history(
+                'traffic_analysis_risk_score', source_ip, start_time, end_time,
+                limit=limit, offset=offset, cursor=cursor
+            )
+            total = network_analytics.count_metric_history(
+                'traffic_analysis_risk_score', source_ip, start_time, end_time
+            ) or 0
+            page_cursor = next_cursor(metrics, limit)
             
             # Format the results
-            history = []
-            for metric in metrics[offset:offset + limit]:
+            for metric in metrics:
+                tags = metric.get('tags') or {}
                 history.append({
                     'timestamp': metric.get('timestamp'),
                     'risk_score': metric.get('metric_value'),
-                    'source_ip': metric.get('tags', {}).get('source_ip', 'unknown'),
-                    'connection_count': metric.get('tags', {}).get('connection_count', 0),
-                    'failed_auth_attempts': metric.get('tags', {}).get('failed_auth_attempts', 0),
-                    'threats_detected_count': metric.get('tags', {}).get('threats_detected_count', 0),
-                    'recommendations_count': metric.get('tags', {}).get('recommendations_count', 0)
+                    'source_ip': metric.get('source_ip') or 'unknown',
+                    'connection_count': tags.get('connection_count', 0),
+                    'failed_auth_attempts': tags.get('failed_auth_attempts', 0),
+                    'threats_detected_count': tags.get('threats_detected_count', 0),
+                    'recommendations_count': tags.get('recommendations_count', 0)
                 })
-        else:
-            history = []
         
         return jsonify({
             'history': history,
-            'total': len(history),
+            'total': total,
             'limit': limit,
-            'offset': offset
+            'offset': offset,
+            'next_cursor': page_cursor
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting traffic analysis history: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -450,54 +723,37 @@ def get_analyze_suggestions():
 def get_events():
     """Get security events from database"""
     try:
-        print("DEBUG: get_events() called")
-        logger.info("DEBUG: get_events() called")
-        
-        limit = int(request.args.get('limit', 10))
-        offset = int(request.args.get('offset', 0))
-        filters = {}
-        
-        print(f"DEBUG: Request params - limit: {limit}, offset: {offset}")
-        logger.info(f"DEBUG: Request params - limit: {limit}, offset: {offset}")
-        
-        if request.args.get('severity'):
-            filters['severity'] = request.args.get('severity')
-        if request.args.get('source_ip'):
-            filters['source_ip'] = request.args.get('source_ip')
-        if request.args.get('event_type'):
-            filters['event_type'] = request.args.get('event_type')
-        
-        print(f"DEBUG: Filters: {filters}")
-        logger.info(f"DEBUG: Filters: {filters}")
+        limit = get_page_size(10)
+        offset = request.args.get('offset', 0, type=int)
+        cursor = get_page_cursor()
+        filters = get_event_filters()
+        fields = get_fields()
         
-        # Use dynamic mock events for demo
-        print("DEBUG: Calling network_monitor.generate_mock_security_events()")
-        logger.info("DEBUG: Calling network_monitor.generate_mock_security_events()")
-        events = network_monitor.generate_mock_security_events(limit)
-        
-        print(f"DEBUG: Generated {len(events)} events")
-        logger.info(f"DEBUG: Generated {len(events)} events")
-        
-        # Apply filters if provided
-        if filters.get('source_ip'):
-            events = [e for e in events if e['source_ip'] == filters['source_ip']]
-        if filters.get('severity'):
-            events = [e for e in events if e['severity'] == filters['severity']]
+        if security_event:
+            events = security_event.get_events(limit, offset, filters, cursor=cursor, fields=fields)
+            page_cursor = next_cursor(events, limit)
+        else:
+            # Use dynamic mock events for demo when no database is attached
+            events = network_monitor.generate_mock_security_events(limit)
+            page_cursor = None
+            
+            # Apply filters if provided
+            if filters.get('source_ip'):
+                events = [e for e in events if e['source_ip'] == filters['source_ip']]
+            if filters.get('severity'):
+                events = [e for e in events if e['severity'] == filters['severity']]
         
-        response_data = {
+        return jsonify({
             'events': events,
             'total': len(events),
             'limit': limit,
-            'offset': offset
-        }
-        
-        print(f"DEBUG: Returning events response: {response_data}")
-        logger.info(f"DEBUG: Returning events response: {response_data}")
-        
-        return jsonify(response_data)
+            'offset': offset,
+            'next_cursor': page_cursor
+        })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"DEBUG: Error in get_events(): {e}")
         logger.error(f"Error getting events: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -522,6 +778,85 @@ def create_event():
         logger.error(f"Error creating event: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/events/export')
+def export_events():
+    """Stream security events as NDJSON or CSV"""
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+        
+        filters = get_event_filters()
+        
+        if not security_event:
+            return jsonify({'error': 'Database not available'}), 503
+        
+        rows = security_event.iter_events(filters, batch_size=app.config['EXPORT_BATCH_SIZE'])
+        encoder, mimetype = EXPORT_FORMATS[export_format]
+        return Response(
+            stream_with_context(encoder(rows)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=security_events.{export_format}'}
+        )
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error exporting events: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _missing_event_fields(event_data):
+    """Required fields a bulk event lacks or leaves blank (severity defaults when absent)"""
+    if not isinstance(event_data, dict):
+        return ['event_type']
+    missing = []
+    for field in ('event_type', 'severity'):
+        if field == 'severity' and field not in event_data:
+            continue
+        value = event_data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            missing.append(field)
+    return missing
+
+@app.route('/api/events/bulk', methods=['POST'])
+def create_events_bulk():
+    """Bulk-ingest security events"""
+    try:
+        payload = request.get_json()
+        events = payload.get('events') if isinstance(payload, dict) else payload
+        if not events or not isinstance(events, list):
+            return jsonify({'error': 'No events provided'}), 400
+        
+        if len(events) > app.config['MAX_BULK_EVENTS']:
+            return jsonify({'error': f"Too many events (max {app.config['MAX_BULK_EVENTS']})"}), 413
+        
+        # COPY reads an empty field as NULL, so one blank required field
+        # would fail the whole batch in the database; reject it here instead
+        invalid = [{'index': index, 'fields': fields}
+                   for index, fields in enumerate(map(_missing_event_fields, events)) if fields]
+        if invalid:
+            first = invalid[0]
+            return jsonify({
+                'error': f"Event {first['index']} is missing {', '.join(first['fields'])}",
+                'invalid_events': invalid
+            }), 400
+        
+        if not security_event:
+            return jsonify({'error': 'Database not available'}), 503
+        
+        ids = security_event.create_events(events)
+        if ids is None:
+            return jsonify({'error': 'Failed to create events'}), 500
+        
+        return jsonify({
+            'ids': ids,
+            'inserted': len(ids)
+        }), 201
+    
+    except Exception as e:
+        logger.error(f"Error bulk creating events: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/alerts')
 def get_alerts():
     """Get all alerts"""
@@ -562,14 +897,13 @@ def update_alert(alert_id):
 @app.route('/api/threats/indicators')
 def get_threat_indicators():
     """Get threat indicators"""
-    # Try cache first
-    cached_indicators = cache_manager.get_threat_indicators() if cache_manager else []
-    if cached_indicators:
-        indicators = cached_indicators
+    # Single-flight cache fill: one caller recomputes, others get the cached value
+    if cache_manager:
+        indicators = cache_manager.get_or_compute(
+            'threats:indicators', lambda: network_monitor.threat_indicators, ttl=1800
+        )
     else:
         indicators = network_monitor.threat_indicators
-        if cache_manager:
-            cache_manager.cache_threat_indicators(indicators)
     
     return jsonify({
         'indicators': indicators,
@@ -601,7 +935,17 @@ def add_threat_indicator():
         
         # Store in database
         if threat_intelligence:
-            threat_intelligence.add_indicator(indicator_data)
+            record = threat_intelligence.add_indicator({
+                'indicator_type': indicator_data['type'],
+                'indicator_value': indicator_data['value'],
+                'confidence_level': indicator_data.get('confidence', 'medium'),
+                'threat_category': indicator_data.get('category'),
+                'description': indicator_data['description'],
+                'source': indicator_data.get('source'),
+                'metadata': indicator_data.get('metadata', {})
+            })
+            if threat_lookup and record:
+                db_manager.after_commit(lambda: threat_lookup.add(record))
         
         # Update cache
         if cache_manager:
@@ -619,18 +963,25 @@ def get_analytics():
     try:
         metric_name = request.args.get('metric_name')
         period = request.args.get('period', 'realtime')
-        limit = int(request.args.get('limit', 100))
+        limit = get_page_size(100)
+        cursor = get_page_cursor()
+        start_time = get_time_param('start_time')
+        end_time = get_time_param('end_time')
         
         if network_analytics:
-            metrics = network_analytics.get_metrics(metric_name, period, limit)
+            metrics = network_analytics.get_metrics(metric_name, period, limit, cursor=cursor,
+                                                    start_time=start_time, end_time=end_time)
         else:
             metrics = []
         
         return jsonify({
             'metrics': metrics,
-            'total': len(metrics)
+            'total': len(metrics),
+            'next_cursor': next_cursor(metrics, limit)
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error getting analytics: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -712,20 +1063,43 @@ def get_cache_stats():
 
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
-    """Clear cache"""
+    """Clear cache: invalidate a namespace immediately, or delete a key pattern in the background"""
     try:
-        pattern = request.json.get('pattern', '*') if request.json else '*'
-        success = cache_manager.clear_cache(pattern) if cache_manager else False
+        data = request.get_json(silent=True) or {}
+        pattern = data.get('pattern', '*')
+        namespace = data.get('namespace')
         
+        if namespace:
+            version = cache_manager.invalidate_namespace(namespace) if cache_manager else None
+            return jsonify({
+                'success': version is not None,
+                'namespace': namespace,
+                'version': version,
+                'pattern': f"{namespace}:*"
+            })
+        
+        job_id = cache_manager.clear_cache(pattern) if cache_manager else None
         return jsonify({
-            'success': success,
-            'pattern': pattern
+            'success': job_id is not None,
+            'pattern': pattern,
+            'job_id': job_id,
+            'status': 'running' if job_id else None
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error clearing cache: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/cache/clear/<job_id>')
+def get_cache_clear_status(job_id):
+    """Get progress of a background cache clear"""
+    status = cache_manager.get_clear_status(job_id) if cache_manager else None
+    if status is None:
+        return jsonify({'error': 'Clear job not found'}), 404
+    return jsonify(dict(status, job_id=job_id))
+
 # AI Inference Endpoints
 @app.route('/api/ai-inference', methods=['POST'])
 def ai_inference():
@@ -776,8 +1150,8 @@ def ai_inference():
             cache_manager.cache_inference_result(inference_type, result)
         
         # Record metric
-        if network_analytics:
-            network_analytics.record_metric({
+        if metric_buffer:
+            metric_buffer.enqueue({
                 'metric_name': 'ai_inference',
                 'metric_value': result.get('processing_time_ms', 0),
                 'metric_unit': 'ms',
@@ -885,7 +1259,7 @@ def generate_embedding():
         
         # Store embedding in database
         if traffic_embeddings:
-            stored_embedding = traffic_embeddings.store_embedding(embedding_data)
+            stored_embedding = store_traffic_embedding(embedding_data)
             if stored_embedding:
                 embedding_data['id'] = stored_embedding['id']
                 embedding_data['stored_at'] = stored_embedding['timestamp']
@@ -919,7 +1293,7 @@ def search_similar_patterns():
         
         # Search for similar patterns
         analysis_type = data.get('analysis_type')
-        limit = data.get('limit', 10)
+        limit = get_search_limit(data, 10)
         similarity_threshold = data.get('similarity_threshold', 0.8)
         
         if traffic_embeddings:
@@ -927,7 +1301,10 @@ def search_similar_patterns():
                 query_embedding, 
                 analysis_type, 
                 limit, 
-                similarity_threshold
+                similarity_threshold,
+                ef_search=data.get('ef_search'),
+                probes=data.get('probes'),
+                fields=get_fields()
             )
         else:
             similar_patterns = []
@@ -939,6 +1316,8 @@ def search_similar_patterns():
             'similar_patterns': similar_patterns
         })
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error searching similar patterns: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -958,7 +1337,7 @@ def analyze_with_embeddings():
         
         # Store the embedding
         if traffic_embeddings:
-            stored_embedding = traffic_embeddings.store_embedding(embedding_data)
+            stored_embedding = store_traffic_embedding(embedding_data)
             if stored_embedding:
                 embedding_data['id'] = stored_embedding['id']
         
@@ -1011,21 +1390,19 @@ def get_embedding_stats():
         stats = {
             'total_embeddings': 0,
             'embeddings_by_type': {},
-            'recent_embeddings': [],
-            'embedding_manager_status': 'enabled' if embedding_manager.enabled else 'disabled'
+            'embeddings_by_bucket': {},
+            'recent_embeddings': []
         }
         
         if traffic_embeddings:
-            # Get embeddings by type
-            for analysis_type in ['traffic_analysis', 'security_event', 'network_metric']:
-                embeddings = traffic_embeddings.get_embeddings_by_type(analysis_type, limit=100)
-                stats['embeddings_by_type'][analysis_type] = len(embeddings)
-                stats['total_embeddings'] += len(embeddings)
-                
-                # Get recent embeddings for this type
-                if embeddings:
-                    stats['recent_embeddings'].extend(embeddings[:3])
-        
+            cached_stats = cache_manager.get_embedding_stats() if cache_manager else None
+            if cached_stats is None:
+                cached_stats = traffic_embeddings.get_stats()
+                if cached_stats is not None and cache_manager:
+                    cache_manager.cache_embedding_stats(cached_stats)
+            stats.update(cached_stats or {})
+        
+        stats['embedding_manager_status'] = 'enabled' if embedding_manager.enabled else 'disabled'
         return jsonify(stats)
     
     except Exception as e:
@@ -1246,7 +1623,7 @@ def get_similar_guidance():
             return jsonify({'error': 'No data provided'}), 400
         
         query_text = data.get('query_text', '')
-        limit = data.get('limit', 5)
+        limit = get_search_limit(data, 5)
         similarity_threshold = data.get('similarity_threshold', 0.8)
         
         if not query_text:
@@ -1276,7 +1653,10 @@ def get_similar_guidance():
         similar_responses = claude_guidance.find_similar_guidance(
             query_embedding, 
             limit=limit, 
-            similarity_threshold=similarity_threshold
+            similarity_threshold=similarity_threshold,
+            ef_search=data.get('ef_search'),
+            probes=data.get('probes'),
+            fields=get_fields()
         )
         
         return jsonify({
@@ -1287,6 +1667,11 @@ def get_similar_guidance():
             'count': len(similar_responses)
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error finding similar guidance: {e}")
         return jsonify({
@@ -1299,7 +1684,8 @@ def get_guidance_history():
     """Get recent guidance response history"""
     try:
         hours = request.args.get('hours', 24, type=int)
-        limit = request.args.get('limit', 20, type=int)
+        limit = get_page_size(20)
+        cursor = get_page_cursor()
         
         if not claude_guidance:
             return jsonify({
@@ -1307,15 +1693,22 @@ def get_guidance_history():
                 'error': 'Guidance database not available'
             }), 500
         
-        recent_guidance = claude_guidance.get_recent_guidance(hours=hours, limit=limit)
+        recent_guidance = claude_guidance.get_recent_guidance(hours=hours, limit=limit, cursor=cursor,
+                                                              fields=get_fields())
         
         return jsonify({
             'success': True,
             'guidance_history': recent_guidance,
             'hours': hours,
-            'count': len(recent_guidance)
+            'count': len(recent_guidance),
+            'next_cursor': next_cursor(recent_guidance, limit)
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error getting guidance history: {e}")
         return jsonify({
@@ -1325,6 +1718,7 @@ def get_guidance_history():
 
 def background_monitor():
     """Background task for continuous monitoring"""
+    last_partition_maintenance = 0
     while True:
         try:
             # Update network stats
@@ -1342,6 +1736,17 @@ def background_monitor():
                     if alert_time < cutoff_time:
                         alert['status'] = 'stale'
             
+            # Fold newly arrived metrics into the rollup tables
+            if metric_rollups:
+                metric_rollups.run()
+            
+            # Once an hour: pre-create partitions, drop expired ones, and build
+            # ANN indexes that are missing (IVFFlat waits for enough rows)
+            if partition_manager and time.time() - last_partition_maintenance >= 3600:
+                partition_manager.run_maintenance()
+                db_manager.build_vector_indexes()
+                last_partition_maintenance = time.time()
+            
             time.sleep(60)  # Check every minute
             
         except Exception as e:
@@ -0,0 +1,167 @@
+import json
+import logging
+import zlib
+from datetime import date, datetime
+
+# Optional accelerators; the codec falls back to json/zlib without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+def _default(value):
+    """Encode values the serializers do not handle natively"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+class CodecError(Exception):
+    pass
+
+class Codec:
+    """Serializes cache values with a one-byte header naming the format.
+
+    Header byte: 0x80 | compression << 3 | serializer. JSON text never
+    starts with a byte >= 0x80, so values written before the header existed
+    (plain json.dumps) are still read as JSON, and workers on old and new
+    settings can share keys during a rollout.
+
+    Values are compressed only when the serialized form is at least
+    compress_min_bytes long.
+    """
+
+    HEADER_FLAG = 0x80
+
+    SERIALIZERS = {'json': 1, 'orjson': 2, 'msgpack': 3}
+    COMPRESSORS = {'none': 0, 'zlib': 1, 'zstd': 2, 'lz4': 3}
+
+    def __init__(self, serializer='auto', compression='auto', compress_min_bytes=1024, zlib_level=1):
+        self.serializer = self._resolve_serializer(serializer)
+        self.compression = self._resolve_compression(compression)
+        self.compress_min_bytes = compress_min_bytes
+        self.zlib_level = zlib_level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    @staticmethod
+    def available_serializers():
+        return ['json'] + [name for name, module in (('orjson', orjson), ('msgpack', msgpack)) if module]
+
+    @staticmethod
+    def available_compressors():
+        return ['none', 'zlib'] + [name for name, module in (('zstd', zstandard), ('lz4', lz4_frame)) if module]
+
+    def _resolve_serializer(self, name):
+        available = self.available_serializers()
+        if name == 'auto':
+            return 'orjson' if 'orjson' in available else 'msgpack' if 'msgpack' in available else 'json'
+        if name not in self.SERIALIZERS:
+            raise ValueError(f"Unknown cache serializer: {name!r}")
+        if name not in available:
+            logger.warning(f"Cache serializer {name} is not installed; using json")
+            return 'json'
+        return name
+
+    def _resolve_compression(self, name):
+        available = self.available_compressors()
+        if name == 'auto':
+            return 'zstd' if 'zstd' in available else 'lz4' if 'lz4' in available else 'zlib'
+        if name not in self.COMPRESSORS:
+            raise ValueError(f"Unknown cache compression: {name!r}")
+        if name not in available:
+            logger.warning(f"Cache compression {name} is not installed; using zlib")
+            return 'zlib'
+        return name
+
+    def dumps(self, value):
+        """Serialize a value to header-prefixed bytes"""
+        payload = self._serialize(self.serializer, value)
+        compression = 'none'
+        if self.compression != 'none' and len(payload) >= self.compress_min_bytes:
+            compressed = self._compress(self.compression, payload)
+            # Incompressible data (already-random strings, tiny payloads) is stored as is
+            if len(compressed) < len(payload):
+                payload, compression = compressed, self.compression
+        header = self.HEADER_FLAG | self.COMPRESSORS[compression] << 3 | self.SERIALIZERS[self.serializer]
+        return bytes([header]) + payload
+
+    def loads(self, data):
+        """Deserialize bytes written by dumps() or legacy plain JSON"""
+        if isinstance(data, str) or not data or data[0] < self.HEADER_FLAG:
+            return json.loads(data)
+
+        header = data[0]
+        serializer = self._name(self.SERIALIZERS, header & 0x07)
+        compression = self._name(self.COMPRESSORS, (header >> 3) & 0x0F)
+        payload = data[1:]
+        if compression != 'none':
+            payload = self._decompress(compression, payload)
+        return self._deserialize(serializer, payload)
+
+    @staticmethod
+    def _name(ids, value):
+        for name, known in ids.items():
+            if known == value:
+                return name
+        raise CodecError(f"Unknown cache value header id {value}")
+
+    def _serialize(self, serializer, value):
+        if serializer == 'orjson':
+            return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        if serializer == 'msgpack':
+            return msgpack.packb(value, default=_default, use_bin_type=True)
+        return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+    def _deserialize(self, serializer, payload):
+        if serializer == 'orjson':
+            # orjson output is JSON, so the stdlib can read it if orjson is missing here
+            return orjson.loads(payload) if orjson else json.loads(payload)
+        if serializer == 'msgpack':
+            if not msgpack:
+                raise CodecError("Cached value is msgpack but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        return json.loads(payload)
+
+    def _compress(self, compression, payload):
+        if compression == 'zstd':
+            return self._zstd_compressor.compress(payload)
+        if compression == 'lz4':
+            return lz4_frame.compress(payload)
+        return zlib.compress(payload, self.zlib_level)
+
+    def _decompress(self, compression, payload):
+        if compression == 'zstd':
+            if not zstandard:
+                raise CodecError("Cached value is zstd-compressed but zstandard is not installed")
+            return self._zstd_decompressor.decompress(payload)
+        if compression == 'lz4':
+            if not lz4_frame:
+                raise CodecError("Cached value is lz4-compressed but lz4 is not installed")
+            return lz4_frame.decompress(payload)
+        return zlib.decompress(payload)
+
+    def get_stats(self):
+        return {
+            'serializer': self.serializer,
+            'compression': self.compression,
+            'compress_min_bytes': self.compress_min_bytes
+        }
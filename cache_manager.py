@@ -1,38 +1,536 @@
 import redis
 import json
 import logging
+import math
+import os
+import random
+import socket
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from cache_codec import Codec
 import threading
 import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
+class CircuitBreaker:
+    """Stops calling Redis after repeated connection failures.
+    
+    Closed: calls go through. After failure_threshold consecutive failures
+    the breaker opens and calls are refused immediately. Once reset_timeout
+    has passed it half-opens and lets a single trial call through; success
+    closes it again, failure re-opens it.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """Whether a call may be attempted now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # Let one trial call through (again, if the last trial never reported back)
+            if self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = self.clock()
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+    
+    def get_stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'trips': self.trips}
+
+class LocalCache:
+    """Size-bounded in-process LRU with a TTL per entry.
+    
+    Values are stored decoded and handed out as-is, so callers must not
+    mutate them. get() returns (found, value) so a cached None (a known miss)
+    is distinguishable from an absent entry.
+    """
+    
+    def __init__(self, max_entries=1024, ttl=5, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+    
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+class BreakerRedis(redis.Redis):
+    """Redis client that reports connection-level outcomes to a CircuitBreaker"""
+    
+    breaker = None
+    
+    def execute_command(self, *args, **options):
+        try:
+            result = super().execute_command(*args, **options)
+        except (redis.ConnectionError, redis.TimeoutError):
+            if self.breaker:
+                self.breaker.record_failure()
+            raise
+        if self.breaker:
+            self.breaker.record_success()
+        return result
+
 class CacheManager:
-    def __init__(self, redis_url):
+    # Sliding-window log: one sorted-set member per request in the window.
+    # Returns {allowed, milliseconds until the oldest request leaves the window}.
+    RATE_LIMIT_SCRIPT = """
+        local key = KEYS[1]
+        local now = tonumber(ARGV[1])
+        local window = tonumber(ARGV[2])
+        local limit = tonumber(ARGV[3])
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+        if redis.call('ZCARD', key) < limit then
+            redis.call('ZADD', key, now, ARGV[4])
+            redis.call('PEXPIRE', key, math.ceil(window * 1000))
+            return {1, 0}
+        end
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return {0, math.ceil((tonumber(oldest[2]) + window - now) * 1000)}
+    """
+    
+    # Deletes a fill lock only if it still holds our token (the lease may
+    # have expired and been taken by another caller)
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+    
+    # Key namespaces; each key is "<namespace>:v<version>:<rest>" so bumping
+    # a namespace's version invalidates all of its keys at once
+    NAMESPACES = ('network', 'events', 'session', 'threats', 'analytics', 'inference', 'embeddings')
+    VERSION_KEY = "cache:version:{}"
+    CLEAR_JOB_KEY = "cache:clear:{}"
+    # Writes and invalidations are announced here so every worker can drop
+    # its local (L1) copy of the affected keys
+    INVALIDATION_CHANNEL = "cache:invalidate"
+    STREAM_KEY = "stream:{}"
+    # Keys the clear job never deletes: namespace versions and clear jobs,
+    # event streams (with their consumer groups), fill locks and rate limits
+    PROTECTED_PREFIXES = (b"cache:", b"stream:", b"lock:", b"ratelimit:")
+    DEAD_LETTER_KEY = "stream:{}:dead"
+    
+    def __init__(self, redis_url, socket_timeout=0.5, failure_threshold=5, reset_timeout=30,
+                 version_refresh_interval=5, l1_max_entries=1024, l1_ttl=5,
+                 serializer='auto', compression='auto', compress_min_bytes=1024,
+                 stream_maxlen=10000, stream_batch_size=100, stream_block_ms=2000,
+                 stream_claim_idle_ms=60000, stream_max_deliveries=5):
         self.redis_url = redis_url
+        self.socket_timeout = socket_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.version_refresh_interval = version_refresh_interval
+        self._versions = {}
+        self._versions_fetched_at = None
+        self._versions_lock = threading.Lock()
+        self.l1 = LocalCache(l1_max_entries, l1_ttl)
+        self.codec = Codec(serializer, compression, compress_min_bytes)
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self._instance_id = uuid.uuid4().hex
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self.stream_maxlen = stream_maxlen
+        self.stream_batch_size = stream_batch_size
+        self.stream_block_ms = stream_block_ms
+        self.stream_claim_idle_ms = stream_claim_idle_ms
+        self.stream_max_deliveries = stream_max_deliveries
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        self._stream_handlers = {}
+        self._stream_lock = threading.Lock()
+        self._stream_thread_pid = None
+        self._streams_reclaimed_at = 0
+        self._stream_stats = {'delivered': 0, 'acked': 0, 'failed': 0, 'reclaimed': 0, 'dead_lettered': 0}
+        self._fill_stats = {'computed': 0, 'early_recomputes': 0, 'stale_served': 0, 'waited': 0}
+        self._fill_lock = threading.Lock()
         self.redis_client = None
         self.connect()
     
     def connect(self):
-        """Connect to Redis"""
+        """Create the Redis client; its connection pool reconnects on demand"""
         try:
-            self.redis_client = redis.from_url(self.redis_url)
+            self.redis_client = BreakerRedis.from_url(
+                self.redis_url,
+                socket_timeout=self.socket_timeout,
+                socket_connect_timeout=self.socket_timeout,
+                health_check_interval=30
+            )
+            self.redis_client.breaker = self.breaker
+            # EVALSHA with automatic EVAL fallback, so the script is sent once per server
+            self._rate_limit_script = self.redis_client.register_script(self.RATE_LIMIT_SCRIPT)
+            self._release_lock_script = self.redis_client.register_script(self.RELEASE_LOCK_SCRIPT)
             self.redis_client.ping()
             logger.info("Redis connection established")
         except Exception as e:
             logger.error(f"Redis connection failed: {e}")
-            self.redis_client = None
     
     def is_connected(self):
-        """Check if Redis is connected"""
-        if not self.redis_client:
+        """Whether Redis calls should be attempted (no round trip; see CircuitBreaker)"""
+        return self.redis_client is not None and self.breaker.allow()
+    
+    # Namespaces
+    def _key(self, namespace, rest):
+        """Versioned cache key for a namespace"""
+        return f"{namespace}:v{self._namespace_version(namespace)}:{rest}"
+    
+    def _namespace_version(self, namespace):
+        """Current namespace version, re-read (all namespaces in one MGET) every few seconds.
+        
+        Another worker's invalidation is therefore seen within
+        version_refresh_interval seconds.
+        """
+        now = time.monotonic()
+        with self._versions_lock:
+            fresh = self._versions_fetched_at is not None and now - self._versions_fetched_at < self.version_refresh_interval
+            if fresh:
+                return self._versions.get(namespace, 0)
+        
+        try:
+            values = self.redis_client.mget([self.VERSION_KEY.format(ns) for ns in self.NAMESPACES])
+            versions = {ns: int(value or 0) for ns, value in zip(self.NAMESPACES, values)}
+        except Exception as e:
+            logger.error(f"Error reading cache namespace versions: {e}")
+            versions = None
+        
+        with self._versions_lock:
+            if versions is not None:
+                self._versions = versions
+            self._versions_fetched_at = now
+            return self._versions.get(namespace, 0)
+    
+    def invalidate_namespace(self, namespace):
+        """Invalidate every key in a namespace in O(1) by bumping its version.
+        
+        Orphaned keys are never read again and expire through their TTLs.
+        Returns the new version, or None on failure.
+        """
+        if namespace not in self.NAMESPACES:
+            raise ValueError(f"Unknown cache namespace: {namespace!r}")
+        if not self.is_connected():
+            return None
+        
+        try:
+            version = self.redis_client.incr(self.VERSION_KEY.format(namespace))
+            with self._versions_lock:
+                self._versions[namespace] = version
+            self._publish_invalidation({'namespace': namespace, 'version': version})
+            return version
+        except Exception as e:
+            logger.error(f"Error invalidating cache namespace {namespace}: {e}")
+            return None
+    
+    # Two-tier access: in-process L1 in front of Redis (L2)
+    def _get_value(self, key, default=None):
+        """Read a value through L1, falling back to Redis and filling L1.
+        
+        Misses are cached in L1 too, so repeated lookups of absent keys (the
+        common case for threat checks) stay local. Callers check
+        is_connected() first.
+        """
+        found, value = self.l1.get(key)
+        if found:
+            return default if value is None else value
+        
+        self._ensure_invalidation_listener()
+        data = self.redis_client.get(key)
+        value = self.codec.loads(data) if data else None
+        if value is None:
+            self.l2_misses += 1
+        else:
+            self.l2_hits += 1
+        self.l1.set(key, value)
+        return default if value is None else value
+    
+    def _set_value(self, key, value, ttl):
+        """Write a value to Redis and L1, telling other workers to drop their copy"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.setex(key, ttl, self.codec.dumps(value))
+        pipe.publish(self.INVALIDATION_CHANNEL, json.dumps({'origin': self._instance_id, 'keys': [key]}))
+        self._execute_pipeline(pipe)
+        self.l1.set(key, value, ttl)
+    
+    def _publish_invalidation(self, message):
+        try:
+            message['origin'] = self._instance_id
+            self.redis_client.publish(self.INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.error(f"Error publishing cache invalidation: {e}")
+    
+    def _ensure_invalidation_listener(self):
+        """Start the invalidation listener once per process (gunicorn forks workers)"""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            thread = threading.Thread(target=self._listen_for_invalidations, daemon=True)
+            thread.start()
+    
+    def _listen_for_invalidations(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.INVALIDATION_CHANNEL)
+                # Invalidations published while we were not subscribed are lost
+                self.l1.clear()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        self._apply_invalidation(message['data'])
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+                self.l1.clear()
+                time.sleep(1)
+    
+    def _apply_invalidation(self, data):
+        """Drop L1 entries named by an invalidation message from another worker"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if message.get('origin') == self._instance_id:
+            return
+        
+        for key in message.get('keys', []):
+            self.l1.delete(key)
+        if 'namespace' in message:
+            # Keys of the old version are no longer looked up; they age out of L1
+            with self._versions_lock:
+                current = self._versions.get(message['namespace'], 0)
+                self._versions[message['namespace']] = max(current, message['version'])
+        if message.get('all'):
+            self.l1.clear()
+    
+    # Stampede-protected fills
+    def get_or_compute(self, key, fn, ttl, beta=1.0, lock_timeout=10, stale_ttl=None):
+        """Return the cached value for key ("<namespace>:<rest>"), computing it with fn() on a miss.
+        
+        Only one caller at a time recomputes a key: it takes a Redis lock
+        with a lock_timeout-second lease while the others keep serving the
+        previous value, which is kept for stale_ttl (default: ttl) seconds
+        past its expiry. Callers with no value at all wait up to
+        lock_timeout for the fill before computing it themselves.
+        
+        Values are also refreshed before they expire with probabilistic
+        early expiration (XFetch): a reader recomputes early with a
+        probability that grows as expiry nears and with how long the last
+        computation took, scaled by beta. That spreads refreshes out instead
+        of having every worker miss at the same instant.
+        """
+        namespace, _, rest = key.partition(':')
+        if namespace not in self.NAMESPACES:
+            raise ValueError(f"Unknown cache namespace: {namespace!r}")
+        if not self.is_connected():
+            return fn()
+        
+        try:
+            full_key = self._key(namespace, rest)
+            envelope = self._as_envelope(self._get_value(full_key))
+        except Exception as e:
+            logger.error(f"Error reading {key} for fill: {e}")
+            return fn()
+        
+        if envelope is not None and not self._should_recompute(envelope, beta):
+            return envelope['value']
+        
+        lock_key = f"lock:{full_key}"
+        token = uuid.uuid4().hex
+        if not self._acquire_fill_lock(lock_key, token, lock_timeout):
+            if envelope is not None:
+                self._count_fill('stale_served')
+                return envelope['value']
+            envelope = self._wait_for_fill(full_key, lock_timeout)
+            if envelope is not None:
+                self._count_fill('waited')
+                return envelope['value']
+            return fn()
+        
+        try:
+            if envelope is not None and time.time() < envelope['expiry']:
+                self._count_fill('early_recomputes')
+            started = time.monotonic()
+            try:
+                value = fn()
+            except Exception:
+                if envelope is None:
+                    raise
+                logger.exception(f"Error recomputing {key}; serving the stale value")
+                return envelope['value']
+            self._count_fill('computed')
+            try:
+                self._set_value(full_key, self._envelope(value, time.monotonic() - started, ttl),
+                                ttl + (ttl if stale_ttl is None else stale_ttl))
+            except Exception as e:
+                logger.error(f"Error caching {key}: {e}")
+            return value
+        finally:
+            self._release_fill_lock(lock_key, token)
+    
+    @staticmethod
+    def _envelope(value, delta, ttl):
+        return {'value': value, 'delta': delta, 'expiry': time.time() + ttl}
+    
+    @staticmethod
+    def _as_envelope(cached):
+        """Cached fill envelope, or None for a miss or a value in the pre-envelope format"""
+        if isinstance(cached, dict) and {'value', 'delta', 'expiry'} <= cached.keys():
+            return cached
+        return None
+    
+    @staticmethod
+    def _should_recompute(envelope, beta):
+        # XFetch: -log(u) for u in (0, 1] is exponentially distributed
+        gap = -envelope['delta'] * beta * math.log(1.0 - random.random())
+        return time.time() + gap >= envelope['expiry']
+    
+    def _acquire_fill_lock(self, lock_key, token, lock_timeout):
+        try:
+            return bool(self.redis_client.set(lock_key, token, nx=True, px=int(lock_timeout * 1000)))
+        except Exception as e:
+            # Without Redis there is nothing to coordinate on; compute locally
+            logger.error(f"Error acquiring fill lock {lock_key}: {e}")
+            return True
+    
+    def _release_fill_lock(self, lock_key, token):
+        try:
+            self._release_lock_script(keys=[lock_key], args=[token])
+        except Exception as e:
+            logger.error(f"Error releasing fill lock {lock_key}: {e}")
+    
+    def _wait_for_fill(self, full_key, lock_timeout, poll_interval=0.05):
+        """Poll Redis (not L1, which may hold the miss) until another caller's fill lands"""
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll_interval)
+            try:
+                data = self.redis_client.get(full_key)
+            except Exception as e:
+                logger.error(f"Error waiting for fill of {full_key}: {e}")
+                return None
+            envelope = self._as_envelope(self.codec.loads(data) if data else None)
+            if envelope is not None:
+                self.l1.set(full_key, envelope)
+                return envelope
+        return None
+    
+    def _count_fill(self, name):
+        with self._fill_lock:
+            self._fill_stats[name] += 1
+    
+    # Batched access
+    def get_many(self, keys):
+        """Get several values in one MGET round trip, as a dict of key -> value (None if missing)"""
+        if not keys or not self.is_connected():
+            return {key: None for key in keys}
+        
+        try:
+            values = self.redis_client.mget(keys)
+            return {key: self.codec.loads(value) if value else None for key, value in zip(keys, values)}
+        except Exception as e:
+            logger.error(f"Error getting cache keys: {e}")
+            return {key: None for key in keys}
+    
+    def set_many(self, mapping, ttl=300):
+        """Set several values with a TTL in one pipelined round trip"""
+        if not mapping or not self.is_connected():
             return False
+        
         try:
-            self.redis_client.ping()
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.setex(key, ttl, self.codec.dumps(value))
+            self._execute_pipeline(pipe)
             return True
-        except:
+        except Exception as e:
+            logger.error(f"Error setting cache keys: {e}")
             return False
     
+    def _execute_pipeline(self, pipe):
+        """Execute a pipeline, reporting the outcome to the circuit breaker"""
+        try:
+            results = pipe.execute()
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return results
+    
     # Real-time Network Data
     def cache_network_stats(self, stats_data, ttl=300):
         """Cache network statistics"""
@@ -40,8 +538,7 @@ class CacheManager:
             return False
         
         try:
-            key = "network:stats:current"
-            self.redis_client.setex(key, ttl, json.dumps(stats_data))
+            self._set_value(self._key('network', 'stats:current'), stats_data, ttl)
             return True
         except Exception as e:
             logger.error(f"Error caching network stats: {e}")
@@ -53,9 +550,7 @@ class CacheManager:
             return None
         
         try:
-            key = "network:stats:current"
-            data = self.redis_client.get(key)
-            return json.loads(data) if data else None
+            return self._get_value(self._key('network', 'stats:current'))
         except Exception as e:
             logger.error(f"Error getting network stats: {e}")
             return None
@@ -66,8 +561,8 @@ class CacheManager:
             return False
         
         try:
-            key = "events:realtime"
-            self.redis_client.setex(key, ttl, json.dumps(events_data))
+            key = self._key('events', 'realtime')
+            self.redis_client.setex(key, ttl, self.codec.dumps(events_data))
             return True
         except Exception as e:
             logger.error(f"Error caching real-time events: {e}")
@@ -79,9 +574,9 @@ class CacheManager:
             return []
         
         try:
-            key = "events:realtime"
+            key = self._key('events', 'realtime')
             data = self.redis_client.get(key)
-            return json.loads(data) if data else []
+            return self.codec.loads(data) if data else []
         except Exception as e:
             logger.error(f"Error getting real-time events: {e}")
             return []
@@ -93,8 +588,8 @@ class CacheManager:
             return False
         
         try:
-            key = f"session:{session_id}"
-            self.redis_client.setex(key, ttl, json.dumps(session_data))
+            key = self._key('session', session_id)
+            self.redis_client.setex(key, ttl, self.codec.dumps(session_data))
             return True
         except Exception as e:
             logger.error(f"Error caching user session: {e}")
@@ -106,9 +601,9 @@ class CacheManager:
             return None
         
         try:
-            key = f"session:{session_id}"
+            key = self._key('session', session_id)
             data = self.redis_client.get(key)
-            return json.loads(data) if data else None
+            return self.codec.loads(data) if data else None
         except Exception as e:
             logger.error(f"Error getting user session: {e}")
             return None
@@ -119,7 +614,7 @@ class CacheManager:
             return False
         
         try:
-            key = f"session:{session_id}"
+            key = self._key('session', session_id)
             self.redis_client.delete(key)
             return True
         except Exception as e:
@@ -133,8 +628,8 @@ class CacheManager:
             return False
         
         try:
-            key = "threats:indicators"
-            self.redis_client.setex(key, ttl, json.dumps(indicators))
+            # Same envelope as get_or_compute('threats:indicators', ...)
+            self._set_value(self._key('threats', 'indicators'), self._envelope(indicators, 0, ttl), ttl * 2)
             return True
         except Exception as e:
             logger.error(f"Error caching threat indicators: {e}")
@@ -146,9 +641,11 @@ class CacheManager:
             return []
         
         try:
-            key = "threats:indicators"
-            data = self.redis_client.get(key)
-            return json.loads(data) if data else []
+            cached = self._get_value(self._key('threats', 'indicators'))
+            envelope = self._as_envelope(cached)
+            if envelope is not None:
+                return envelope['value']
+            return cached or []
         except Exception as e:
             logger.error(f"Error getting threat indicators: {e}")
             return []
@@ -159,11 +656,7 @@ class CacheManager:
             return None
         
         try:
-            key = f"threat:check:{indicator_value}"
-            result = self.redis_client.get(key)
-            if result:
-                return json.loads(result)
-            return None
+            return self._get_value(self._key('threats', f"check:{indicator_value}"))
         except Exception as e:
             logger.error(f"Error checking threat indicator: {e}")
             return None
@@ -174,8 +667,7 @@ class CacheManager:
             return False
         
         try:
-            key = f"threat:check:{indicator_value}"
-            self.redis_client.setex(key, ttl, json.dumps(result))
+            self._set_value(self._key('threats', f"check:{indicator_value}"), result, ttl)
             return True
         except Exception as e:
             logger.error(f"Error caching threat check: {e}")
@@ -188,8 +680,7 @@ class CacheManager:
             return False
         
         try:
-            key = f"analytics:{metric_name}"
-            self.redis_client.setex(key, ttl, json.dumps(data))
+            self._set_value(self._key('analytics', metric_name), data, ttl)
             return True
         except Exception as e:
             logger.error(f"Error caching analytics: {e}")
@@ -201,26 +692,75 @@ class CacheManager:
             return None
         
         try:
-            key = f"analytics:{metric_name}"
-            data = self.redis_client.get(key)
-            return json.loads(data) if data else None
+            return self._get_value(self._key('analytics', metric_name))
         except Exception as e:
             logger.error(f"Error getting analytics: {e}")
             return None
     
+    # Embedding Stats Cache
+    def cache_embedding_stats(self, stats, ttl=300):
+        """Cache aggregate embedding statistics"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            key = self._key('embeddings', 'stats')
+            self.redis_client.setex(key, ttl, self.codec.dumps(stats))
+            return True
+        except Exception as e:
+            logger.error(f"Error caching embedding stats: {e}")
+            return False
+    
+    def get_embedding_stats(self):
+        """Get cached embedding statistics"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            key = self._key('embeddings', 'stats')
+            data = self.redis_client.get(key)
+            return self.codec.loads(data) if data else None
+        except Exception as e:
+            logger.error(f"Error getting embedding stats: {e}")
+            return None
+    
+    def invalidate_embedding_stats(self):
+        """Drop cached embedding statistics after a new embedding is stored"""
+        if not self.is_connected():
+            return False
+        
+        try:
+            self.redis_client.delete(self._key('embeddings', 'stats'))
+            return True
+        except Exception as e:
+            logger.error(f"Error invalidating embedding stats: {e}")
+            return False
+    
     # AI Inference Cache
-    def cache_inference_result(self, inference_type, result, ttl=1800):
-        """Cache AI inference result"""
+    def cache_inference_result(self, inference_type, result, ttl=1800, max_history=1000):
+        """Cache AI inference result.
+        
+        History is a sorted set per type scored by time, trimmed to the last
+        ttl seconds and at most max_history entries in the same pipeline.
+        """
         if not self.is_connected():
             return False
         
         try:
-            key = f"inference:{inference_type}:{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            self.redis_client.setex(key, ttl, json.dumps(result))
+            now = time.time()
+            history_key = self._key('inference', f"history:{inference_type}")
+            # The id keeps identical results from collapsing into one member
+            entry = self.codec.dumps({'id': uuid.uuid4().hex, 'result': result})
+            
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.zadd(history_key, {entry: now})
+            pipe.zremrangebyscore(history_key, '-inf', now - ttl)
+            pipe.zremrangebyrank(history_key, 0, -max_history - 1)
+            pipe.expire(history_key, ttl)
             
             # Also cache latest result for quick access
-            latest_key = f"inference:latest:{inference_type}"
-            self.redis_client.setex(latest_key, ttl, json.dumps(result))
+            pipe.setex(self._key('inference', f"latest:{inference_type}"), ttl, self.codec.dumps(result))
+            self._execute_pipeline(pipe)
             return True
         except Exception as e:
             logger.error(f"Error caching inference result: {e}")
@@ -232,124 +772,334 @@ class CacheManager:
             return None
         
         try:
-            key = f"inference:latest:{inference_type}"
+            key = self._key('inference', f"latest:{inference_type}")
             data = self.redis_client.get(key)
-            return json.loads(data) if data else None
+            return self.codec.loads(data) if data else None
         except Exception as e:
             logger.error(f"Error getting latest inference result: {e}")
             return None
     
-    def get_inference_history(self, inference_type, limit=10):
-        """Get inference history for a type"""
+    def get_inference_history(self, inference_type, limit=10, ttl=1800):
+        """Get inference history for a type, most recent first (one O(log n + limit) read)"""
         if not self.is_connected():
             return []
         
         try:
-            pattern = f"inference:{inference_type}:*"
-            keys = self.redis_client.keys(pattern)
-            keys.sort(reverse=True)  # Most recent first
-            
-            results = []
-            for key in keys[:limit]:
-                data = self.redis_client.get(key)
-                if data:
-                    results.append(json.loads(data))
-            
-            return results
+            entries = self.redis_client.zrevrangebyscore(
+                self._key('inference', f"history:{inference_type}"), '+inf', time.time() - ttl, start=0, num=limit
+            )
+            return [self.codec.loads(entry)['result'] for entry in entries]
         except Exception as e:
             logger.error(f"Error getting inference history: {e}")
             return []
     
     # Rate Limiting
     def check_rate_limit(self, key, limit, window):
-        """Check rate limit for a key"""
+        """Sliding-window rate limit check for a key, in one atomic round trip.
+        
+        Returns (allowed, retry_after_seconds). Fails open (allowed) when
+        Redis is unavailable.
+        """
         if not self.is_connected():
-            return True  # Allow if Redis is down
+            return True, 0  # Allow if Redis is down
         
         try:
-            current = self.redis_client.get(key)
-            if current is None:
-                self.redis_client.setex(key, window, 1)
-                return True
-            elif int(current) < limit:
-                self.redis_client.incr(key)
-                return True
-            else:
-                return False
+            allowed, retry_after_ms = self._rate_limit_script(
+                keys=[f"ratelimit:{key}"],
+                args=[time.time(), window, limit, uuid.uuid4().hex]
+            )
+            return bool(allowed), retry_after_ms / 1000.0
         except Exception as e:
             logger.error(f"Error checking rate limit: {e}")
-            return True  # Allow if error
+            return True, 0  # Allow if error
     
-    # Pub/Sub for Real-time Updates
-    def publish_event(self, channel, event_data):
-        """Publish event to Redis channel"""
+    # Event Streams
+    def publish_event(self, channel, event_data, maxlen=None):
+        """Append an event to the channel's stream; returns its stream id, or None.
+        
+        The stream is trimmed (approximately, which is O(1) amortized) to
+        the newest maxlen entries, so events survive while no consumer is
+        connected as long as consumers catch up before they are trimmed.
+        """
         if not self.is_connected():
-            return False
+            return None
         
         try:
-            self.redis_client.publish(channel, json.dumps(event_data))
-            return True
+            return self.redis_client.xadd(
+                self.STREAM_KEY.format(channel),
+                {'data': json.dumps(event_data, default=str)},
+                maxlen=maxlen or self.stream_maxlen,
+                approximate=True
+            )
         except Exception as e:
             logger.error(f"Error publishing event: {e}")
-            return False
+            return None
     
-    def subscribe_to_events(self, channel, callback):
-        """Subscribe to Redis channel for events"""
+    def subscribe_to_events(self, channel, callback, group='default', start_id='$'):
+        """Consume a channel's stream in a consumer group, calling callback(event) per event.
+        
+        Every group receives every event; within a group, events are spread
+        across the consumers (one per worker process). An event is acked
+        only after callback returns; events left unacked by a crashed or
+        failing consumer are reclaimed after stream_claim_idle_ms and
+        dead-lettered to stream:{channel}:dead after stream_max_deliveries.
+        All subscriptions in a process share one listener thread.
+        """
         if not self.is_connected():
             return False
         
+        stream = self.STREAM_KEY.format(channel)
         try:
-            pubsub = self.redis_client.pubsub()
-            pubsub.subscribe(channel)
-            
-            def listener():
-                for message in pubsub.listen():
-                    if message['type'] == 'message':
-                        try:
-                            data = json.loads(message['data'])
-                            callback(data)
-                        except Exception as e:
-                            logger.error(f"Error processing message: {e}")
-            
-            thread = threading.Thread(target=listener, daemon=True)
-            thread.start()
-            return True
+            self.redis_client.xgroup_create(stream, group, id=start_id, mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                logger.error(f"Error subscribing to events: {e}")
+                return False
         except Exception as e:
             logger.error(f"Error subscribing to events: {e}")
             return False
+        
+        with self._stream_lock:
+            self._stream_handlers.setdefault(group, {})[stream] = callback
+        self._ensure_stream_listener()
+        return True
+    
+    def _ensure_stream_listener(self):
+        """Start the stream listener once per process (gunicorn forks workers)"""
+        pid = os.getpid()
+        if self._stream_thread_pid == pid:
+            return
+        with self._stream_lock:
+            if self._stream_thread_pid == pid:
+                return
+            self._stream_thread_pid = pid
+            self.consumer_name = f"{socket.gethostname()}-{pid}"
+            thread = threading.Thread(target=self._listen_for_events, name='event-streams', daemon=True)
+            thread.start()
+    
+    def _listen_for_events(self):
+        # Blocking reads outlast the request-path socket timeout, so the
+        # listener gets its own connection
+        client = redis.Redis.from_url(
+            self.redis_url,
+            socket_timeout=self.stream_block_ms / 1000.0 + 5,
+            socket_connect_timeout=self.socket_timeout
+        )
+        while True:
+            try:
+                self._poll_streams(client)
+            except Exception as e:
+                logger.error(f"Event stream listener error: {e}")
+                time.sleep(1)
+    
+    def _poll_streams(self, client):
+        """One listener pass: a batched XREADGROUP per group, plus pending reclaim when due"""
+        with self._stream_lock:
+            groups = {group: dict(handlers) for group, handlers in self._stream_handlers.items()}
+        if not groups:
+            time.sleep(self.stream_block_ms / 1000.0)
+            return
+        
+        if time.monotonic() - self._streams_reclaimed_at >= self.stream_claim_idle_ms / 1000.0:
+            self._streams_reclaimed_at = time.monotonic()
+            for group, handlers in groups.items():
+                for stream, callback in handlers.items():
+                    self._reclaim_pending(client, group, stream, callback)
+        
+        # Groups are read one after another, so split the blocking time between them
+        block_ms = max(1, self.stream_block_ms // len(groups))
+        for group, handlers in groups.items():
+            try:
+                response = client.xreadgroup(group, self.consumer_name, {stream: '>' for stream in handlers},
+                                             count=self.stream_batch_size, block=block_ms)
+            except redis.ResponseError as e:
+                if 'NOGROUP' not in str(e):
+                    raise
+                self._recreate_groups(client, group, handlers)
+                continue
+            for stream, messages in response or []:
+                stream = stream.decode() if isinstance(stream, bytes) else stream
+                self._handle_messages(client, group, stream, handlers[stream], messages)
+    
+    def _recreate_groups(self, client, group, handlers):
+        """Recreate a consumer group whose stream was deleted from under it"""
+        for stream in handlers:
+            try:
+                # From the start: whatever was appended since the deletion is unread
+                client.xgroup_create(stream, group, id='0', mkstream=True)
+                logger.warning(f"Recreated consumer group {group} on {stream}")
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+    
+    def _handle_messages(self, client, group, stream, callback, messages):
+        acked = []
+        for message_id, fields in messages:
+            self._count_stream('delivered')
+            if fields is None:
+                # Trimmed from the stream while pending
+                acked.append(message_id)
+                continue
+            try:
+                callback(json.loads(fields[b'data']))
+                acked.append(message_id)
+            except Exception as e:
+                self._count_stream('failed')
+                logger.error(f"Error processing event {message_id} from {stream}: {e}")
+        if acked:
+            client.xack(stream, group, *acked)
+            self._count_stream('acked', len(acked))
+    
+    def _reclaim_pending(self, client, group, stream, callback):
+        """Dead-letter events delivered too often, then claim and retry the rest of the idle ones"""
+        pending = client.xpending_range(stream, group, min='-', max='+', count=self.stream_batch_size,
+                                        idle=self.stream_claim_idle_ms)
+        dead = [entry['message_id'] for entry in pending if entry['times_delivered'] >= self.stream_max_deliveries]
+        if dead:
+            channel = stream.split(':', 1)[1]
+            for message_id in dead:
+                for _, fields in client.xrange(stream, message_id, message_id):
+                    client.xadd(self.DEAD_LETTER_KEY.format(channel), fields, maxlen=self.stream_maxlen, approximate=True)
+            client.xack(stream, group, *dead)
+            self._count_stream('dead_lettered', len(dead))
+            logger.error(f"Dead-lettered {len(dead)} events from {stream} after {self.stream_max_deliveries} deliveries")
+        
+        claimed = client.xautoclaim(stream, group, self.consumer_name, self.stream_claim_idle_ms,
+                                    start_id='0-0', count=self.stream_batch_size)
+        messages = claimed[1] if claimed else []
+        if messages:
+            self._count_stream('reclaimed', len(messages))
+            self._handle_messages(client, group, stream, callback, messages)
+    
+    def _count_stream(self, name, amount=1):
+        with self._stream_lock:
+            self._stream_stats[name] += amount
     
     # Cache Management
-    def clear_cache(self, pattern="*"):
-        """Clear cache by pattern"""
+    def clear_cache(self, pattern="*", batch_size=500):
+        """Start a background job deleting keys that match pattern; returns its job id.
+        
+        The job walks the keyspace with SCAN and removes keys with UNLINK in
+        batches of batch_size, so Redis is never blocked for long. Progress
+        is kept in a Redis hash readable from any worker (get_clear_status).
+        Infrastructure keys (PROTECTED_PREFIXES) are never deleted.
+        """
         if not self.is_connected():
-            return False
+            return None
         
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
-            return True
+            job_id = uuid.uuid4().hex
+            self._update_clear_job(job_id, {
+                'status': 'running',
+                'pattern': pattern,
+                'scanned': 0,
+                'deleted': 0,
+                'started_at': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Error starting cache clear: {e}")
+            return None
+        
+        thread = threading.Thread(target=self._run_clear_job, args=(job_id, pattern, batch_size), daemon=True)
+        thread.start()
+        return job_id
+    
+    def get_clear_status(self, job_id):
+        """Get progress of a clear_cache job"""
+        if not self.is_connected():
+            return None
+        
+        try:
+            status = self.redis_client.hgetall(self.CLEAR_JOB_KEY.format(job_id))
+            if not status:
+                return None
+            status = {key.decode(): value.decode() for key, value in status.items()}
+            for field in ('scanned', 'deleted'):
+                status[field] = int(status.get(field, 0))
+            return status
+        except Exception as e:
+            logger.error(f"Error getting cache clear status: {e}")
+            return None
+    
+    def _run_clear_job(self, job_id, pattern, batch_size):
+        scanned = deleted = 0
+        try:
+            batch = []
+            for key in self.redis_client.scan_iter(match=pattern, count=batch_size):
+                scanned += 1
+                if not key.startswith(self.PROTECTED_PREFIXES):
+                    batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += self.redis_client.unlink(*batch)
+                    batch = []
+                    self._update_clear_job(job_id, {'scanned': scanned, 'deleted': deleted})
+            if batch:
+                deleted += self.redis_client.unlink(*batch)
+            self.l1.clear()
+            self._publish_invalidation({'all': True})
+            
+            self._update_clear_job(job_id, {
+                'status': 'completed',
+                'scanned': scanned,
+                'deleted': deleted,
+                'finished_at': datetime.now().isoformat()
+            })
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
-            return False
+            try:
+                self._update_clear_job(job_id, {'status': 'failed', 'scanned': scanned,
+                                                'deleted': deleted, 'error': str(e)})
+            except Exception:
+                pass
+    
+    def _update_clear_job(self, job_id, fields, ttl=3600):
+        key = self.CLEAR_JOB_KEY.format(job_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, ttl)
+        self._execute_pipeline(pipe)
     
     def get_cache_stats(self):
-        """Get cache statistics"""
+        """Get cache statistics, with L1 (in-process) and L2 (Redis) hit rates reported separately"""
+        l2_lookups = self.l2_hits + self.l2_misses
+        local_stats = {
+            'l1': self.l1.get_stats(),
+            'l2': {
+                'hits': self.l2_hits,
+                'misses': self.l2_misses,
+                'hit_rate': round(self.l2_hits / l2_lookups, 4) if l2_lookups else 0.0
+            },
+            'event_streams': self._get_stream_stats(),
+            'fills': self._get_fill_stats()
+        }
         if not self.is_connected():
-            return {}
+            return {'circuit_breaker': self.breaker.get_stats(), **local_stats}
         
         try:
             info = self.redis_client.info()
             return {
+                **local_stats,
                 'connected_clients': info.get('connected_clients', 0),
                 'used_memory_human': info.get('used_memory_human', '0B'),
                 'total_commands_processed': info.get('total_commands_processed', 0),
                 'keyspace_hits': info.get('keyspace_hits', 0),
-                'keyspace_misses': info.get('keyspace_misses', 0)
+                'keyspace_misses': info.get('keyspace_misses', 0),
+                'circuit_breaker': self.breaker.get_stats(),
+                'codec': self.codec.get_stats()
             }
         except Exception as e:
             logger.error(f"Error getting cache stats: {e}")
-            return {}
+            return {'circuit_breaker': self.breaker.get_stats(), **local_stats}
+    
+    def _get_fill_stats(self):
+        with self._fill_lock:
+            return dict(self._fill_stats)
+    
+    def _get_stream_stats(self):
+        with self._stream_lock:
+            stats = dict(self._stream_stats)
+            stats['subscriptions'] = sum(len(handlers) for handlers in self._stream_handlers.values())
+        return stats
     
     # Health Check
     def health_check(self):
@@ -357,7 +1107,8 @@ class CacheManager:
         if not self.is_connected():
             return {
                 'status': 'unhealthy',
-                'error': 'Redis not connected'
+                'error': 'Redis not connected',
+                'circuit_breaker': self.breaker.state
             }
         
         try:
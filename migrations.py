@@ -0,0 +1,566 @@
+"""Versioned schema migrations.
+
+Run once per release, from the Heroku release phase:
+
+    python migrations.py
+
+Vector indexes alone can be (re)built at any time with:
+
+    python migrations.py vector-indexes
+
+Applied versions are recorded in schema_version, so web workers only need
+to compare it with LATEST_VERSION when they boot. Never edit a migration
+that has shipped; append a new one instead.
+"""
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock ids share one key space across session and transaction
+# locks; every lock the app takes is listed here so they cannot collide.
+# Serializes concurrent migration runs (e.g. overlapping releases)
+ADVISORY_LOCK_ID = 7210000
+# PartitionManager maintenance
+PARTITION_LOCK_ID = 7210001
+# MetricRollups refresh
+ROLLUP_LOCK_ID = 7210002
+# DatabaseManager.build_vector_indexes
+VECTOR_INDEX_LOCK_ID = 7210003
+
+# Tables range-partitioned by day on timestamp
+PARTITIONED_TABLES = ('security_events', 'network_analytics')
+
+def _relkind(cur, table):
+    """pg_class.relkind of a table ('r' plain, 'p' partitioned), or None if it does not exist"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def is_partitioned(cur, table):
+    return _relkind(cur, table) == 'p'
+
+def index_valid(cur, name):
+    """True for a usable index, False for one left invalid by a failed build, None if missing"""
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def drop_index(cur, name, partitioned):
+    # Partitioned indexes cannot be dropped concurrently
+    statement = "DROP INDEX IF EXISTS {}" if partitioned else "DROP INDEX CONCURRENTLY IF EXISTS {}"
+    cur.execute(sql.SQL(statement).format(sql.Identifier(name)))
+
+def create_index_concurrently(cur, table, name, method, partitioned):
+    """CREATE INDEX CONCURRENTLY; partitioned tables get it per partition.
+    
+    Must run in autocommit mode. A partitioned table cannot be indexed
+    concurrently, so its index is created ON ONLY the parent (invalid at
+    first), each partition is indexed concurrently and attached, which makes
+    the parent valid. Partitions created later inherit the index.
+    """
+    if not partitioned:
+        cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}").format(
+            sql.Identifier(name), sql.Identifier(table), method))
+        return
+    
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON ONLY {} {}").format(
+        sql.Identifier(name), sql.Identifier(table), method))
+    cur.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s)", (table,))
+    for (partition,) in cur.fetchall():
+        # e.g. idx_security_events_embedding -> security_events_p20240101_embedding
+        partition_index = name.replace(f"idx_{table}", partition, 1)
+        if index_valid(cur, partition_index) is False:
+            drop_index(cur, partition_index, partitioned=False)
+        cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}").format(
+            sql.Identifier(partition_index), sql.Identifier(partition), method))
+        cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+            sql.Identifier(name), sql.Identifier(partition_index)))
+
+def _rename_legacy_table(cur, table):
+    """Move a pre-partitioning table (and its primary key name) out of the way"""
+    legacy = f"{table}_legacy"
+    if _relkind(cur, legacy) is not None:
+        raise RuntimeError(f"Cannot partition {table}: {legacy} already exists from an earlier attempt")
+    
+    logger.info(f"Converting {table} to a partitioned table; writes are blocked until the migration commits")
+    cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cur.execute("""
+        SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'
+    """, (legacy,))
+    row = cur.fetchone()
+    if row:
+        cur.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT "{row[0]}" TO {legacy}_pkey')
+    return legacy
+
+def _copy_legacy_rows(cur, table, legacy):
+    """Copy rows from a renamed plain table into its partitioned replacement, then drop it.
+    
+    Daily partitions are created from today up to the newest row first, so
+    current and future rows never sit in the default partition (which would
+    stop PartitionManager from creating those days later).
+    """
+    cur.execute(f"SELECT MAX(timestamp)::date FROM {legacy}")
+    newest = cur.fetchone()[0]
+    day = date.today()
+    last_day = max(newest or day, day + timedelta(days=3))
+    while day <= last_day:
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{day.strftime('%Y%m%d')} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+            (day, day + timedelta(days=1))
+        )
+        day += timedelta(days=1)
+    
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (legacy,))
+    legacy_columns = {row[0] for row in cur.fetchall()}
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    columns = [row[0] for row in cur.fetchall() if row[0] in legacy_columns]
+    # timestamp is part of the partition key and must not be NULL
+    select = ['COALESCE(timestamp, CURRENT_TIMESTAMP)' if column == 'timestamp' else column for column in columns]
+    cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(select)} FROM {legacy}")
+    logger.info(f"Copied {cur.rowcount} rows from {legacy} into {table}")
+    
+    # The new SERIAL sequence starts at 1; continue after the copied ids
+    cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}")
+    cur.execute(f"DROP TABLE {legacy}")
+
+def _baseline_schema(cur):
+    """Tables and indexes as of the first versioned release.
+    
+    Databases created before partitioning have plain security_events and
+    network_analytics tables. Those are converted in place: renamed, the
+    partitioned table created, rows copied across and the old table
+    dropped. This holds an ACCESS EXCLUSIVE lock on them for the duration
+    of the copy, so expect writes to those tables to wait during the
+    release.
+    """
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    
+    legacy_tables = {}
+    for table in PARTITIONED_TABLES:
+        kind = _relkind(cur, table)
+        if kind == 'r':
+            legacy_tables[table] = _rename_legacy_table(cur, table)
+        elif kind not in (None, 'p'):
+            raise RuntimeError(f"Cannot partition {table}: unexpected relation kind {kind!r}")
+    
+    # Security Events Table with vector support, range-partitioned by day
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS security_events (
+            id SERIAL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            event_type VARCHAR(100) NOT NULL,
+            severity VARCHAR(20) NOT NULL,
+            source_ip INET,
+            destination_ip INET,
+            source_port INTEGER,
+            destination_port INTEGER,
+            protocol VARCHAR(10),
+            payload_size INTEGER,
+            user_agent TEXT,
+            country_code VARCHAR(3),
+            city VARCHAR(100),
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            risk_score INTEGER DEFAULT 0,
+            threat_indicators JSONB,
+            metadata JSONB,
+            status VARCHAR(20) DEFAULT 'active',
+            embedding vector(1024),
+            text_description TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    
+    # Network Analytics Table with vector support, range-partitioned by day
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS network_analytics (
+            id SERIAL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            metric_name VARCHAR(100) NOT NULL,
+            metric_value DECIMAL(15, 2) NOT NULL,
+            metric_unit VARCHAR(20),
+            source VARCHAR(100),
+            tags JSONB,
+            period VARCHAR(20) DEFAULT 'realtime',
+            embedding vector(1024),
+            text_description TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    
+    # Minute/hour/day aggregates of network_analytics, filled by MetricRollups
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS network_analytics_rollups (
+            id BIGSERIAL PRIMARY KEY,
+            period VARCHAR(20) NOT NULL,
+            bucket_start TIMESTAMP NOT NULL,
+            metric_name VARCHAR(100) NOT NULL,
+            source VARCHAR(100) NOT NULL DEFAULT '',
+            sample_count BIGINT NOT NULL,
+            value_sum DECIMAL(20, 2) NOT NULL,
+            value_min DECIMAL(15, 2) NOT NULL,
+            value_max DECIMAL(15, 2) NOT NULL,
+            UNIQUE (period, metric_name, source, bucket_start)
+        )
+    """)
+    
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name VARCHAR(100) PRIMARY KEY,
+            watermark TIMESTAMP NOT NULL
+        )
+    """)
+    
+    # Catch-all partitions for rows outside the pre-created daily range
+    cur.execute("CREATE TABLE IF NOT EXISTS security_events_default PARTITION OF security_events DEFAULT")
+    cur.execute("CREATE TABLE IF NOT EXISTS network_analytics_default PARTITION OF network_analytics DEFAULT")
+    
+    for table, legacy in legacy_tables.items():
+        _copy_legacy_rows(cur, table, legacy)
+    
+    # New Traffic Analysis Embeddings Table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS traffic_embeddings (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            analysis_type VARCHAR(100) NOT NULL,
+            source_data JSONB NOT NULL,
+            text_description TEXT NOT NULL,
+            embedding vector(1024) NOT NULL,
+            risk_score INTEGER DEFAULT 0,
+            similarity_threshold DECIMAL(5, 4) DEFAULT 0.8,
+            metadata JSONB,
+            status VARCHAR(20) DEFAULT 'active'
+        )
+    """)
+    
+    # New Claude Guidance Responses Table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS claude_guidance_responses (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            request_id VARCHAR(255) UNIQUE NOT NULL,
+            source_ip VARCHAR(45),
+            risk_score INTEGER DEFAULT 0,
+            threats_detected JSONB,
+            recommendations JSONB,
+            claude_response TEXT NOT NULL,
+            embedding vector(1024) NOT NULL,
+            model_used VARCHAR(100) DEFAULT 'claude-3-5-sonnet-20241022',
+            response_tokens INTEGER,
+            processing_time_ms INTEGER,
+            metadata JSONB,
+            status VARCHAR(20) DEFAULT 'active'
+        )
+    """)
+    
+    # Threat Intelligence Table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS threat_intelligence (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            indicator_type VARCHAR(50) NOT NULL,
+            indicator_value TEXT NOT NULL,
+            confidence_level VARCHAR(20) DEFAULT 'medium',
+            threat_category VARCHAR(100),
+            description TEXT,
+            source VARCHAR(100),
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            active BOOLEAN DEFAULT TRUE,
+            metadata JSONB
+        )
+    """)
+    
+    # User Sessions Table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(255) UNIQUE NOT NULL,
+            user_id VARCHAR(100),
+            ip_address INET,
+            user_agent TEXT,
+            login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            logout_time TIMESTAMP,
+            session_duration INTEGER,
+            status VARCHAR(20) DEFAULT 'active',
+            location_data JSONB,
+            risk_factors JSONB
+        )
+    """)
+    
+    # Network Topology Table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS network_topology (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            node_id VARCHAR(100) NOT NULL,
+            node_type VARCHAR(50) NOT NULL,
+            node_name VARCHAR(255),
+            ip_address INET,
+            mac_address VARCHAR(17),
+            status VARCHAR(20) DEFAULT 'active',
+            connections JSONB,
+            metadata JSONB
+        )
+    """)
+    
+    # Create indexes for better performance
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_timestamp ON security_events(timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_source_ip ON security_events(source_ip)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_severity ON security_events(severity)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_threat_intelligence_value ON threat_intelligence(indicator_value)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_threat_intelligence_active ON threat_intelligence(active)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_network_analytics_timestamp ON network_analytics(timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_session_id ON user_sessions(session_id)")
+    
+    # Composite indexes backing keyset pagination on (timestamp, id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_timestamp_id ON security_events(timestamp DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_network_analytics_period_timestamp_id ON network_analytics(period, timestamp DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_network_analytics_name_period_timestamp_id ON network_analytics(metric_name, period, timestamp DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_claude_guidance_status_timestamp_id ON claude_guidance_responses(status, timestamp DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rollups_period_bucket_id ON network_analytics_rollups(period, bucket_start DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rollups_name_period_bucket_id ON network_analytics_rollups(metric_name, period, bucket_start DESC, id DESC)")
+
+def _network_analytics_source_ip(cur):
+    """Index per-IP traffic analysis history.
+    
+    An expression index on tags->>'source_ip' rather than a stored generated
+    column, which would rewrite every partition under ACCESS EXCLUSIVE. The
+    index is built concurrently partition by partition outside the
+    migration transaction, so metric reads and writes continue meanwhile.
+    """
+    conn = cur.connection
+    conn.commit()
+    conn.autocommit = True
+    try:
+        # Covers the filters and sort order of NetworkAnalytics.get_metric_history,
+        # and lets its COUNT(*) run as an index-only scan
+        create_index_concurrently(
+            cur, 'network_analytics', 'idx_network_analytics_name_period_source_ip_timestamp_id',
+            sql.SQL("(metric_name, period, (tags->>'source_ip'), timestamp DESC, id DESC)"),
+            is_partitioned(cur, 'network_analytics')
+        )
+    finally:
+        conn.autocommit = False
+
+# Rows converted per transaction by the halfvec backfill
+HALFVEC_BATCH_SIZE = 10000
+
+def _column_type(cur, table, column):
+    """(format_type, attnotnull) of a column, or None if it does not exist"""
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod), attnotnull FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = %s AND NOT attisdropped
+    """, (table, column))
+    return cur.fetchone()
+
+def _halfvec_embeddings(cur):
+    """Store embeddings as halfvec(1024), halving their on-disk and cached size.
+    
+    ALTER COLUMN ... TYPE would rewrite each table under ACCESS EXCLUSIVE,
+    blocking reads and writes for the whole copy. Instead each table gets an
+    embedding_half column kept in sync by a trigger, which is backfilled in
+    committed batches of HALFVEC_BATCH_SIZE rows while the table stays
+    online; only the final drop-and-rename takes a brief exclusive lock.
+    A run interrupted during the backfill resumes where it stopped. The old
+    column's space is reclaimed as rows are updated or by VACUUM FULL/pg_repack.
+    """
+    tables = {
+        'security_events': 'idx_security_events_embedding',
+        'network_analytics': 'idx_network_analytics_embedding',
+        'traffic_embeddings': 'idx_traffic_embeddings_embedding',
+        'claude_guidance_responses': 'idx_claude_guidance_embedding'
+    }
+    conn = cur.connection
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION sync_embedding_half() RETURNS trigger AS $$
+        BEGIN
+            NEW.embedding_half := NEW.embedding::halfvec(1024);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table, index_name in tables.items():
+        column_type, not_null = _column_type(cur, table, 'embedding')
+        if column_type.startswith('halfvec'):
+            continue
+        
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS embedding_half halfvec(1024)")
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}_sync_embedding_half ON {table}")
+        cur.execute(f"""
+            CREATE TRIGGER {table}_sync_embedding_half BEFORE INSERT OR UPDATE OF embedding ON {table}
+            FOR EACH ROW EXECUTE FUNCTION sync_embedding_half()
+        """)
+        conn.commit()
+        
+        # Rows written from here on are converted by the trigger
+        cur.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        low, high = cur.fetchone()
+        converted = 0
+        while low is not None and low <= high:
+            cur.execute(f"""
+                UPDATE {table} SET embedding_half = embedding::halfvec(1024)
+                WHERE id >= %s AND id < %s AND embedding IS NOT NULL AND embedding_half IS NULL
+            """, (low, low + HALFVEC_BATCH_SIZE))
+            converted += cur.rowcount
+            conn.commit()
+            low += HALFVEC_BATCH_SIZE
+        logger.info(f"Backfilled {converted} halfvec embeddings in {table}")
+        
+        if not_null:
+            # A validated CHECK lets SET NOT NULL skip its full-table scan
+            # under the exclusive lock; validating only blocks DDL
+            cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_embedding_half_not_null")
+            cur.execute(f"""
+                ALTER TABLE {table} ADD CONSTRAINT {table}_embedding_half_not_null
+                CHECK (embedding_half IS NOT NULL) NOT VALID
+            """)
+            conn.commit()
+            cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_embedding_half_not_null")
+            conn.commit()
+        
+        # vector_cosine_ops indexes go with the old column; the release
+        # phase rebuilds them concurrently for the configured VECTOR_STORAGE
+        cur.execute(f"DROP INDEX IF EXISTS {index_name}")
+        cur.execute(f"DROP INDEX IF EXISTS {index_name}_hnsw")
+        cur.execute(f"DROP TRIGGER {table}_sync_embedding_half ON {table}")
+        cur.execute(f"ALTER TABLE {table} DROP COLUMN embedding")
+        cur.execute(f"ALTER TABLE {table} RENAME COLUMN embedding_half TO embedding")
+        if not_null:
+            cur.execute(f"ALTER TABLE {table} ALTER COLUMN embedding SET NOT NULL")
+            cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_embedding_half_not_null")
+        conn.commit()
+    cur.execute("DROP FUNCTION IF EXISTS sync_embedding_half()")
+
+def _traffic_embeddings_type_timestamp(cur):
+    """Index embeddings by type and recency for listings and stats"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_traffic_embeddings_type_timestamp_id
+        ON traffic_embeddings (analysis_type, timestamp DESC, id DESC)
+    """)
+
+# (version, description, apply(cursor)), in order
+MIGRATIONS = [
+    (1, 'Baseline schema', _baseline_schema),
+    (2, 'Source IP index on network_analytics', _network_analytics_source_ip),
+    (3, 'Half-precision embedding columns', _halfvec_embeddings),
+    (4, 'Type and recency index on traffic_embeddings', _traffic_embeddings_type_timestamp),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(cur):
+    """Highest applied migration version, or 0 when none have been applied"""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+def run_migrations(db_manager):
+    """Apply pending migrations, each in its own transaction.
+    
+    Long data migrations may commit in batches and must then be safe to
+    re-run after a partial failure.
+    
+    Returns the list of versions applied. Raises on failure so a release
+    with a broken migration is aborted instead of half-deployed.
+    """
+    applied = []
+    with db_manager.connection() as conn:
+        if not conn:
+            raise RuntimeError("Database not available")
+        
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+        
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                conn.commit()
+                current = get_schema_version(cur)
+            
+            for version, description, apply in MIGRATIONS:
+                if version <= current:
+                    continue
+                
+                logger.info(f"Applying migration {version}: {description}")
+                try:
+                    with conn.cursor() as cur:
+                        apply(cur)
+                        cur.execute("""
+                            INSERT INTO schema_version (version, description) VALUES (%s, %s)
+                        """, (version, description))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+            conn.commit()
+    
+    return applied
+
+def main(argv=None):
+    """Release-phase entry point: migrate, then pre-create partitions and ANN indexes.
+    
+    `python migrations.py vector-indexes` only builds missing ANN indexes
+    (concurrently), e.g. after a table has grown past IVFFLAT_MIN_ROWS.
+    """
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:] if argv is None else argv
+    indexes_only = argv[:1] == ['vector-indexes']
+    
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        logger.error("DATABASE_URL is not set")
+        return 1
+    
+    from models import DatabaseManager, PartitionManager
+    
+    db_manager = DatabaseManager(
+        database_url,
+        check_schema=False,
+        vector_index=os.environ.get('VECTOR_INDEX_TYPE', 'ivfflat'),
+        vector_storage=os.environ.get('VECTOR_STORAGE', 'halfvec')
+    )
+    try:
+        if not indexes_only:
+            applied = run_migrations(db_manager)
+            logger.info(f"Schema at version {LATEST_VERSION} (applied: {applied or 'none'})")
+            
+            PartitionManager(db_manager, days_ahead=int(os.environ.get('PARTITION_DAYS_AHEAD', 3))).ensure_partitions()
+        db_manager.build_vector_indexes()
+        return 0
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return 1
+    finally:
+        db_manager.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
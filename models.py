@@ -1,712 +1,2128 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+from psycopg2.pool import PoolError
+from psycopg2 import sql
+from migrations import (LATEST_VERSION, PARTITION_LOCK_ID, ROLLUP_LOCK_ID, VECTOR_INDEX_LOCK_ID,
+                        create_index_concurrently, drop_index, get_schema_version, index_valid,
+                        is_partitioned, run_migrations)
+import base64
+import csv
+import io
 import json
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import logging
+import queue
+import re
+import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
-class DatabaseManager:
-    def __init__(self, database_url):
-        self.database_url = database_url
-        self.init_database()
+class PreparedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements it has prepared"""
     
-    def get_connection(self):
-        """Get database connection"""
-        try:
-            conn = psycopg2.connect(self.database_url)
-            return conn
-        except Exception as e:
-            logger.error(f"Database connection failed: {e}")
-            return None
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class PreparedStatements:
+    """Server-side prepared statements for the hot model queries.
     
-    def init_database(self):
-        """Initialize database tables"""
-        conn = self.get_connection()
-        if not conn:
+    Each statement name maps to one fixed SQL text, written with the usual
+    %s or %(name)s placeholders. It is PREPAREd once per pooled connection
+    and then run with EXECUTE, so Postgres skips parsing and, after a few
+    runs, planning. Names must come from a fixed set (one per query shape),
+    never from request data.
+    """
+    
+    PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s')
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._statements = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def execute(self, cur, name, query, params=()):
+        """Run query on cur as prepared statement `name` (plain execute when name is None)"""
+        if name is None:
+            cur.execute(query, params)
             return
         
-        try:
-            with conn.cursor() as cur:
-                # Security Events Table with vector support
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS security_events (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        event_type VARCHAR(100) NOT NULL,
-                        severity VARCHAR(20) NOT NULL,
-                        source_ip INET,
-                        destination_ip INET,
-                        source_port INTEGER,
-                        destination_port INTEGER,
-                        protocol VARCHAR(10),
-                        payload_size INTEGER,
-                        user_agent TEXT,
-                        country_code VARCHAR(3),
-                        city VARCHAR(100),
-                        latitude DECIMAL(10, 8),
-                        longitude DECIMAL(11, 8),
-                        risk_score INTEGER DEFAULT 0,
-                        threat_indicators JSONB,
-                        metadata JSONB,
-                        status VARCHAR(20) DEFAULT 'active',
-                        embedding vector(1024),
-                        text_description TEXT
-                    )
-                """)
-                
-                # Network Analytics Table with vector support
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS network_analytics (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        metric_name VARCHAR(100) NOT NULL,
-                        metric_value DECIMAL(15, 2) NOT NULL,
-                        metric_unit VARCHAR(20),
-                        source VARCHAR(100),
-                        tags JSONB,
-                        period VARCHAR(20) DEFAULT 'realtime',
-                        embedding vector(1024),
-                        text_description TEXT
-                    )
-                """)
-                
-                # New Traffic Analysis Embeddings Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS traffic_embeddings (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        analysis_type VARCHAR(100) NOT NULL,
-                        source_data JSONB NOT NULL,
-                        text_description TEXT NOT NULL,
-                        embedding vector(1024) NOT NULL,
-                        risk_score INTEGER DEFAULT 0,
-                        similarity_threshold DECIMAL(5, 4) DEFAULT 0.8,
-                        metadata JSONB,
-                        status VARCHAR(20) DEFAULT 'active'
-                    )
-                """)
-                
-                # New Claude Guidance Responses Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS claude_guidance_responses (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        request_id VARCHAR(255) UNIQUE NOT NULL,
-                        source_ip VARCHAR(45),
-                        risk_score INTEGER DEFAULT 0,
-                        threats_detected JSONB,
-                        recommendations JSONB,
-                        claude_response TEXT NOT NULL,
-                        embedding vector(1024) NOT NULL,
-                        model_used VARCHAR(100) DEFAULT 'claude-3-5-sonnet-20241022',
-                        response_tokens INTEGER,
-                        processing_time_ms INTEGER,
-                        metadata JSONB,
-                        status VARCHAR(20) DEFAULT 'active'
-                    )
-                """)
-                
-                # Threat Intelligence Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS threat_intelligence (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        indicator_type VARCHAR(50) NOT NULL,
-                        indicator_value TEXT NOT NULL,
-                        confidence_level VARCHAR(20) DEFAULT 'medium',
-                        threat_category VARCHAR(100),
-                        description TEXT,
-                        source VARCHAR(100),
-                        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        active BOOLEAN DEFAULT TRUE,
-                        metadata JSONB
-                    )
-                """)
+        prepared = getattr(cur.connection, 'prepared', None)
+        start = time.perf_counter()
+        if not self.enabled or prepared is None:
+            cur.execute(query, params)
+        else:
+            statement, order = self._compile(name, query)
+            if name not in prepared:
+                cur.execute(f"PREPARE {name} AS {statement}")
+                prepared.add(name)
+                self._record(name, 'prepares')
+            
+            values = [params[key] for key in order] if isinstance(params, dict) else list(params)
+            if values:
+                cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))})", values)
+            else:
+                cur.execute(f"EXECUTE {name}")
+        self._record(name, 'calls', (time.perf_counter() - start) * 1000)
+    
+    def get_stats(self):
+        """Per-statement call counts and execution times in milliseconds"""
+        with self._lock:
+            return {
+                name: dict(stats, mean_ms=round(stats['total_ms'] / stats['calls'], 3) if stats['calls'] else 0.0,
+                           total_ms=round(stats['total_ms'], 3), max_ms=round(stats['max_ms'], 3))
+                for name, stats in self._stats.items()
+            }
+    
+    def _compile(self, name, query):
+        """Rewrite placeholders as $1..$n, remembering the named parameter order"""
+        with self._lock:
+            if name not in self._statements:
+                order = []
                 
-                # User Sessions Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS user_sessions (
-                        id SERIAL PRIMARY KEY,
-                        session_id VARCHAR(255) UNIQUE NOT NULL,
-                        user_id VARCHAR(100),
-                        ip_address INET,
-                        user_agent TEXT,
-                        login_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        logout_time TIMESTAMP,
-                        session_duration INTEGER,
-                        status VARCHAR(20) DEFAULT 'active',
-                        location_data JSONB,
-                        risk_factors JSONB
-                    )
-                """)
+                def number(match):
+                    key = match.group(1)
+                    if key is None:
+                        order.append(len(order))
+                        return f"${len(order)}"
+                    if key not in order:
+                        order.append(key)
+                    return f"${order.index(key) + 1}"
                 
-                # Network Topology Table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS network_topology (
-                        id SERIAL PRIMARY KEY,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        node_id VARCHAR(100) NOT NULL,
-                        node_type VARCHAR(50) NOT NULL,
-                        node_name VARCHAR(255),
-                        ip_address INET,
-                        mac_address VARCHAR(17),
-                        status VARCHAR(20) DEFAULT 'active',
-                        connections JSONB,
-                        metadata JSONB
-                    )
-                """)
+                self._statements[name] = (self.PLACEHOLDER.sub(number, query), order)
+            return self._statements[name]
+    
+    def _record(self, name, counter, elapsed_ms=None):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'prepares': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats[counter] += 1
+            if elapsed_ms is not None:
+                stats['total_ms'] += elapsed_ms
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections"""
+    
+    def __init__(self, dsn, min_size=1, max_size=10, max_idle=300,
+                 health_check_interval=30, checkout_timeout=10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        
+        self._idle = []  # (connection, returned_at) pairs, most recently used last
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'connections_opened': 0,
+            'connections_recycled': 0,
+            'failed_health_checks': 0,
+            'checkout_timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0
+        }
+    
+    def getconn(self):
+        """Check out a healthy connection, waiting up to checkout_timeout"""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        
+        while True:
+            conn, idle_for = self._reserve(deadline)
+            
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(self.dsn, connection_factory=PreparedConnection)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['connections_opened'] += 1
+            elif not self._is_healthy(conn, idle_for):
+                self._discard(conn)
+                continue
+            
+            waited_ms = (time.monotonic() - started) * 1000
+            with self._cond:
+                self._stats['checkouts'] += 1
+                self._stats['total_wait_ms'] += waited_ms
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited_ms)
+            return conn
+    
+    def putconn(self, conn):
+        """Return a connection to the pool, resetting any open transaction"""
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding connection that failed to reset: {e}")
+                self._discard(conn)
+                return
+        
+        if conn.closed or self._closed:
+            self._discard(conn)
+            return
+        
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            expired = self._expire_idle()
+            self._cond.notify()
+        
+        for stale in expired:
+            self._close_quietly(stale)
+    
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        
+        for conn in idle:
+            self._close_quietly(conn)
+    
+    def get_stats(self):
+        """Get pool size and wait-time metrics"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size
+            })
+        checkouts = stats['checkouts']
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / checkouts, 3) if checkouts else 0.0
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
+    
+    def _reserve(self, deadline):
+        """Pop an idle connection, or reserve a slot for a new one (returns None)"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
                 
-                # Create indexes for better performance
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_timestamp ON security_events(timestamp)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_source_ip ON security_events(source_ip)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_severity ON security_events(severity)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_threat_intelligence_value ON threat_intelligence(indicator_value)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_threat_intelligence_active ON threat_intelligence(active)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_network_analytics_timestamp ON network_analytics(timestamp)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_session_id ON user_sessions(session_id)")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    return conn, time.monotonic() - returned_at
                 
-                # Create vector indexes for similarity search
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_security_events_embedding ON security_events USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_network_analytics_embedding ON network_analytics USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_traffic_embeddings_embedding ON traffic_embeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_claude_guidance_embedding ON claude_guidance_responses USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)")
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, 0
                 
-            conn.commit()
-            logger.info("Database tables initialized successfully with vector support")
-            
-        except Exception as e:
-            logger.error(f"Database initialization failed: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-
-class SecurityEvent:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['checkout_timeouts'] += 1
+                    raise PoolError(f"timed out waiting for a connection ({self.max_size} in use)")
+                self._cond.wait(remaining)
     
-    def create_event(self, event_data):
-        """Create a new security event"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return None
+    def _expire_idle(self):
+        """Remove connections idle longer than max_idle, keeping min_size open"""
+        now = time.monotonic()
+        expired = []
+        # Oldest returns sit at the front of the list
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._stats['connections_recycled'] += 1
+            expired.append(conn)
+        return expired
+    
+    def _is_healthy(self, conn, idle_for):
+        """Check a connection before handing it out"""
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
         
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO security_events (
-                        event_type, severity, source_ip, destination_ip, 
-                        source_port, destination_port, protocol, payload_size,
-                        user_agent, country_code, city, latitude, longitude,
-                        risk_score, threat_indicators, metadata, embedding, text_description
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    ) RETURNING *
-                """, (
-                    event_data.get('event_type'),
-                    event_data.get('severity', 'medium'),
-                    event_data.get('source_ip'),
-                    event_data.get('destination_ip'),
-                    event_data.get('source_port'),
-                    event_data.get('destination_port'),
-                    event_data.get('protocol'),
-                    event_data.get('payload_size'),
-                    event_data.get('user_agent'),
-                    event_data.get('country_code'),
-                    event_data.get('city'),
-                    event_data.get('latitude'),
-                    event_data.get('longitude'),
-                    event_data.get('risk_score', 0),
-                    json.dumps(event_data.get('threat_indicators', [])),
-                    json.dumps(event_data.get('metadata', {})),
-                    event_data.get('embedding'),
-                    event_data.get('text_description')
-                ))
-                
-                result = cur.fetchone()
-                conn.commit()
-                return dict(result) if result else None
-                
-        except Exception as e:
-            logger.error(f"Error creating security event: {e}")
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
             conn.rollback()
-            return None
-        finally:
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {e}")
+            with self._cond:
+                self._stats['failed_health_checks'] += 1
+            return False
+    
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    @staticmethod
+    def _close_quietly(conn):
+        try:
             conn.close()
+        except Exception:
+            pass
+
+class SavepointConnection:
+    """Connection handed to model code inside a unit of work.
     
-    def get_events(self, limit=100, offset=0, filters=None):
-        """Get security events with optional filtering"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    commit() and rollback() act on a savepoint, so one failed model call
+    is undone without aborting the rest of the request; the enclosing
+    transaction is committed once by DatabaseManager.end_unit_of_work.
+    Everything else is delegated to the real connection.
+    """
+    
+    def __init__(self, conn, name):
+        self._conn = conn
+        self._name = name
+        self._open = False
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def begin(self):
+        self._execute("SAVEPOINT")
+        self._open = True
+    
+    def commit(self):
+        if self._open:
+            self._execute("RELEASE SAVEPOINT")
+            self._open = False
+    
+    def rollback(self):
+        if self._open:
+            self._execute("ROLLBACK TO SAVEPOINT")
+            self._execute("RELEASE SAVEPOINT")
+            self._open = False
+    
+    def close_savepoint(self):
+        """Release a savepoint the model left open (read-only use), undoing it if it failed"""
+        if self._conn.info.transaction_status == TRANSACTION_STATUS_INERROR:
+            self.rollback()
+        else:
+            self.commit()
+    
+    def _execute(self, statement):
+        with self._conn.cursor() as cur:
+            cur.execute(f"{statement} {self._name}")
+
+class DatabaseManager:
+    # Embedding table -> ANN index name
+    VECTOR_INDEXES = {
+        'security_events': 'idx_security_events_embedding',
+        'network_analytics': 'idx_network_analytics_embedding',
+        'traffic_embeddings': 'idx_traffic_embeddings_embedding',
+        'claude_guidance_responses': 'idx_claude_guidance_embedding'
+    }
+    IVFFLAT_MIN_ROWS = 1000
+    # Serializes ANN index builds across workers and the release phase
+    VECTOR_INDEX_LOCK_ID = VECTOR_INDEX_LOCK_ID
+    IVFFLAT_MAX_LISTS = 1000
+    # Largest hnsw.ef_search pgvector accepts
+    HNSW_MAX_EF_SEARCH = 1000
+    EMBEDDING_DIMENSIONS = 1024
+    # Storage mode -> (indexed expression, operator class, distance operator,
+    # index name suffix). Embedding columns are halfvec(1024); 'binary'
+    # indexes their 1-bit quantization and re-ranks candidates exactly.
+    VECTOR_STORAGE = {
+        'halfvec': ('embedding', 'halfvec_cosine_ops', '<=>', ''),
+        'binary': ('(binary_quantize(embedding)::bit(1024))', 'bit_hamming_ops', '<~>', '_bit')
+    }
+    
+    def __init__(self, database_url, min_connections=1, max_connections=10,
+                 max_idle=300, health_check_interval=30, checkout_timeout=10,
+                 vector_index='ivfflat', hnsw_ef_search=40, ivfflat_probes=10,
+                 vector_storage='halfvec', rerank_factor=4,
+                 replica_url=None, max_replica_lag=30, replica_check_interval=5,
+                 prepare_statements=True, check_schema=True, auto_migrate=False):
+        if vector_storage not in self.VECTOR_STORAGE:
+            raise ValueError(f"Unknown vector storage mode: {vector_storage!r}")
+        
+        self.database_url = database_url
+        self.schema_version = None
+        self.vector_index = vector_index
+        self.vector_storage = vector_storage
+        self.rerank_factor = rerank_factor
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivfflat_probes = ivfflat_probes
+        self.statements = PreparedStatements(enabled=prepare_statements)
+        self.pool = ConnectionPool(
+            database_url,
+            min_size=min_connections,
+            max_size=max_connections,
+            max_idle=max_idle,
+            health_check_interval=health_check_interval,
+            checkout_timeout=checkout_timeout
+        )
+        
+        # Optional read replica (e.g. a Heroku follower) for readonly connections
+        self.replica_pool = ConnectionPool(
+            replica_url,
+            min_size=0,
+            max_size=max_connections,
+            max_idle=max_idle,
+            health_check_interval=health_check_interval,
+            checkout_timeout=checkout_timeout
+        ) if replica_url else None
+        self.max_replica_lag = max_replica_lag
+        self.replica_check_interval = replica_check_interval
+        self._replica_lock = threading.Lock()
+        self._replica_checked_at = None
+        self._replica_lag = None
+        self._replica_ok = False
+        self._local = threading.local()
+        
+        if auto_migrate:
+            self.init_database()
+        elif check_schema:
+            self.check_schema_version()
+    
+    @contextmanager
+    def connection(self, readonly=False):
+        """Check out a pooled connection for the duration of a with-block.
+        
+        readonly connections come from the replica when one is configured
+        and its lag is within max_replica_lag, and from the primary
+        otherwise. Yields None when no connection can be obtained so callers
+        can keep their existing "database unavailable" fallbacks.
+        
+        Inside a unit of work (see begin_unit_of_work) write connections
+        share the unit's connection and transaction instead.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None and not readonly:
+            with self._unit_connection(unit) as conn:
+                yield conn
+            return
         
+        pool = self.replica_pool if readonly and self._replica_usable() else self.pool
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = "SELECT * FROM security_events WHERE 1=1"
-                params = []
-                
-                if filters:
-                    if filters.get('severity'):
-                        query += " AND severity = %s"
-                        params.append(filters['severity'])
-                    
-                    if filters.get('source_ip'):
-                        query += " AND source_ip = %s"
-                        params.append(filters['source_ip'])
-                    
-                    if filters.get('event_type'):
-                        query += " AND event_type = %s"
-                        params.append(filters['event_type'])
-                    
-                    if filters.get('status'):
-                        query += " AND status = %s"
-                        params.append(filters['status'])
-                
-                query += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
-                params.extend([limit, offset])
-                
-                cur.execute(query, params)
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
+            conn = pool.getconn()
         except Exception as e:
-            logger.error(f"Error getting security events: {e}")
-            return []
+            if pool is self.pool:
+                logger.error(f"Database connection failed: {e}")
+                yield None
+                return
+            
+            logger.warning(f"Replica connection failed, reading from primary: {e}")
+            pool = self.pool
+            try:
+                conn = pool.getconn()
+            except Exception as e:
+                logger.error(f"Database connection failed: {e}")
+                yield None
+                return
+        
+        try:
+            yield conn
         finally:
-            conn.close()
-
-class NetworkAnalytics:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
+            pool.putconn(conn)
     
-    def record_metric(self, metric_data):
-        """Record a network metric"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return None
+    def begin_unit_of_work(self):
+        """Start a unit of work on the current thread.
+        
+        Until end_unit_of_work, write connections (readonly=False) share one
+        lazily checked-out primary connection and a single transaction, with
+        a savepoint around each model call.
+        """
+        self._local.unit = {'conn': None, 'savepoints': 0, 'after_commit': []}
+    
+    def after_commit(self, callback):
+        """Run callback() once the current unit of work has committed.
+        
+        For side effects that must not be visible before the data is (cache
+        invalidation, in-memory indexes). Callbacks are dropped if the unit
+        rolls back or its commit fails. Outside a unit of work writes commit
+        immediately, so callback runs right away.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is None:
+            self._run_after_commit([callback])
+        else:
+            unit['after_commit'].append(callback)
+    
+    def end_unit_of_work(self, commit=True):
+        """Commit (or roll back) the current unit of work; returns False if the commit failed"""
+        unit = getattr(self._local, 'unit', None)
+        self._local.unit = None
+        if not unit:
+            return True
+        if unit['conn'] is None:
+            if commit:
+                self._run_after_commit(unit['after_commit'])
+            return True
         
+        conn = unit['conn']
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO network_analytics (
-                        metric_name, metric_value, metric_unit, source, tags, period, embedding, text_description
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING *
-                """, (
-                    metric_data.get('metric_name'),
-                    metric_data.get('metric_value'),
-                    metric_data.get('metric_unit'),
-                    metric_data.get('source'),
-                    json.dumps(metric_data.get('tags', {})),
-                    metric_data.get('period', 'realtime'),
-                    metric_data.get('embedding'),
-                    metric_data.get('text_description')
-                ))
-                
-                result = cur.fetchone()
+            if commit:
                 conn.commit()
-                return dict(result) if result else None
-                
+            else:
+                conn.rollback()
         except Exception as e:
-            logger.error(f"Error recording metric: {e}")
-            conn.rollback()
-            return None
+            logger.error(f"Unit of work commit failed: {e}")
+            return False
         finally:
-            conn.close()
+            self.pool.putconn(conn)
+        
+        if commit:
+            self._run_after_commit(unit['after_commit'])
+        return True
     
-    def get_metrics(self, metric_name=None, period='realtime', limit=100):
-        """Get network metrics"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    @staticmethod
+    def _run_after_commit(callbacks):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {e}")
+    
+    @contextmanager
+    def _unit_connection(self, unit):
+        """Savepoint-scoped view of the unit of work's connection"""
+        if unit['conn'] is None:
+            try:
+                unit['conn'] = self.pool.getconn()
+            except Exception as e:
+                logger.error(f"Database connection failed: {e}")
+                yield None
+                return
         
+        unit['savepoints'] += 1
+        conn = SavepointConnection(unit['conn'], f"unit_of_work_{unit['savepoints']}")
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = "SELECT * FROM network_analytics WHERE 1=1"
-                params = []
-                
-                if metric_name:
-                    query += " AND metric_name = %s"
-                    params.append(metric_name)
-                
-                if period:
-                    query += " AND period = %s"
-                    params.append(period)
-                
-                query += " ORDER BY timestamp DESC LIMIT %s"
-                params.append(limit)
-                
-                cur.execute(query, params)
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
+            conn.begin()
         except Exception as e:
-            logger.error(f"Error getting metrics: {e}")
-            return []
+            logger.error(f"Could not open savepoint: {e}")
+            yield None
+            return
+        
+        try:
+            yield conn
         finally:
-            conn.close()
-
-class ThreatIntelligence:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
+            conn.close_savepoint()
     
-    def add_indicator(self, indicator_data):
-        """Add a new threat indicator"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return None
+    def _replica_usable(self):
+        """Whether readonly work may go to the replica (lag re-checked every few seconds)"""
+        if not self.replica_pool:
+            return False
         
+        now = time.monotonic()
+        with self._replica_lock:
+            if self._replica_checked_at is not None and now - self._replica_checked_at < self.replica_check_interval:
+                return self._replica_ok
+            self._replica_checked_at = now
+        
+        lag = self._measure_replica_lag()
+        usable = lag is not None and lag <= self.max_replica_lag
+        if self._replica_ok and not usable:
+            logger.warning(f"Replica lag {lag}s exceeds {self.max_replica_lag}s; reading from primary")
+        self._replica_lag = lag
+        self._replica_ok = usable
+        return usable
+    
+    def _measure_replica_lag(self):
+        """Seconds the replica is behind the primary, or None if it is unhealthy or cannot be measured.
+        
+        A replica without a streaming WAL receiver is unhealthy: replay can
+        have caught up with everything received while falling further behind
+        the primary. Otherwise a replica that has replayed past the primary's
+        current WAL position has no lag (an idle primary leaves the last
+        replay timestamp old without any real lag), and anything else is
+        measured by the age of the last replayed transaction.
+        """
+        primary_lsn = self._primary_wal_lsn()
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO threat_intelligence (
-                        indicator_type, indicator_value, confidence_level,
-                        threat_category, description, source, metadata
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING *
-                """, (
-                    indicator_data.get('indicator_type'),
-                    indicator_data.get('indicator_value'),
-                    indicator_data.get('confidence_level', 'medium'),
-                    indicator_data.get('threat_category'),
-                    indicator_data.get('description'),
-                    indicator_data.get('source'),
-                    json.dumps(indicator_data.get('metadata', {}))
-                ))
-                
-                result = cur.fetchone()
-                conn.commit()
-                return dict(result) if result else None
-                
+            conn = self.replica_pool.getconn()
         except Exception as e:
-            logger.error(f"Error adding threat indicator: {e}")
-            conn.rollback()
-            return None
-        finally:
-            conn.close()
-    
-    def check_indicator(self, indicator_value, indicator_type=None):
-        """Check if an indicator exists in threat intelligence"""
-        conn = self.db_manager.get_connection()
-        if not conn:
+            logger.warning(f"Replica unavailable: {e}")
             return None
         
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = "SELECT * FROM threat_intelligence WHERE indicator_value = %s AND active = TRUE"
-                params = [indicator_value]
-                
-                if indicator_type:
-                    query += " AND indicator_type = %s"
-                    params.append(indicator_type)
-                
-                cur.execute(query, params)
-                result = cur.fetchone()
-                return dict(result) if result else None
-                
+            with conn.cursor() as cur:
+                # status is NULL (but the row present) without pg_read_all_stats
+                cur.execute("""
+                    SELECT
+                        EXISTS (SELECT 1 FROM pg_stat_wal_receiver),
+                        (SELECT status FROM pg_stat_wal_receiver),
+                        pg_last_wal_replay_lsn() >= %s::pg_lsn,
+                        EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+                """, (primary_lsn,))
+                has_receiver, status, caught_up, replay_age = cur.fetchone()
+            conn.rollback()
         except Exception as e:
-            logger.error(f"Error checking indicator: {e}")
+            logger.warning(f"Replica lag check failed: {e}")
             return None
         finally:
-            conn.close()
-
-class UserSession:
-    def __init__(self, db_manager):
-        self.db_manager = db_manager
+            self.replica_pool.putconn(conn)
+        
+        if not has_receiver or (status is not None and status != 'streaming'):
+            logger.warning(f"Replica WAL receiver is not streaming (status: {status}); reading from primary")
+            return None
+        if caught_up:
+            return 0.0
+        return float(replay_age) if replay_age is not None else None
     
-    def create_session(self, session_data):
-        """Create a new user session"""
-        conn = self.db_manager.get_connection()
-        if not conn:
+    def _primary_wal_lsn(self):
+        """Current WAL position on the primary, or None if it cannot be read"""
+        try:
+            conn = self.pool.getconn()
+        except Exception as e:
+            logger.warning(f"Primary unavailable for replica lag check: {e}")
             return None
         
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO user_sessions (
-                        session_id, user_id, ip_address, user_agent,
-                        location_data, risk_factors
-                    ) VALUES (%s, %s, %s, %s, %s, %s) RETURNING *
-                """, (
-                    session_data.get('session_id'),
-                    session_data.get('user_id'),
-                    session_data.get('ip_address'),
-                    session_data.get('user_agent'),
-                    json.dumps(session_data.get('location_data', {})),
-                    json.dumps(session_data.get('risk_factors', {}))
-                ))
-                
-                result = cur.fetchone()
-                conn.commit()
-                return dict(result) if result else None
-                
-        except Exception as e:
-            logger.error(f"Error creating session: {e}")
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn()::text")
+                lsn = cur.fetchone()[0]
             conn.rollback()
+            return lsn
+        except Exception as e:
+            logger.warning(f"Could not read primary WAL position: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.putconn(conn)
     
-    def update_session_activity(self, session_id):
-        """Update session last activity"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return False
+    def ping(self):
+        """Check that the database answers a trivial query"""
+        with self.connection() as conn:
+            if not conn:
+                return False
+            
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return True
+            except Exception as e:
+                logger.error(f"Database ping failed: {e}")
+                return False
+    
+    def get_pool_stats(self):
+        """Get connection pool metrics, with replica pool and lag when configured"""
+        stats = self.pool.get_stats()
+        if self.replica_pool:
+            stats['replica'] = dict(
+                self.replica_pool.get_stats(),
+                lag_seconds=self._replica_lag,
+                in_use=self._replica_ok
+            )
+        return stats
+    
+    def execute_prepared(self, cur, name, query, params=()):
+        """Execute a hot query as a prepared statement (see PreparedStatements)"""
+        self.statements.execute(cur, name, query, params)
+    
+    def get_statement_stats(self):
+        """Per-statement execution counts and timings"""
+        return self.statements.get_stats()
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.closeall()
+        if self.replica_pool:
+            self.replica_pool.closeall()
+    
+    def init_database(self):
+        """Apply pending migrations, then create partitions and ANN indexes.
         
+        Intended for local development (AUTO_MIGRATE=true). Deployed apps run
+        migrations.py in the release phase so workers never take DDL locks
+        at boot.
+        """
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE user_sessions 
-                    SET last_activity = CURRENT_TIMESTAMP 
-                    WHERE session_id = %s
-                """, (session_id,))
-                
-                conn.commit()
-                return cur.rowcount > 0
-                
+            run_migrations(self)
         except Exception as e:
-            logger.error(f"Error updating session: {e}")
+            logger.error(f"Database initialization failed: {e}")
+            return
+        
+        self.schema_version = LATEST_VERSION
+        logger.info("Database tables initialized successfully with vector support")
+        PartitionManager(self).ensure_partitions()
+        self.build_vector_indexes()
+    
+    def check_schema_version(self):
+        """Compare the applied schema version with the one this code expects"""
+        with self.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor() as cur:
+                    self.schema_version = get_schema_version(cur)
+            except Exception as e:
+                logger.error(f"Schema version check failed: {e}")
+                return None
+        
+        if self.schema_version < LATEST_VERSION:
+            logger.warning(f"Database schema is at version {self.schema_version}, expected {LATEST_VERSION}; "
+                           "run `python migrations.py`")
+        return self.schema_version
+    
+    def build_vector_indexes(self, index_type=None):
+        """Create missing ANN indexes on the embedding columns for the storage mode; returns their names.
+        
+        HNSW indexes can be built on empty tables and keep their recall as
+        rows arrive. IVFFlat trains its lists on the rows present at build
+        time, so those indexes are only built once a table holds
+        IVFFLAT_MIN_ROWS embeddings, with lists sized to the row count; the
+        background monitor calls this hourly so they appear once a table
+        crosses that threshold. Partitioned tables always get HNSW, since each
+        new daily partition would inherit an ivfflat index while empty.
+        Indexes left over from the other storage mode are dropped so only one
+        copy has to fit in memory.
+        
+        Indexes are built with CREATE INDEX CONCURRENTLY (in autocommit mode)
+        so writes continue during the build. Invalid indexes left by an
+        interrupted build are dropped and rebuilt. Concurrent callers are
+        serialized by an advisory lock; a caller that cannot take it returns
+        without doing anything.
+        """
+        index_type = index_type or self.vector_index
+        expression, opclass, _, suffix = self.VECTOR_STORAGE[self.vector_storage]
+        created = []
+        with self.connection() as conn:
+            if not conn:
+                return created
+            
             conn.rollback()
-            return False
-        finally:
-            conn.close() 
+            autocommit = conn.autocommit
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (self.VECTOR_INDEX_LOCK_ID,))
+                    if not cur.fetchone()[0]:
+                        return created
+                    try:
+                        for table, index_name in self.VECTOR_INDEXES.items():
+                            partitioned = is_partitioned(cur, table)
+                            for mode, (_, _, _, other_suffix) in self.VECTOR_STORAGE.items():
+                                if mode != self.vector_storage:
+                                    for name in (f"{index_name}{other_suffix}", f"{index_name}{other_suffix}_hnsw"):
+                                        drop_index(cur, name, partitioned)
+                            
+                            name = f"{index_name}{suffix}"
+                            table_index_type = index_type
+                            if partitioned and index_type == 'ivfflat':
+                                # New daily partitions inherit the index while still empty,
+                                # and ivfflat lists trained on no rows never fill in;
+                                # HNSW needs no training
+                                table_index_type = 'hnsw'
+                                drop_index(cur, name, partitioned)
+                            if table_index_type == 'hnsw':
+                                name = f"{name}_hnsw"
+                                method = sql.SQL("USING hnsw ({} {}) WITH (m = 16, ef_construction = 64)").format(
+                                    sql.SQL(expression), sql.SQL(opclass))
+                            else:
+                                method = None
+                            
+                            valid = index_valid(cur, name)
+                            if valid:
+                                continue
+                            if valid is False:
+                                logger.warning(f"Rebuilding invalid index {name}")
+                                drop_index(cur, name, partitioned)
+                            
+                            if method is None:
+                                cur.execute(sql.SQL(
+                                    "SELECT COUNT(*) FROM (SELECT 1 FROM {} WHERE embedding IS NOT NULL LIMIT %s) sample"
+                                ).format(sql.Identifier(table)), (self.IVFFLAT_MAX_LISTS * 1000,))
+                                rows = cur.fetchone()[0]
+                                if rows < self.IVFFLAT_MIN_ROWS:
+                                    logger.info(f"Deferring ivfflat index on {table} until it has {self.IVFFLAT_MIN_ROWS} embeddings")
+                                    continue
+                                method = sql.SQL("USING ivfflat ({} {}) WITH (lists = {})").format(
+                                    sql.SQL(expression), sql.SQL(opclass), sql.Literal(max(10, rows // 1000)))
+                            
+                            create_index_concurrently(cur, table, name, method, partitioned)
+                            created.append(name)
+                    finally:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (self.VECTOR_INDEX_LOCK_ID,))
+                
+                if created:
+                    logger.info(f"Built vector indexes: {', '.join(created)}")
+            except Exception as e:
+                logger.error(f"Vector index creation failed: {e}")
+            finally:
+                conn.autocommit = autocommit
+        return created
+    
+    def nearest_query(self, table, query_embedding, limit=10, similarity_threshold=0.8,
+                      conditions='', params=None, columns='*'):
+        """Build a k-nearest-neighbour query over table's embedding column.
+        
+        The ANN index picks candidates (limit * rerank_factor of them in
+        'binary' mode, where Hamming distance is only an approximation),
+        which are re-ranked by exact cosine distance; the similarity
+        threshold is applied last. conditions is an SQL fragment starting
+        with AND, using named placeholders supplied in params; columns is
+        the select list returned alongside distance and similarity_score.
+        
+        Run vector_search_settings(params['candidates'], ...) in the same
+        transaction first. Returns (query, params) ready for cursor.execute.
+        """
+        expression, _, operator, _ = self.VECTOR_STORAGE[self.vector_storage]
+        candidates = limit * self.rerank_factor if self.vector_storage == 'binary' else limit
+        query_value = f'%(embedding)s::halfvec({self.EMBEDDING_DIMENSIONS})'
+        if self.vector_storage == 'binary':
+            query_value = f'binary_quantize({query_value})::bit({self.EMBEDDING_DIMENSIONS})'
+        
+        candidate_columns = result_columns = columns
+        if columns != '*':
+            result_columns = f"{columns}, distance"
+            if 'embedding' not in columns.split(', '):
+                candidate_columns = f"{columns}, embedding"
+        
+        query = f"""
+            SELECT {result_columns}, 1 - distance AS similarity_score
+            FROM (
+                SELECT *, embedding <=> %(embedding)s::halfvec({self.EMBEDDING_DIMENSIONS}) AS distance
+                FROM (
+                    SELECT {candidate_columns} FROM {table}
+                    WHERE TRUE {conditions}
+                    ORDER BY {expression} {operator} {query_value}
+                    LIMIT %(candidates)s
+                ) candidates
+                ORDER BY distance
+                LIMIT %(limit)s
+            ) nearest
+            WHERE distance <= %(max_distance)s
+            ORDER BY distance
+        """
+        return query, dict(params or {},
+                           embedding=to_vector_literal(query_embedding),
+                           candidates=candidates,
+                           limit=limit,
+                           max_distance=1 - similarity_threshold)
+    
+    def vector_search_settings(self, limit, ef_search=None, probes=None):
+        """SET LOCAL statements tuning ANN recall for the current transaction.
+        
+        hnsw.ef_search is raised to at least limit, since an HNSW scan
+        returns no more than ef_search candidates, and capped at pgvector's
+        maximum, above which SET LOCAL fails.
+        """
+        ef_search = min(max(int(ef_search or self.hnsw_ef_search), int(limit)), self.HNSW_MAX_EF_SEARCH)
+        probes = int(probes or self.ivfflat_probes)
+        return f"SET LOCAL hnsw.ef_search = {ef_search}; SET LOCAL ivfflat.probes = {probes};"
 
-class TrafficEmbeddings:
-    def __init__(self, db_manager):
+class PartitionManager:
+    """Maintains daily range partitions for the time-series tables.
+    
+    Partitions are created a few days ahead of time so inserts never land in
+    the default partition, and whole partitions past the retention window are
+    dropped instead of DELETEing rows.
+    
+    Both take an exclusive lock on the parent table, so each statement waits
+    at most lock_timeout (e.g. behind a long export) instead of queueing every
+    other query on the table behind it, and runs in its own savepoint; a
+    partition that could not be created or dropped is logged and retried on
+    the next maintenance run without holding up the others.
+    """
+    
+    # Table name -> default retention in days
+    PARTITIONED_TABLES = {
+        'security_events': 90,
+        'network_analytics': 30
+    }
+    # Serializes maintenance across workers
+    ADVISORY_LOCK_ID = PARTITION_LOCK_ID
+    
+    def __init__(self, db_manager, retention_days=None, days_ahead=3, lock_timeout='5s'):
         self.db_manager = db_manager
+        self.retention_days = dict(self.PARTITIONED_TABLES)
+        self.retention_days.update(retention_days or {})
+        self.days_ahead = days_ahead
+        self.lock_timeout = lock_timeout
     
-    def store_embedding(self, embedding_data):
-        """Store a traffic analysis embedding"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return None
+    @staticmethod
+    def partition_name(table, day):
+        return f"{table}_p{day.strftime('%Y%m%d')}"
+    
+    def ensure_partitions(self, today=None):
+        """Create today's partition and the next days_ahead days'"""
+        today = today or datetime.now().date()
+        created = []
         
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO traffic_embeddings (
-                        analysis_type, source_data, text_description, embedding,
-                        risk_score, similarity_threshold, metadata
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING *
-                """, (
-                    embedding_data.get('analysis_type'),
-                    json.dumps(embedding_data.get('source_data', {})),
-                    embedding_data.get('text_description'),
-                    embedding_data.get('embedding'),
-                    embedding_data.get('risk_score', 0),
-                    embedding_data.get('similarity_threshold', 0.8),
-                    json.dumps(embedding_data.get('metadata', {}))
-                ))
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return created
+            
+            try:
+                with conn.cursor() as cur:
+                    if not self._acquire_lock(cur):
+                        return created
+                    
+                    for table in self._partitioned(cur):
+                        existing = set(self._list_partitions(cur, table))
+                        for offset in range(self.days_ahead + 1):
+                            day = today + timedelta(days=offset)
+                            name = self.partition_name(table, day)
+                            if name in existing:
+                                continue
+                            if self._execute_isolated(cur, sql.SQL(
+                                "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)"
+                            ).format(sql.Identifier(name), sql.Identifier(table)),
+                                (day, day + timedelta(days=1)), f"create partition {name}"):
+                                created.append(name)
                 
-                result = cur.fetchone()
                 conn.commit()
-                return dict(result) if result else None
+                if created:
+                    logger.info(f"Created partitions: {', '.join(created)}")
+                return created
                 
-        except Exception as e:
-            logger.error(f"Error storing embedding: {e}")
-            conn.rollback()
-            return None
-        finally:
-            conn.close()
+            except Exception as e:
+                logger.error(f"Error creating partitions: {e}")
+                conn.rollback()
+                return []
     
-    def find_similar_patterns(self, query_embedding, analysis_type=None, limit=10, similarity_threshold=0.8):
-        """Find similar traffic patterns using vector similarity"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    def drop_expired_partitions(self, today=None):
+        """Drop daily partitions whose whole day is past the retention window"""
+        today = today or datetime.now().date()
+        dropped = []
         
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = """
-                    SELECT *, 
-                           (1 - (embedding <=> %s)) as similarity_score
-                    FROM traffic_embeddings 
-                    WHERE (1 - (embedding <=> %s)) >= %s
-                """
-                params = [query_embedding, query_embedding, similarity_threshold]
-                
-                if analysis_type:
-                    query += " AND analysis_type = %s"
-                    params.append(analysis_type)
-                
-                query += " ORDER BY embedding <=> %s LIMIT %s"
-                params.extend([query_embedding, limit])
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return dropped
+            
+            try:
+                with conn.cursor() as cur:
+                    if not self._acquire_lock(cur):
+                        return dropped
+                    
+                    for table in self._partitioned(cur):
+                        cutoff = today - timedelta(days=self.retention_days[table])
+                        for name in self._list_partitions(cur, table):
+                            day = self._partition_day(table, name)
+                            if day is None or day >= cutoff:
+                                continue
+                            if self._execute_isolated(cur, sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)),
+                                                      None, f"drop partition {name}"):
+                                dropped.append(name)
                 
-                cur.execute(query, params)
-                results = cur.fetchall()
-                return [dict(row) for row in results]
+                conn.commit()
+                if dropped:
+                    logger.info(f"Dropped expired partitions: {', '.join(dropped)}")
+                return dropped
                 
-        except Exception as e:
-            logger.error(f"Error finding similar patterns: {e}")
-            return []
-        finally:
-            conn.close()
+            except Exception as e:
+                logger.error(f"Error dropping expired partitions: {e}")
+                conn.rollback()
+                return []
     
-    def get_embeddings_by_type(self, analysis_type, limit=100):
-        """Get embeddings by analysis type"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
-        
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT * FROM traffic_embeddings 
-                    WHERE analysis_type = %s 
-                    ORDER BY timestamp DESC 
-                    LIMIT %s
-                """, (analysis_type, limit))
-                
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
-        except Exception as e:
-            logger.error(f"Error getting embeddings by type: {e}")
-            return []
-        finally:
-            conn.close()
+    def run_maintenance(self):
+        """Create upcoming partitions and apply retention"""
+        return {
+            'created': self.ensure_partitions(),
+            'dropped': self.drop_expired_partitions()
+        }
     
-    def update_embedding_metadata(self, embedding_id, metadata):
-        """Update embedding metadata"""
-        conn = self.db_manager.get_connection()
-        if not conn:
+    def _acquire_lock(self, cur):
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (self.ADVISORY_LOCK_ID,))
+        if not cur.fetchone()[0]:
             return False
-        
+        cur.execute("SET LOCAL lock_timeout = %s", (self.lock_timeout,))
+        return True
+    
+    @staticmethod
+    def _execute_isolated(cur, query, params, action):
+        """Run one DDL statement in its own savepoint; False (logged) if it failed"""
+        cur.execute("SAVEPOINT partition_ddl")
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE traffic_embeddings 
-                    SET metadata = %s 
-                    WHERE id = %s
-                """, (json.dumps(metadata), embedding_id))
-                
-                conn.commit()
-                return cur.rowcount > 0
-                
-        except Exception as e:
-            logger.error(f"Error updating embedding metadata: {e}")
-            conn.rollback()
+            cur.execute(query, params)
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT partition_ddl")
+            logger.warning(f"Could not {action}, retrying next maintenance run: {e}")
             return False
-        finally:
-            conn.close() 
+        cur.execute("RELEASE SAVEPOINT partition_ddl")
+        return True
+    
+    def _partitioned(self, cur):
+        """Managed tables that are actually partitioned in this database"""
+        cur.execute("""
+            SELECT relname, relkind FROM pg_class
+            WHERE relname = ANY(%s) AND relnamespace = 'public'::regnamespace
+        """, (list(self.PARTITIONED_TABLES),))
+        
+        tables = []
+        for relname, relkind in cur.fetchall():
+            if relkind == 'p':
+                tables.append(relname)
+            else:
+                logger.warning(f"{relname} is not partitioned; skipping partition maintenance")
+        return tables
+    
+    @staticmethod
+    def _list_partitions(cur, table):
+        cur.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+        """, (table,))
+        return [row[0] for row in cur.fetchall()]
+    
+    @staticmethod
+    def _partition_day(table, name):
+        """Day encoded in a partition name, or None for the default partition"""
+        prefix = f"{table}_p"
+        if not name.startswith(prefix):
+            return None
+        try:
+            return datetime.strptime(name[len(prefix):], '%Y%m%d').date()
+        except ValueError:
+            return None
 
-class ClaudeGuidanceResponse:
+def encode_cursor(row):
+    """Encode a row's (timestamp, id) sort key as an opaque page token"""
+    timestamp = row['timestamp']
+    key = {
+        't': timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp,
+        'i': row['id']
+    }
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Decode a page token back into (timestamp, id); raises ValueError if malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(key['t']), int(key['i'])
+    except Exception:
+        raise ValueError(f"Invalid pagination cursor: {token!r}")
+
+def next_cursor(rows, limit):
+    """Token for the page after rows, or None when this was the last page"""
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1])
+
+def to_vector_literal(embedding):
+    """Render an embedding as pgvector's text input format"""
+    if embedding is None:
+        return None
+    if isinstance(embedding, str):
+        return embedding
+    return '[' + ','.join(repr(float(value)) for value in embedding) + ']'
+
+def select_list(columns, fields=None, required=()):
+    """Column list for a SELECT or RETURNING clause.
+    
+    columns are the table's default columns, which leave out the embedding.
+    fields, when given, picks a subset and may name 'embedding' explicitly;
+    required columns (e.g. the keyset sort key) are always included.
+    Raises ValueError for unknown field names.
+    """
+    if not fields:
+        return ', '.join(columns)
+    
+    unknown = [field for field in fields if field not in columns and field != 'embedding']
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    selected = [column for column in required if column not in fields] + list(fields)
+    return ', '.join(dict.fromkeys(selected))
+
+class SecurityEvent:
+    # Columns written by create_event / create_events, in row order
+    INSERT_COLUMNS = (
+        'event_type', 'severity', 'source_ip', 'destination_ip',
+        'source_port', 'destination_port', 'protocol', 'payload_size',
+        'user_agent', 'country_code', 'city', 'latitude', 'longitude',
+        'risk_score', 'threat_indicators', 'metadata', 'embedding', 'text_description'
+    )
+    # Columns returned by default; embeddings only when asked for
+    COLUMNS = ('id', 'timestamp', 'status') + tuple(
+        column for column in INSERT_COLUMNS if column != 'embedding')
+    COPY_CHUNK_SIZE = 10000
+    
     def __init__(self, db_manager):
         self.db_manager = db_manager
     
-    def store_guidance_response(self, guidance_data):
-        """Store a Claude guidance response with embedding"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return None
+    @staticmethod
+    def _event_row(event_data):
+        """Build an INSERT_COLUMNS-ordered row from an event dict"""
+        return (
+            event_data.get('event_type'),
+            event_data.get('severity', 'medium'),
+            event_data.get('source_ip'),
+            event_data.get('destination_ip'),
+            event_data.get('source_port'),
+            event_data.get('destination_port'),
+            event_data.get('protocol'),
+            event_data.get('payload_size'),
+            event_data.get('user_agent'),
+            event_data.get('country_code'),
+            event_data.get('city'),
+            event_data.get('latitude'),
+            event_data.get('longitude'),
+            event_data.get('risk_score', 0),
+            json.dumps(event_data.get('threat_indicators', [])),
+            json.dumps(event_data.get('metadata', {})),
+            to_vector_literal(event_data.get('embedding')),
+            event_data.get('text_description')
+        )
+    
+    def create_event(self, event_data):
+        """Create a new security event"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    self.db_manager.execute_prepared(cur, 'create_event', f"""
+                        INSERT INTO security_events ({', '.join(self.INSERT_COLUMNS)})
+                        VALUES ({', '.join(['%s'] * len(self.INSERT_COLUMNS))})
+                        RETURNING {', '.join(self.COLUMNS)}
+                    """, self._event_row(event_data))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error creating security event: {e}")
+                conn.rollback()
+                return None
+    
+    def create_events(self, batch):
+        """Bulk-insert security events with COPY, returning the new ids.
         
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    INSERT INTO claude_guidance_responses (
-                        request_id, source_ip, risk_score, threats_detected, recommendations,
-                        claude_response, embedding, model_used, response_tokens, 
-                        processing_time_ms, metadata
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING *
-                """, (
-                    guidance_data.get('request_id'),
-                    guidance_data.get('source_ip'),
-                    guidance_data.get('risk_score', 0),
-                    json.dumps(guidance_data.get('threats_detected', [])),
-                    json.dumps(guidance_data.get('recommendations', [])),
-                    guidance_data.get('claude_response'),
-                    guidance_data.get('embedding'),
-                    guidance_data.get('model_used', 'claude-3-5-sonnet-20241022'),
-                    guidance_data.get('response_tokens'),
-                    guidance_data.get('processing_time_ms'),
-                    json.dumps(guidance_data.get('metadata', {}))
-                ))
+        Rows are streamed into a temporary staging table in chunks and moved
+        into security_events with a single INSERT ... SELECT, so INET, JSONB
+        and vector values are parsed by the server's own input functions.
+        The whole batch is committed atomically.
+        """
+        if not batch:
+            return []
+        
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            columns = ', '.join(self.INSERT_COLUMNS)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        CREATE TEMP TABLE security_events_staging
+                        ON COMMIT DROP AS
+                        SELECT {columns} FROM security_events WITH NO DATA
+                    """)
+                    
+                    for chunk_start in range(0, len(batch), self.COPY_CHUNK_SIZE):
+                        chunk = batch[chunk_start:chunk_start + self.COPY_CHUNK_SIZE]
+                        buffer = io.StringIO()
+                        writer = csv.writer(buffer)
+                        for event_data in chunk:
+                            writer.writerow(self._event_row(event_data))
+                        buffer.seek(0)
+                        cur.copy_expert(
+                            f"COPY security_events_staging ({columns}) FROM STDIN WITH (FORMAT csv)",
+                            buffer
+                        )
+                    
+                    cur.execute(f"""
+                        INSERT INTO security_events ({columns})
+                        SELECT {columns} FROM security_events_staging
+                        RETURNING id
+                    """)
+                    ids = [row[0] for row in cur.fetchall()]
+                    # Inside a request unit of work the commit is deferred, so
+                    # ON COMMIT DROP alone would break a second call
+                    cur.execute("DROP TABLE security_events_staging")
+                    conn.commit()
+                    return ids
+                    
+            except Exception as e:
+                logger.error(f"Error bulk creating security events: {e}")
+                conn.rollback()
+                return None
+    
+    # Filters in the order _filter_clause applies them; the set present picks the statement
+    FILTER_KEYS = ('severity', 'source_ip', 'event_type', 'status', 'start_time', 'end_time')
+    
+    @classmethod
+    def _filter_shape(cls, filters, cursor=None):
+        """Bitmask naming which filters (and the cursor) a get_events query uses"""
+        filters = filters or {}
+        mask = sum(1 << bit for bit, key in enumerate(cls.FILTER_KEYS) if filters.get(key))
+        if cursor:
+            mask |= 1 << len(cls.FILTER_KEYS)
+        return mask
+    
+    @staticmethod
+    def _filter_clause(filters):
+        """SQL conditions and params for get_events-style filters"""
+        query = ""
+        params = []
+        
+        if filters:
+            if filters.get('severity'):
+                query += " AND severity = %s"
+                params.append(filters['severity'])
+            
+            if filters.get('source_ip'):
+                query += " AND source_ip = %s"
+                params.append(filters['source_ip'])
+            
+            if filters.get('event_type'):
+                query += " AND event_type = %s"
+                params.append(filters['event_type'])
+            
+            if filters.get('status'):
+                query += " AND status = %s"
+                params.append(filters['status'])
+            
+            # Time bounds let the planner prune daily partitions
+            if filters.get('start_time'):
+                query += " AND timestamp >= %s"
+                params.append(filters['start_time'])
+            
+            if filters.get('end_time'):
+                query += " AND timestamp < %s"
+                params.append(filters['end_time'])
+        
+        return query, params
+    
+    def get_events(self, limit=100, offset=0, filters=None, cursor=None, fields=None, fresh=False):
+        """Get security events with optional filtering.
+        
+        Pass the previous page's cursor (see next_cursor) for keyset
+        pagination; offset is ignored when a cursor is given. fields narrows
+        the returned columns (see select_list). Like the other read methods it
+        may be served by the replica; pass fresh=True to read the primary.
+        """
+        columns = select_list(self.COLUMNS, fields, required=('id', 'timestamp'))
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    conditions, params = self._filter_clause(filters)
+                    query = f"SELECT {columns} FROM security_events WHERE 1=1" + conditions
+                    
+                    if cursor:
+                        query += " AND (timestamp, id) < (%s, %s)"
+                        params.extend(decode_cursor(cursor))
+                        offset = 0
+                    
+                    query += " ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s"
+                    params.extend([limit, offset])
+                    
+                    # Only the default projection is prepared, one statement per filter shape
+                    name = f"get_events_{self._filter_shape(filters, cursor)}" if fields is None else None
+                    self.db_manager.execute_prepared(cur, name, query, params)
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error getting security events: {e}")
+                return []
+    
+    def iter_events(self, filters=None, batch_size=2000, fresh=False):
+        """Stream matching events oldest-first through a server-side cursor.
+        
+        Rows are fetched batch_size at a time, so memory stays flat however
+        many rows match. The pooled connection is held until the generator
+        is exhausted or closed. Embeddings are not exported.
+        """
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return
+            
+            conditions, params = self._filter_clause(filters)
+            columns = ', '.join(self.COLUMNS)
+            
+            with conn.cursor(name=f"events_export_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(f"""
+                    SELECT {columns} FROM security_events WHERE 1=1{conditions}
+                    ORDER BY timestamp, id
+                """, params)
+                for row in cur:
+                    yield dict(row)
+
+class NetworkAnalytics:
+    # Raw metric columns returned by default (embedding left out)
+    COLUMNS = (
+        'id', 'timestamp', 'metric_name', 'metric_value', 'metric_unit',
+        'source', "tags->>'source_ip' AS source_ip", 'tags', 'period', 'text_description'
+    )
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def record_metric(self, metric_data):
+        """Record a network metric"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    self.db_manager.execute_prepared(cur, 'record_metric', """
+                        INSERT INTO network_analytics (
+                            metric_name, metric_value, metric_unit, source, tags, period, embedding, text_description
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING {columns}
+                    """.format(columns=', '.join(self.COLUMNS)), (
+                        metric_data.get('metric_name'),
+                        metric_data.get('metric_value'),
+                        metric_data.get('metric_unit'),
+                        metric_data.get('source'),
+                        json.dumps(metric_data.get('tags', {})),
+                        metric_data.get('period', 'realtime'),
+                        to_vector_literal(metric_data.get('embedding')),
+                        metric_data.get('text_description')
+                    ))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error recording metric: {e}")
+                conn.rollback()
+                return None
+    
+    def record_metrics(self, batch):
+        """Record many metrics in one multi-row INSERT, returning the row count"""
+        if not batch:
+            return 0
+        
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO network_analytics (
+                            timestamp, metric_name, metric_value, metric_unit, source, tags, period, embedding, text_description
+                        ) VALUES %s
+                    """, [(
+                        metric_data.get('timestamp'),
+                        metric_data.get('metric_name'),
+                        metric_data.get('metric_value'),
+                        metric_data.get('metric_unit'),
+                        metric_data.get('source'),
+                        json.dumps(metric_data.get('tags', {})),
+                        metric_data.get('period', 'realtime'),
+                        to_vector_literal(metric_data.get('embedding')),
+                        metric_data.get('text_description')
+                    ) for metric_data in batch],
+                        template="(COALESCE(%s::timestamp, CURRENT_TIMESTAMP), %s, %s, %s, %s, %s, %s, %s, %s)",
+                        page_size=len(batch))
+                    
+                    conn.commit()
+                    return len(batch)
+                    
+            except Exception as e:
+                logger.error(f"Error recording metric batch: {e}")
+                conn.rollback()
+                return None
+    
+    def get_metrics(self, metric_name=None, period='realtime', limit=100, cursor=None,
+                    start_time=None, end_time=None, fresh=False):
+        """Get network metrics, newest first, with optional keyset cursor and time window.
+        
+        Coarse periods (see MetricRollups.PERIODS) are served from the rollup
+        table, one row per bucket with metric_value holding the bucket average.
+        """
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    if period in MetricRollups.PERIODS:
+                        time_column = 'bucket_start'
+                        query = """
+                            SELECT id, bucket_start AS timestamp, metric_name, source, period,
+                                   value_sum / sample_count AS metric_value,
+                                   sample_count, value_sum, value_min, value_max
+                            FROM network_analytics_rollups WHERE 1=1
+                        """
+                    else:
+                        time_column = 'timestamp'
+                        query = f"SELECT {', '.join(self.COLUMNS)} FROM network_analytics WHERE 1=1"
+                    params = []
+                    
+                    if metric_name:
+                        query += " AND metric_name = %s"
+                        params.append(metric_name)
+                    
+                    if period:
+                        query += " AND period = %s"
+                        params.append(period)
+                    
+                    if start_time:
+                        query += f" AND {time_column} >= %s"
+                        params.append(start_time)
+                    
+                    if end_time:
+                        query += f" AND {time_column} < %s"
+                        params.append(end_time)
+                    
+                    if cursor:
+                        query += f" AND ({time_column}, id) < (%s, %s)"
+                        params.extend(decode_cursor(cursor))
+                    
+                    query += f" ORDER BY {time_column} DESC, id DESC LIMIT %s"
+                    params.append(limit)
+                    
+                    cur.execute(query, params)
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error getting metrics: {e}")
+                return []
+
+    @staticmethod
+    def _history_clause(metric_name, period, source_ip=None, start_time=None, end_time=None):
+        """Build the WHERE clause shared by get_metric_history and count_metric_history"""
+        query = " WHERE metric_name = %s AND period = %s"
+        params = [metric_name, period]
+        
+        if source_ip:
+            query += " AND tags->>'source_ip' = %s"
+            params.append(source_ip)
+        
+        if start_time:
+            query += " AND timestamp >= %s"
+            params.append(start_time)
+        
+        if end_time:
+            query += " AND timestamp < %s"
+            params.append(end_time)
+        
+        return query, params
+    
+    def get_metric_history(self, metric_name, source_ip=None, start_time=None, end_time=None,
+                           limit=20, offset=0, cursor=None, period='realtime', fresh=False):
+        """Get one metric's raw rows, newest first, optionally for a single source IP.
+        
+        Filtering and paging happen in SQL against the tags->>'source_ip'
+        expression index. offset is ignored when a cursor is given.
+        """
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    conditions, params = self._history_clause(metric_name, period, source_ip, start_time, end_time)
+                    query = """
+                        SELECT id, timestamp, metric_name, metric_value, source, tags->>'source_ip' AS source_ip, tags
+                        FROM network_analytics
+                    """ + conditions
+                    
+                    if cursor:
+                        query += " AND (timestamp, id) < (%s, %s)"
+                        params.extend(decode_cursor(cursor))
+                        offset = 0
+                    
+                    query += " ORDER BY timestamp DESC, id DESC LIMIT %s OFFSET %s"
+                    params.extend([limit, offset])
+                    
+                    cur.execute(query, params)
+                    return [dict(row) for row in cur.fetchall()]
+                    
+            except Exception as e:
+                logger.error(f"Error getting metric history: {e}")
+                return []
+    
+    def count_metric_history(self, metric_name, source_ip=None, start_time=None, end_time=None,
+                             period='realtime', fresh=False):
+        """Exact number of rows get_metric_history can page through"""
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor() as cur:
+                    conditions, params = self._history_clause(metric_name, period, source_ip, start_time, end_time)
+                    cur.execute("SELECT COUNT(*) FROM network_analytics" + conditions, params)
+                    return cur.fetchone()[0]
+                    
+            except Exception as e:
+                logger.error(f"Error counting metric history: {e}")
+                return None
+
+class MetricRollups:
+    """Incremental minute/hour/day rollups of raw network_analytics rows.
+    
+    Each run aggregates realtime rows between the stored watermark and
+    now() - settle_lag into network_analytics_rollups, merging counts, sums,
+    minimums and maximums into existing buckets, and advances the watermark
+    in the same transaction. Rows arriving more than settle_lag late are
+    not counted.
+    """
+    
+    # Rollup period -> days of buckets to keep (None keeps them forever)
+    PERIODS = {
+        'minute': 7,
+        'hour': 90,
+        'day': None
+    }
+    WATERMARK_NAME = 'network_analytics_rollups'
+    ADVISORY_LOCK_ID = ROLLUP_LOCK_ID
+    
+    def __init__(self, db_manager, settle_lag=60, max_window=timedelta(hours=6)):
+        self.db_manager = db_manager
+        self.settle_lag = settle_lag
+        self.max_window = max_window
+    
+    def run(self):
+        """Roll up rows that arrived since the last run; returns the window processed"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (self.ADVISORY_LOCK_ID,))
+                    if not cur.fetchone()[0]:
+                        return None
+                    
+                    cur.execute("""
+                        SELECT watermark FROM rollup_watermarks WHERE name = %s
+                    """, (self.WATERMARK_NAME,))
+                    row = cur.fetchone()
+                    if row:
+                        window_start = row[0]
+                    else:
+                        cur.execute("SELECT MIN(timestamp) FROM network_analytics WHERE period = 'realtime'")
+                        window_start = cur.fetchone()[0]
+                        if window_start is None:
+                            return None
+                    
+                    cur.execute("SELECT LOCALTIMESTAMP - %s * INTERVAL '1 second'", (self.settle_lag,))
+                    window_end = min(cur.fetchone()[0], window_start + self.max_window)
+                    if window_end <= window_start:
+                        return None
+                    
+                    for period in self.PERIODS:
+                        cur.execute("""
+                            INSERT INTO network_analytics_rollups (
+                                period, bucket_start, metric_name, source,
+                                sample_count, value_sum, value_min, value_max
+                            )
+                            SELECT %s, date_trunc(%s, timestamp), metric_name, COALESCE(source, ''),
+                                   COUNT(*), SUM(metric_value), MIN(metric_value), MAX(metric_value)
+                            FROM network_analytics
+                            WHERE period = 'realtime' AND timestamp >= %s AND timestamp < %s
+                            GROUP BY 2, 3, 4
+                            ON CONFLICT (period, metric_name, source, bucket_start) DO UPDATE SET
+                                sample_count = network_analytics_rollups.sample_count + EXCLUDED.sample_count,
+                                value_sum = network_analytics_rollups.value_sum + EXCLUDED.value_sum,
+                                value_min = LEAST(network_analytics_rollups.value_min, EXCLUDED.value_min),
+                                value_max = GREATEST(network_analytics_rollups.value_max, EXCLUDED.value_max)
+                        """, (period, period, window_start, window_end))
+                    
+                    cur.execute("""
+                        INSERT INTO rollup_watermarks (name, watermark) VALUES (%s, %s)
+                        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark
+                    """, (self.WATERMARK_NAME, window_end))
+                    
+                    for period, retention_days in self.PERIODS.items():
+                        if retention_days is None:
+                            continue
+                        cur.execute("""
+                            DELETE FROM network_analytics_rollups
+                            WHERE period = %s AND bucket_start < LOCALTIMESTAMP - %s * INTERVAL '1 day'
+                        """, (period, retention_days))
                 
-                result = cur.fetchone()
                 conn.commit()
-                return dict(result) if result else None
+                return {
+                    'window_start': window_start.isoformat(),
+                    'window_end': window_end.isoformat()
+                }
                 
-        except Exception as e:
-            logger.error(f"Error storing guidance response: {e}")
-            conn.rollback()
-            return None
-        finally:
-            conn.close()
+            except Exception as e:
+                logger.error(f"Error rolling up metrics: {e}")
+                conn.rollback()
+                return None
+
+class MetricWriteBuffer:
+    """Write-behind buffer for network_analytics inserts.
     
-    def find_similar_guidance(self, query_embedding, limit=5, similarity_threshold=0.8):
-        """Find similar guidance responses using vector similarity"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    Metrics are queued in-process and written by a background flusher in
+    batches of up to batch_size rows or every flush_interval seconds. When
+    the queue is full, enqueue() waits put_timeout seconds and then writes
+    the metric synchronously, pushing back on the caller instead of dropping
+    data. close() flushes whatever is still queued.
+    """
+    
+    def __init__(self, network_analytics, max_size=10000, batch_size=500,
+                 flush_interval=1.0, put_timeout=0.05):
+        self.network_analytics = network_analytics
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
         
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = """
-                    SELECT *, 
-                           (1 - (embedding <=> %s)) as similarity_score
-                    FROM claude_guidance_responses 
-                    WHERE (1 - (embedding <=> %s)) >= %s AND status = 'active'
-                """
-                params = [query_embedding, query_embedding, similarity_threshold]
-                
-                query += " ORDER BY embedding <=> %s LIMIT %s"
-                params.extend([query_embedding, limit])
-                
-                cur.execute(query, params)
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
-        except Exception as e:
-            logger.error(f"Error finding similar guidance: {e}")
-            return []
-        finally:
-            conn.close()
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'failed': 0,
+            'batches': 0,
+            'sync_writes': 0
+        }
     
-    def get_guidance_by_risk_score(self, risk_score, limit=10):
-        """Get guidance responses by risk score range"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    def enqueue(self, metric_data):
+        """Queue a metric for a later batched insert"""
+        metric = dict(metric_data)
+        metric.setdefault('timestamp', datetime.now())
+        
+        if self._stopped.is_set():
+            self._write([metric], synchronous=True)
+            return
         
+        self._ensure_started()
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Get responses within ±10 points of the risk score
-                cur.execute("""
-                    SELECT * FROM claude_guidance_responses 
-                    WHERE risk_score BETWEEN %s AND %s AND status = 'active'
-                    ORDER BY timestamp DESC 
-                    LIMIT %s
-                """, (max(0, risk_score - 10), min(100, risk_score + 10), limit))
-                
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
-        except Exception as e:
-            logger.error(f"Error getting guidance by risk score: {e}")
-            return []
-        finally:
-            conn.close()
+            self._queue.put(metric, timeout=self.put_timeout)
+            with self._lock:
+                self._stats['enqueued'] += 1
+        except queue.Full:
+            self._write([metric], synchronous=True)
     
-    def get_recent_guidance(self, hours=24, limit=20):
-        """Get recent guidance responses"""
-        conn = self.db_manager.get_connection()
-        if not conn:
-            return []
+    def close(self, timeout=5.0):
+        """Stop the flusher and write out everything still queued"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
         
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT * FROM claude_guidance_responses 
-                    WHERE timestamp >= NOW() - INTERVAL '%s hours' AND status = 'active'
-                    ORDER BY timestamp DESC 
-                    LIMIT %s
-                """, (hours, limit))
-                
-                results = cur.fetchall()
-                return [dict(row) for row in results]
-                
-        except Exception as e:
-            logger.error(f"Error getting recent guidance: {e}")
-            return []
-        finally:
-            conn.close() 
\ No newline at end of file
+        remaining = self._drain_nowait()
+        if remaining:
+            self._write(remaining)
+    
+    def get_stats(self):
+        """Get queue depth and flush counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+    
+    def _ensure_started(self):
+        if self._thread:
+            return
+        with self._lock:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name='metric-write-buffer', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+    
+    def _collect_batch(self):
+        """Block for up to flush_interval gathering at most batch_size metrics"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _drain_nowait(self):
+        drained = []
+        while True:
+            try:
+                drained.append(self._queue.get_nowait())
+            except queue.Empty:
+                return drained
+    
+    def _write(self, batch, synchronous=False):
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            written = self.network_analytics.record_metrics(chunk)
+            with self._lock:
+                if synchronous:
+                    self._stats['sync_writes'] += len(chunk)
+                if written is None:
+                    self._stats['failed'] += len(chunk)
+                else:
+                    self._stats['flushed'] += written
+                    self._stats['batches'] += 1
+            if written is None:
+                logger.error(f"Dropped {len(chunk)} buffered metrics after a failed flush")
+
+class ThreatIntelligence:
+    # Columns check_indicator returns: enough to identify and rate a match
+    CHECK_COLUMNS = ('id', 'indicator_type', 'indicator_value', 'confidence_level', 'threat_category', 'source')
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def add_indicator(self, indicator_data):
+        """Add a new threat indicator"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        INSERT INTO threat_intelligence (
+                            indicator_type, indicator_value, confidence_level,
+                            threat_category, description, source, metadata
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING *
+                    """, (
+                        indicator_data.get('indicator_type'),
+                        indicator_data.get('indicator_value'),
+                        indicator_data.get('confidence_level', 'medium'),
+                        indicator_data.get('threat_category'),
+                        indicator_data.get('description'),
+                        indicator_data.get('source'),
+                        json.dumps(indicator_data.get('metadata', {}))
+                    ))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error adding threat indicator: {e}")
+                conn.rollback()
+                return None
+    
+    def check_indicator(self, indicator_value, indicator_type=None):
+        """Check if an indicator exists in threat intelligence"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    query = f"""
+                        SELECT {', '.join(self.CHECK_COLUMNS)} FROM threat_intelligence
+                        WHERE indicator_value = %s AND active = TRUE
+                    """
+                    params = [indicator_value]
+                    
+                    if indicator_type:
+                        query += " AND indicator_type = %s"
+                        params.append(indicator_type)
+                    
+                    name = 'check_indicator_typed' if indicator_type else 'check_indicator'
+                    self.db_manager.execute_prepared(cur, name, query, params)
+                    result = cur.fetchone()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error checking indicator: {e}")
+                return None
+    
+    def get_indicators_since(self, last_id, limit=10000, fresh=False):
+        """Active indicator ids and values with id > last_id, oldest first"""
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    self.db_manager.execute_prepared(cur, 'indicators_since', """
+                        SELECT id, indicator_value FROM threat_intelligence
+                        WHERE id > %s AND active = TRUE
+                        ORDER BY id
+                        LIMIT %s
+                    """, (last_id, limit))
+                    return [dict(row) for row in cur.fetchall()]
+                    
+            except Exception as e:
+                logger.error(f"Error getting threat indicators: {e}")
+                return None
+
+class UserSession:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def create_session(self, session_data):
+        """Create a new user session"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        INSERT INTO user_sessions (
+                            session_id, user_id, ip_address, user_agent,
+                            location_data, risk_factors
+                        ) VALUES (%s, %s, %s, %s, %s, %s) RETURNING *
+                    """, (
+                        session_data.get('session_id'),
+                        session_data.get('user_id'),
+                        session_data.get('ip_address'),
+                        session_data.get('user_agent'),
+                        json.dumps(session_data.get('location_data', {})),
+                        json.dumps(session_data.get('risk_factors', {}))
+                    ))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error creating session: {e}")
+                conn.rollback()
+                return None
+    
+    def update_session_activity(self, session_id):
+        """Update session last activity"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return False
+            
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE user_sessions 
+                        SET last_activity = CURRENT_TIMESTAMP 
+                        WHERE session_id = %s
+                    """, (session_id,))
+                    
+                    conn.commit()
+                    return cur.rowcount > 0
+                    
+            except Exception as e:
+                logger.error(f"Error updating session: {e}")
+                conn.rollback()
+                return False
+
+class TrafficEmbeddings:
+    # Columns returned by default; embeddings only when asked for
+    COLUMNS = (
+        'id', 'timestamp', 'analysis_type', 'source_data', 'text_description',
+        'risk_score', 'similarity_threshold', 'metadata', 'status'
+    )
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def store_embedding(self, embedding_data):
+        """Store a traffic analysis embedding"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        INSERT INTO traffic_embeddings (
+                            analysis_type, source_data, text_description, embedding,
+                            risk_score, similarity_threshold, metadata
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING {columns}
+                    """.format(columns=', '.join(self.COLUMNS)), (
+                        embedding_data.get('analysis_type'),
+                        json.dumps(embedding_data.get('source_data', {})),
+                        embedding_data.get('text_description'),
+                        to_vector_literal(embedding_data.get('embedding')),
+                        embedding_data.get('risk_score', 0),
+                        embedding_data.get('similarity_threshold', 0.8),
+                        json.dumps(embedding_data.get('metadata', {}))
+                    ))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error storing embedding: {e}")
+                conn.rollback()
+                return None
+    
+    def find_similar_patterns(self, query_embedding, analysis_type=None, limit=10, similarity_threshold=0.8,
+                              ef_search=None, probes=None, fields=None, fresh=False):
+        """Find similar traffic patterns using vector similarity (see DatabaseManager.nearest_query)"""
+        columns = select_list(self.COLUMNS, fields)
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    conditions = ''
+                    params = {}
+                    if analysis_type:
+                        conditions = "AND analysis_type = %(analysis_type)s"
+                        params['analysis_type'] = analysis_type
+                    
+                    query, params = self.db_manager.nearest_query(
+                        'traffic_embeddings', query_embedding, limit, similarity_threshold,
+                        conditions, params, columns
+                    )
+                    cur.execute(self.db_manager.vector_search_settings(params['candidates'], ef_search, probes))
+                    name = None
+                    if fields is None:
+                        name = f"find_similar_patterns_{self.db_manager.vector_storage}_{int(bool(analysis_type))}"
+                    self.db_manager.execute_prepared(cur, name, query, params)
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error finding similar patterns: {e}")
+                return []
+    
+    def get_stats(self, bucket='day', buckets=7, recent=3, fresh=False):
+        """Exact embedding counts per analysis type and time bucket.
+        
+        Totals and the last `buckets` hour/day buckets come from a single
+        GROUPING SETS aggregate; the newest `recent` rows of each type are
+        fetched through the (analysis_type, timestamp) index. The result is
+        plain JSON so it can be cached as-is.
+        """
+        if bucket not in ('hour', 'day'):
+            raise ValueError(f"Unsupported stats bucket: {bucket!r}")
+        
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    # Rows older than the window fall into a NULL bucket that is skipped
+                    cur.execute(f"""
+                        SELECT analysis_type, bucket, GROUPING(bucket) AS is_total, COUNT(*) AS count
+                        FROM (
+                            SELECT analysis_type,
+                                   CASE WHEN timestamp >= date_trunc(%s, NOW()) - %s * INTERVAL '1 {bucket}'
+                                        THEN date_trunc(%s, timestamp) END AS bucket
+                            FROM traffic_embeddings
+                        ) bucketed
+                        GROUP BY GROUPING SETS ((analysis_type), (analysis_type, bucket))
+                    """, (bucket, buckets - 1, bucket))
+                    
+                    stats = {
+                        'total_embeddings': 0,
+                        'embeddings_by_type': {},
+                        'embeddings_by_bucket': {},
+                        'bucket': bucket,
+                        'recent_embeddings': []
+                    }
+                    for row in cur.fetchall():
+                        analysis_type = row['analysis_type']
+                        if row['is_total']:
+                            stats['embeddings_by_type'][analysis_type] = row['count']
+                            stats['total_embeddings'] += row['count']
+                        elif row['bucket'] is not None:
+                            stats['embeddings_by_bucket'].setdefault(analysis_type, {})[
+                                row['bucket'].isoformat()] = row['count']
+                    
+                    if stats['embeddings_by_type'] and recent:
+                        cur.execute("""
+                            SELECT newest.*
+                            FROM unnest(%s::text[]) AS types(analysis_type)
+                            CROSS JOIN LATERAL (
+                                SELECT id, timestamp, analysis_type, risk_score, text_description
+                                FROM traffic_embeddings
+                                WHERE analysis_type = types.analysis_type
+                                ORDER BY timestamp DESC, id DESC
+                                LIMIT %s
+                            ) newest
+                        """, (list(stats['embeddings_by_type']), recent))
+                        stats['recent_embeddings'] = [
+                            dict(row, timestamp=row['timestamp'].isoformat() if row['timestamp'] else None)
+                            for row in cur.fetchall()
+                        ]
+                    
+                    return stats
+                    
+            except Exception as e:
+                logger.error(f"Error getting embedding stats: {e}")
+                return None
+    
+    def get_embeddings_by_type(self, analysis_type, limit=100, fields=None, fresh=False):
+        """Get embeddings by analysis type"""
+        columns = select_list(self.COLUMNS, fields)
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(f"""
+                        SELECT {columns} FROM traffic_embeddings 
+                        WHERE analysis_type = %s 
+                        ORDER BY timestamp DESC 
+                        LIMIT %s
+                    """, (analysis_type, limit))
+                    
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error getting embeddings by type: {e}")
+                return []
+    
+    def update_embedding_metadata(self, embedding_id, metadata):
+        """Update embedding metadata"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return False
+            
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE traffic_embeddings 
+                        SET metadata = %s 
+                        WHERE id = %s
+                    """, (json.dumps(metadata), embedding_id))
+                    
+                    conn.commit()
+                    return cur.rowcount > 0
+                    
+            except Exception as e:
+                logger.error(f"Error updating embedding metadata: {e}")
+                conn.rollback()
+                return False
+
+class ClaudeGuidanceResponse:
+    # Columns returned by default; embeddings only when asked for
+    COLUMNS = (
+        'id', 'timestamp', 'request_id', 'source_ip', 'risk_score', 'threats_detected',
+        'recommendations', 'claude_response', 'model_used', 'response_tokens',
+        'processing_time_ms', 'metadata', 'status'
+    )
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def store_guidance_response(self, guidance_data):
+        """Store a Claude guidance response with embedding"""
+        with self.db_manager.connection() as conn:
+            if not conn:
+                return None
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("""
+                        INSERT INTO claude_guidance_responses (
+                            request_id, source_ip, risk_score, threats_detected, recommendations,
+                            claude_response, embedding, model_used, response_tokens, 
+                            processing_time_ms, metadata
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING {columns}
+                    """.format(columns=', '.join(self.COLUMNS)), (
+                        guidance_data.get('request_id'),
+                        guidance_data.get('source_ip'),
+                        guidance_data.get('risk_score', 0),
+                        json.dumps(guidance_data.get('threats_detected', [])),
+                        json.dumps(guidance_data.get('recommendations', [])),
+                        guidance_data.get('claude_response'),
+                        to_vector_literal(guidance_data.get('embedding')),
+                        guidance_data.get('model_used', 'claude-3-5-sonnet-20241022'),
+                        guidance_data.get('response_tokens'),
+                        guidance_data.get('processing_time_ms'),
+                        json.dumps(guidance_data.get('metadata', {}))
+                    ))
+                    
+                    result = cur.fetchone()
+                    conn.commit()
+                    return dict(result) if result else None
+                    
+            except Exception as e:
+                logger.error(f"Error storing guidance response: {e}")
+                conn.rollback()
+                return None
+    
+    def find_similar_guidance(self, query_embedding, limit=5, similarity_threshold=0.8,
+                              ef_search=None, probes=None, fields=None, fresh=False):
+        """Find similar guidance responses using vector similarity (nearest k, then threshold)"""
+        columns = select_list(self.COLUMNS, fields)
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    query, params = self.db_manager.nearest_query(
+                        'claude_guidance_responses', query_embedding, limit, similarity_threshold,
+                        "AND status = 'active'", None, columns
+                    )
+                    cur.execute(self.db_manager.vector_search_settings(params['candidates'], ef_search, probes))
+                    name = f"find_similar_guidance_{self.db_manager.vector_storage}" if fields is None else None
+                    self.db_manager.execute_prepared(cur, name, query, params)
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error finding similar guidance: {e}")
+                return []
+    
+    def get_guidance_by_risk_score(self, risk_score, limit=10, fields=None, fresh=False):
+        """Get guidance responses by risk score range"""
+        columns = select_list(self.COLUMNS, fields)
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    # Get responses within ±10 points of the risk score
+                    cur.execute(f"""
+                        SELECT {columns} FROM claude_guidance_responses 
+                        WHERE risk_score BETWEEN %s AND %s AND status = 'active'
+                        ORDER BY timestamp DESC 
+                        LIMIT %s
+                    """, (max(0, risk_score - 10), min(100, risk_score + 10), limit))
+                    
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error getting guidance by risk score: {e}")
+                return []
+    
+    def get_recent_guidance(self, hours=24, limit=20, cursor=None, fields=None, fresh=False):
+        """Get recent guidance responses, newest first, with optional keyset cursor"""
+        columns = select_list(self.COLUMNS, fields, required=('id', 'timestamp'))
+        with self.db_manager.connection(readonly=not fresh) as conn:
+            if not conn:
+                return []
+            
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    query = f"""
+                        SELECT {columns} FROM claude_guidance_responses 
+                        WHERE timestamp >= NOW() - %s * INTERVAL '1 hour' AND status = 'active'
+                    """
+                    params = [hours]
+                    
+                    if cursor:
+                        query += " AND (timestamp, id) < (%s, %s)"
+                        params.extend(decode_cursor(cursor))
+                    
+                    query += " ORDER BY timestamp DESC, id DESC LIMIT %s"
+                    params.append(limit)
+                    
+                    cur.execute(query, params)
+                    
+                    results = cur.fetchall()
+                    return [dict(row) for row in results]
+                    
+            except Exception as e:
+                logger.error(f"Error getting recent guidance: {e}")
+                return []
\ No newline at end of file
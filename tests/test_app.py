@@ -1,7 +1,7 @@
 import pytest
 import json
 from datetime import datetime
-from app import app, network_monitor, cache_manager, db_manager
+from app import app, network_monitor, cache_manager, db_manager, encode_csv, encode_ndjson, get_search_limit
 
 @pytest.fixture
 def client():
@@ -94,6 +94,21 @@ class TestTrafficAnalysis:
         
         assert response.status_code == 400
 
+    def test_analysis_history_no_database(self, client):
+        """Test analysis history is empty without a database"""
+        response = client.get('/api/network/analysis-history?source_ip=192.168.1.100')
+        data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        assert data['history'] == []
+        assert data['total'] == 0
+
+    def test_analysis_history_invalid_time(self, client):
+        """Test analysis history rejects malformed time bounds"""
+        response = client.get('/api/network/analysis-history?start_time=yesterday')
+        
+        assert response.status_code == 400
+
 class TestSecurityEvents:
     def test_get_events_no_database(self, client):
         """Test getting events when database is not available"""
@@ -119,6 +134,150 @@ class TestSecurityEvents:
         
         assert response.status_code == 503  # Service unavailable
 
+    def test_bulk_create_events_no_database(self, client):
+        """Test bulk ingestion when database is not available"""
+        events = [
+            {'event_type': 'port_scan', 'source_ip': '192.168.1.100'},
+            {'event_type': 'port_scan', 'source_ip': '192.168.1.101'}
+        ]
+        
+        response = client.post('/api/events/bulk',
+                             data=json.dumps({'events': events}),
+                             content_type='application/json')
+        
+        assert response.status_code == 503
+
+    def test_bulk_create_events_missing_event_type(self, client):
+        """Test bulk ingestion rejects events without an event_type"""
+        events = [{'event_type': 'port_scan'}, {'severity': 'high'}]
+        
+        response = client.post('/api/events/bulk',
+                             data=json.dumps(events),
+                             content_type='application/json')
+        data = json.loads(response.data)
+        
+        assert response.status_code == 400
+        assert 'Event 1' in data['error']
+
+    def test_bulk_create_events_blank_required_fields(self, client):
+        """Test bulk ingestion reports every event with an empty event_type or severity"""
+        events = [
+            {'event_type': 'port_scan', 'severity': 'high'},
+            {'event_type': '', 'severity': 'high'},
+            {'event_type': 'port_scan', 'severity': ''},
+            {'event_type': 'port_scan', 'severity': None},
+            {'event_type': 'port_scan'}
+        ]
+        
+        response = client.post('/api/events/bulk',
+                             data=json.dumps(events),
+                             content_type='application/json')
+        data = json.loads(response.data)
+        
+        assert response.status_code == 400
+        assert data['invalid_events'] == [
+            {'index': 1, 'fields': ['event_type']},
+            {'index': 2, 'fields': ['severity']},
+            {'index': 3, 'fields': ['severity']}
+        ]
+
+    def test_export_events_no_database(self, client):
+        """Test exporting events when database is not available"""
+        response = client.get('/api/events/export?format=csv')
+        
+        assert response.status_code == 503
+
+    def test_export_events_unsupported_format(self, client):
+        """Test exporting events in an unknown format"""
+        response = client.get('/api/events/export?format=xml')
+        
+        assert response.status_code == 400
+
+class RecordingUnitOfWork:
+    """db_manager stand-in recording how each request's unit of work ends"""
+    def __init__(self):
+        self.ends = []
+        self.callbacks = []
+    
+    def begin_unit_of_work(self):
+        self.callbacks = []
+    
+    def after_commit(self, callback):
+        self.callbacks.append(callback)
+    
+    def end_unit_of_work(self, commit=True):
+        self.ends.append(commit)
+        if commit:
+            for callback in self.callbacks:
+                callback()
+        self.callbacks = []
+        return True
+
+class TestUnitOfWorkHooks:
+    def test_request_that_raises_is_rolled_back(self, client, monkeypatch):
+        """Test a view that writes and then raises never commits its writes"""
+        import random
+        import app as app_module
+        
+        unit = RecordingUnitOfWork()
+        committed = []
+        monkeypatch.setattr(app_module, 'db_manager', unit)
+        monkeypatch.setitem(app.config, 'PROPAGATE_EXCEPTIONS', False)
+        
+        def write_then_fail(*args):
+            unit.after_commit(lambda: committed.append(True))
+            raise RuntimeError('view failed after writing')
+        monkeypatch.setattr(random, 'randint', write_then_fail)
+        
+        response = client.get('/api/network/status')
+        
+        assert response.status_code == 500
+        assert unit.ends[0] is False
+        assert True not in unit.ends
+        assert committed == []
+    
+    def test_successful_request_commits(self, client, monkeypatch):
+        """Test a request that succeeds commits its unit of work once"""
+        import app as app_module
+        
+        unit = RecordingUnitOfWork()
+        monkeypatch.setattr(app_module, 'db_manager', unit)
+        
+        response = client.get('/api/network/status')
+        
+        assert response.status_code == 200
+        assert unit.ends[0] is True
+
+class TestSearchLimit:
+    def test_limit_is_capped(self):
+        """Test similarity search limits are bounded like page sizes"""
+        assert get_search_limit({'limit': 1000000}, 10) == app.config['MAX_SEARCH_RESULTS']
+        assert get_search_limit({'limit': 0}, 10) == 1
+        assert get_search_limit({}, 10) == 10
+        assert get_search_limit({'limit': 'many'}, 10) == 10
+
+class TestExportEncoders:
+    def test_encode_ndjson(self):
+        """Test rows are encoded one JSON document per line"""
+        rows = [{'id': 1, 'timestamp': datetime(2025, 1, 1)}, {'id': 2, 'timestamp': datetime(2025, 1, 2)}]
+        
+        lines = ''.join(encode_ndjson(iter(rows))).splitlines()
+        
+        assert [json.loads(line)['id'] for line in lines] == [1, 2]
+        assert json.loads(lines[0])['timestamp'] == '2025-01-01 00:00:00'
+
+    def test_encode_csv_chunks(self):
+        """Test CSV output has one header and is flushed in chunks"""
+        rows = ({'id': i, 'metadata': {'n': i}} for i in range(100))
+        
+        chunks = list(encode_csv(rows, chunk_size=256))
+        lines = ''.join(chunks).splitlines()
+        
+        assert len(chunks) > 1
+        assert lines[0] == 'id,metadata'
+        assert lines[1] == '0,"{""n"": 0}"'
+        assert len(lines) == 101
+
 class TestAlerts:
     def test_get_alerts(self, client):
         """Test getting alerts"""
@@ -235,6 +394,18 @@ class TestAnalytics:
         assert 'total' in data
         assert data['metrics'] == []  # Should be empty without database
 
+    def test_get_analytics_invalid_cursor(self, client):
+        """Test that a malformed pagination cursor is rejected"""
+        response = client.get('/api/analytics/metrics?cursor=bogus')
+        
+        assert response.status_code == 400
+
+    def test_get_analytics_invalid_time_window(self, client):
+        """Test that a malformed start_time is rejected"""
+        response = client.get('/api/analytics/metrics?start_time=yesterday')
+        
+        assert response.status_code == 400
+
     def test_record_metric_no_database(self, client):
         """Test recording metric when database is not available"""
         metric_data = {
@@ -290,6 +461,51 @@ class TestCache:
         assert 'success' in data
         assert 'pattern' in data
 
+class TestRateLimiting:
+    def test_limited_route_returns_retry_after(self, client, monkeypatch):
+        """Test a client over its limit gets 429 with Retry-After"""
+        monkeypatch.setattr(cache_manager, 'check_rate_limit', lambda key, limit, window: (False, 12.3))
+        
+        response = client.post('/api/guidance/generate',
+                             data=json.dumps({'analysis_data': {}}),
+                             content_type='application/json')
+        
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '13'
+
+    def test_unlimited_route_is_not_checked(self, client, monkeypatch):
+        """Test cheap routes skip the rate limiter"""
+        checked = []
+        monkeypatch.setattr(cache_manager, 'check_rate_limit',
+                            lambda key, limit, window: checked.append(key) or (True, 0))
+        
+        response = client.get('/api/network/status')
+        
+        assert response.status_code == 200
+        assert checked == []
+
+    def test_clients_are_keyed_by_forwarded_address(self, client, monkeypatch):
+        """Test the limiter keys on the router-appended client address"""
+        checked = []
+        monkeypatch.setattr(cache_manager, 'check_rate_limit',
+                            lambda key, limit, window: checked.append(key) or (True, 0))
+        
+        client.get('/api/embeddings/stats', headers={'X-Forwarded-For': '10.0.0.1, 203.0.113.9'})
+        
+        assert checked == ['embeddings:203.0.113.9']
+
+class TestEmbeddingStats:
+    def test_embedding_stats_without_database(self, client):
+        """Test embedding stats report zero counts when no database is attached"""
+        response = client.get('/api/embeddings/stats')
+        data = json.loads(response.data)
+        
+        assert response.status_code == 200
+        assert data['total_embeddings'] == 0
+        assert data['embeddings_by_type'] == {}
+        assert data['recent_embeddings'] == []
+        assert 'embedding_manager_status' in data
+
 class TestNetworkMonitor:
     def test_network_monitor_initialization(self):
         """Test network monitor initialization"""
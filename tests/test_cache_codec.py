@@ -0,0 +1,61 @@
+import json
+import zlib
+from datetime import datetime
+import pytest
+from cache_codec import Codec, CodecError
+
+class TestCodec:
+    @pytest.mark.parametrize('serializer', Codec.available_serializers())
+    def test_round_trip(self, serializer):
+        """Test values survive every installed serializer"""
+        codec = Codec(serializer=serializer, compression='none')
+        value = {'indicators': [{'value': '10.0.0.1', 'severity': 'high'}], 'total': 1, 'score': 0.5}
+
+        data = codec.dumps(value)
+
+        assert data[0] >= Codec.HEADER_FLAG
+        assert codec.loads(data) == value
+
+    def test_datetimes_are_stored_as_iso_strings(self):
+        """Test records with datetimes can be cached"""
+        codec = Codec(serializer='json', compression='none')
+
+        data = codec.dumps({'created_at': datetime(2024, 1, 2, 3, 4, 5)})
+
+        assert codec.loads(data) == {'created_at': '2024-01-02T03:04:05'}
+
+    def test_reads_legacy_plain_json(self):
+        """Test values written before the header existed are still readable"""
+        codec = Codec()
+
+        assert codec.loads(b'{"total": 1}') == {'total': 1}
+        assert codec.loads('["a"]') == ['a']
+
+    def test_compresses_only_above_threshold(self):
+        """Test small values skip compression and large ones are compressed"""
+        codec = Codec(serializer='json', compression='zlib', compress_min_bytes=100)
+        small = codec.dumps({'a': 1})
+        large_value = {'indicators': ['10.0.0.%d' % (i % 10) for i in range(500)]}
+
+        large = codec.dumps(large_value)
+
+        assert small[1:] == b'{"a":1}'
+        assert len(large) < len(json.dumps(large_value))
+        assert codec.loads(large) == large_value
+
+    def test_reads_values_from_other_settings(self):
+        """Test a reader decodes whatever format the writer used"""
+        writer = Codec(serializer='json', compression='zlib', compress_min_bytes=0)
+        reader = Codec(compression='none')
+
+        assert reader.loads(writer.dumps(list(range(200)))) == list(range(200))
+
+    def test_unknown_header(self):
+        """Test an unknown format id is reported rather than misread"""
+        with pytest.raises(CodecError):
+            Codec().loads(bytes([Codec.HEADER_FLAG | 0x07]) + zlib.compress(b'{}'))
+
+    def test_unknown_setting(self):
+        """Test misconfigured codec names fail at startup"""
+        with pytest.raises(ValueError):
+            Codec(serializer='pickle')
@@ -0,0 +1,405 @@
+import json
+import os
+import pytest
+import redis
+from cache_manager import CacheManager, CircuitBreaker, LocalCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestLocalCache:
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry is evicted when full"""
+        local = LocalCache(max_entries=2, ttl=60, clock=FakeClock())
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+
+        local.set('c', 3)
+
+        assert local.get('b') == (False, None)
+        assert local.get('a') == (True, 1)
+        assert local.get_stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        """Test entries live for the shorter of the L1 and caller TTLs"""
+        clock = FakeClock()
+        local = LocalCache(max_entries=10, ttl=5, clock=clock)
+        local.set('a', 1, ttl=300)
+        local.set('b', 2, ttl=2)
+
+        clock.now = 3
+        assert local.get('a') == (True, 1)
+        assert local.get('b') == (False, None)
+
+        clock.now = 6
+        assert local.get('a') == (False, None)
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        """Test the breaker refuses calls once the failure threshold is reached"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=FakeClock())
+
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.allow()
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+    def test_success_resets_failure_count(self):
+        """Test only consecutive failures count towards tripping"""
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_half_opens_for_a_single_trial(self):
+        """Test one trial call is allowed after the reset timeout"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 31
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_failed_trial_reopens(self):
+        """Test a failed half-open trial re-opens the breaker"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        clock.now = 31
+        breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+class RecordingRedis:
+    """Records commands issued directly or through pipelines"""
+    def __init__(self, history=()):
+        self.commands = []
+        self.history = list(history)
+        self.versions = {}
+        self.values = {}
+        self.stream_entries = {}
+        self.pending = []
+        self.claimable = []
+
+    def get(self, key):
+        self.commands.append(('get', key))
+        return self.values.get(key)
+
+    def mget(self, keys):
+        return [self.versions.get(key) for key in keys]
+
+    def scan_iter(self, match=None, count=None):
+        return iter([b'events:v0:realtime', b'cache:version:events', b'session:v0:a', b'stream:security_alerts',
+                     b'lock:threats:v0:indicators', b'ratelimit:guidance:1.2.3.4', b'session:v0:b'])
+
+    def unlink(self, *keys):
+        self.commands.append(('unlink',) + keys)
+        return len(keys)
+
+    def incr(self, key):
+        self.versions[key] = int(self.versions.get(key) or 0) + 1
+        return self.versions[key]
+
+    def pipeline(self, transaction=True):
+        return RecordingPipeline(self)
+
+    def set(self, key, value, nx=False, px=None):
+        self.commands.append(('set', key, value, nx, px))
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.commands.append(('xadd', name, fields, maxlen, approximate))
+        return b'1-0'
+
+    def xack(self, name, group, *ids):
+        self.commands.append(('xack', name, group) + ids)
+        return len(ids)
+
+    def xrange(self, name, min='-', max='+'):
+        return [(min, self.stream_entries[min])]
+
+    def xpending_range(self, name, group, min, max, count, idle=None):
+        return self.pending
+
+    def xautoclaim(self, name, group, consumer, min_idle_time, start_id='0-0', count=None):
+        return [b'0-0', self.claimable, []]
+
+    def zrevrangebyscore(self, key, max_score, min_score, start=None, num=None):
+        self.commands.append(('zrevrangebyscore', key, max_score, start, num))
+        return self.history[:num]
+
+class RecordingPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.queued.append((name,) + args + ((kwargs,) if kwargs else ()))
+
+    def execute(self):
+        self.client.commands.extend(self.queued)
+        for command in self.queued:
+            if command[0] == 'setex':
+                self.client.values[command[1]] = command[3]
+        return [True] * len(self.queued)
+
+@pytest.fixture
+def cache():
+    cache = CacheManager('redis://localhost:1', socket_timeout=0.1)
+    cache.redis_client = RecordingRedis()
+    cache.breaker.record_success()
+    # No invalidation listener thread in unit tests
+    cache._listener_pid = os.getpid()
+    cache._release_lock_script = lambda keys, args: cache.redis_client.values.pop(keys[0], None)
+    return cache
+
+class TestGetOrCompute:
+    def test_miss_computes_once_and_caches(self, cache):
+        """Test the first caller fills the cache and later callers reuse it"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return ['10.0.0.1']
+
+        assert cache.get_or_compute('threats:indicators', compute, ttl=60) == ['10.0.0.1']
+        assert cache.get_or_compute('threats:indicators', compute, ttl=60) == ['10.0.0.1']
+
+        assert len(calls) == 1
+        setex = [command for command in cache.redis_client.commands if command[0] == 'setex']
+        assert setex[0][1:3] == ('threats:v0:indicators', 120)
+        assert 'lock:threats:v0:indicators' not in cache.redis_client.values
+
+    def test_stale_value_served_while_another_caller_fills(self, cache):
+        """Test callers that lose the lock get the expired value instead of recomputing"""
+        stale = cache._envelope(['old'], 0.1, -5)
+        cache.redis_client.values['threats:v0:indicators'] = cache.codec.dumps(stale)
+        cache.redis_client.values['lock:threats:v0:indicators'] = 'other'
+
+        value = cache.get_or_compute('threats:indicators', lambda: pytest.fail('recomputed'), ttl=60)
+
+        assert value == ['old']
+        assert cache.get_cache_stats()['fills']['stale_served'] == 1
+
+    def test_recomputes_early_near_expiry(self, cache, monkeypatch):
+        """Test XFetch refreshes a still-valid value when expiry is close"""
+        fresh = cache._envelope(['old'], 2.0, 1)
+        cache.redis_client.values['threats:v0:indicators'] = cache.codec.dumps(fresh)
+        monkeypatch.setattr('cache_manager.random.random', lambda: 0.9)
+
+        value = cache.get_or_compute('threats:indicators', lambda: ['new'], ttl=60)
+
+        assert value == ['new']
+        assert cache.get_cache_stats()['fills']['early_recomputes'] == 1
+
+    def test_failed_recompute_keeps_stale_value(self, cache):
+        """Test an error while refreshing falls back to the stale value"""
+        cache.redis_client.values['threats:v0:indicators'] = cache.codec.dumps(cache._envelope(['old'], 0.1, -5))
+
+        def compute():
+            raise RuntimeError('database down')
+
+        assert cache.get_or_compute('threats:indicators', compute, ttl=60) == ['old']
+
+    def test_computes_directly_without_redis(self):
+        """Test fills fall back to fn() when Redis is unavailable"""
+        cache = CacheManager('redis://localhost:1', socket_timeout=0.1, failure_threshold=1)
+
+        assert cache.get_or_compute('threats:indicators', lambda: ['x'], ttl=60) == ['x']
+
+class TestTwoTierCache:
+    def test_repeat_reads_are_served_locally(self, cache):
+        """Test hot reads hit Redis once, including misses"""
+        cache.redis_client.values['threats:v0:check:10.0.0.1'] = json.dumps({'threat': True})
+
+        for _ in range(3):
+            assert cache.check_threat_indicator('10.0.0.1') == {'threat': True}
+            assert cache.check_threat_indicator('10.0.0.2') is None
+
+        gets = [command for command in cache.redis_client.commands if command[0] == 'get']
+        assert len(gets) == 2
+        stats = cache.get_cache_stats()
+        assert stats['l1']['hits'] == 4
+        assert stats['l2'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+    def test_write_publishes_invalidation(self, cache):
+        """Test a write updates L1 and announces the key to other workers"""
+        cache.cache_threat_check('10.0.0.1', {'threat': True})
+
+        names = [command[0] for command in cache.redis_client.commands]
+        assert names == ['setex', 'publish']
+        assert json.loads(cache.redis_client.commands[1][2])['keys'] == ['threats:v0:check:10.0.0.1']
+        assert cache.check_threat_indicator('10.0.0.1') == {'threat': True}
+
+    def test_remote_invalidation_drops_local_copy(self, cache):
+        """Test another worker's write evicts the stale L1 entry"""
+        assert cache.check_threat_indicator('10.0.0.1') is None
+        cache.redis_client.values['threats:v0:check:10.0.0.1'] = json.dumps({'threat': True})
+
+        cache._apply_invalidation(json.dumps({'origin': 'other', 'keys': ['threats:v0:check:10.0.0.1']}))
+
+        assert cache.check_threat_indicator('10.0.0.1') == {'threat': True}
+
+    def test_remote_namespace_invalidation_moves_version(self, cache):
+        """Test a namespace bump from another worker is seen immediately"""
+        assert cache._key('threats', 'indicators') == 'threats:v0:indicators'
+
+        cache._apply_invalidation(json.dumps({'origin': 'other', 'namespace': 'threats', 'version': 3}))
+
+        assert cache._key('threats', 'indicators') == 'threats:v3:indicators'
+
+class TestInferenceHistory:
+    def test_history_is_capped_in_one_pipeline(self, cache):
+        """Test results go into a trimmed sorted set without per-result keys"""
+        cache.cache_inference_result('anomaly', {'score': 1}, ttl=60, max_history=100)
+
+        names = [command[0] for command in cache.redis_client.commands]
+        assert names == ['zadd', 'zremrangebyscore', 'zremrangebyrank', 'expire', 'setex']
+        assert cache.redis_client.commands[2] == ('zremrangebyrank', 'inference:v0:history:anomaly', 0, -101)
+
+    def test_history_read_is_bounded(self, cache):
+        """Test history is read with a single limited range query"""
+        cache.redis_client.history = ['{"id": "b", "result": {"score": 2}}', '{"id": "a", "result": {"score": 1}}']
+
+        history = cache.get_inference_history('anomaly', limit=1)
+
+        assert history == [{'score': 2}]
+        assert cache.redis_client.commands == [('zrevrangebyscore', 'inference:v0:history:anomaly', '+inf', 0, 1)]
+
+class TestNamespaces:
+    def test_invalidation_bumps_key_version(self, cache):
+        """Test invalidating a namespace moves its keys to a new version"""
+        assert cache._key('threats', 'indicators') == 'threats:v0:indicators'
+
+        assert cache.invalidate_namespace('threats') == 1
+
+        assert cache._key('threats', 'indicators') == 'threats:v1:indicators'
+        assert cache._key('session', 'abc') == 'session:v0:abc'
+
+    def test_unknown_namespace(self, cache):
+        """Test only known namespaces can be invalidated"""
+        with pytest.raises(ValueError):
+            cache.invalidate_namespace('everything')
+
+class TestEventStreams:
+    def test_publish_appends_to_trimmed_stream(self, cache):
+        """Test events are XADDed with approximate MAXLEN trimming"""
+        assert cache.publish_event('security_alerts', {'id': 1}, maxlen=500) == b'1-0'
+
+        assert cache.redis_client.commands == [('xadd', 'stream:security_alerts', {'data': '{"id": 1}'}, 500, True)]
+
+    def test_only_processed_events_are_acked(self, cache):
+        """Test a failing callback leaves its event pending for retry"""
+        seen = []
+
+        def callback(event):
+            if event['id'] == 2:
+                raise ValueError('bad event')
+            seen.append(event['id'])
+
+        messages = [(b'1-0', {b'data': b'{"id": 1}'}), (b'2-0', {b'data': b'{"id": 2}'}), (b'3-0', {b'data': b'{"id": 3}'})]
+        cache._handle_messages(cache.redis_client, 'default', 'stream:security_alerts', callback, messages)
+
+        assert seen == [1, 3]
+        assert cache.redis_client.commands == [('xack', 'stream:security_alerts', 'default', b'1-0', b'3-0')]
+        assert cache._get_stream_stats()['failed'] == 1
+
+    def test_missing_group_is_recreated(self, cache):
+        """Test the listener recreates a consumer group deleted with its stream"""
+        class NoGroupClient:
+            created = []
+
+            def xreadgroup(self, *args, **kwargs):
+                raise redis.ResponseError('NOGROUP No such key or consumer group')
+
+            def xgroup_create(self, name, group, id='$', mkstream=False):
+                self.created.append((name, group, id, mkstream))
+
+        client = NoGroupClient()
+        cache._stream_handlers = {'default': {'stream:security_alerts': lambda event: None}}
+        cache._streams_reclaimed_at = float('inf')
+
+        cache._poll_streams(client)
+
+        assert client.created == [('stream:security_alerts', 'default', '0', True)]
+
+    def test_reclaim_dead_letters_and_retries(self, cache):
+        """Test idle pending events are retried, and dead-lettered after too many deliveries"""
+        redis_client = cache.redis_client
+        redis_client.stream_entries[b'1-0'] = {b'data': b'{"id": 1}'}
+        redis_client.pending = [
+            {'message_id': b'1-0', 'times_delivered': 5},
+            {'message_id': b'2-0', 'times_delivered': 1}
+        ]
+        redis_client.claimable = [(b'2-0', {b'data': b'{"id": 2}'})]
+        seen = []
+
+        cache._reclaim_pending(redis_client, 'default', 'stream:security_alerts', lambda event: seen.append(event['id']))
+
+        assert ('xadd', 'stream:security_alerts:dead', {b'data': b'{"id": 1}'}, 10000, True) in redis_client.commands
+        assert ('xack', 'stream:security_alerts', 'default', b'1-0') in redis_client.commands
+        assert ('xack', 'stream:security_alerts', 'default', b'2-0') in redis_client.commands
+        assert seen == [2]
+
+class TestClearJob:
+    def test_unlinks_in_batches_and_skips_internal_keys(self, cache):
+        """Test the clear job UNLINKs bounded batches and records progress"""
+        cache._run_clear_job('job1', '*', batch_size=2)
+
+        unlinks = [command[1:] for command in cache.redis_client.commands if command[0] == 'unlink']
+        assert unlinks == [(b'events:v0:realtime', b'session:v0:a'), (b'session:v0:b',)]
+        final = [command[2]['mapping'] for command in cache.redis_client.commands if command[0] == 'hset'][-1]
+        assert final['status'] == 'completed'
+        assert final['scanned'] == 7
+        assert final['deleted'] == 3
+
+class TestRateLimit:
+    def test_denied_request_reports_retry_after(self, cache):
+        """Test the script result is turned into (allowed, seconds to wait)"""
+        calls = []
+        cache._rate_limit_script = lambda keys, args: calls.append((keys, args)) or [0, 1500]
+
+        assert cache.check_rate_limit('guidance:1.2.3.4', 10, 60) == (False, 1.5)
+        assert calls[0][0] == ['ratelimit:guidance:1.2.3.4']
+        assert calls[0][1][1:3] == [60, 10]
+
+    def test_fails_open_without_redis(self):
+        """Test requests are allowed while Redis is unreachable"""
+        cache = CacheManager('redis://localhost:1', socket_timeout=0.1, failure_threshold=1)
+
+        assert cache.check_rate_limit('guidance:1.2.3.4', 10, 60) == (True, 0)
+
+class TestCacheManagerWithoutRedis:
+    def test_dead_redis_fails_fast(self):
+        """Test calls stop reaching Redis once the breaker has tripped"""
+        cache = CacheManager('redis://localhost:1', socket_timeout=0.1, failure_threshold=1)
+
+        assert cache.breaker.state == CircuitBreaker.OPEN
+        assert cache.get_network_stats() is None
+        assert cache.get_many(['a', 'b']) == {'a': None, 'b': None}
+        assert cache.set_many({'a': 1}) is False
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,938 @@
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from psycopg2.pool import PoolError
+import migrations
+import models
+from models import ConnectionPool, DatabaseManager, MetricRollups, MetricWriteBuffer, PartitionManager, PreparedStatements, SecurityEvent, decode_cursor, encode_cursor, next_cursor, select_list, to_vector_literal
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = TRANSACTION_STATUS_IDLE
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query)
+        self.conn.info.transaction_status = TRANSACTION_STATUS_INTRANS
+
+    def fetchone(self):
+        return self.conn.rows.pop(0) if self.conn.rows else None
+
+class FakeConnection:
+    """Minimal stand-in for a psycopg2 connection"""
+    def __init__(self):
+        self.closed = 0
+        self.info = FakeInfo()
+        self.rollbacks = 0
+        self.commits = 0
+        self.executed = []
+        self.rows = []
+        self.autocommit = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def fake_connect(monkeypatch):
+    opened = []
+
+    def connect(dsn, **kwargs):
+        conn = FakeConnection()
+        conn.dsn = dsn
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(models.psycopg2, 'connect', connect)
+    return opened
+
+class TestConnectionPool:
+    def test_reuses_returned_connection(self, fake_connect):
+        """Test that a returned connection is handed out again"""
+        pool = ConnectionPool('postgres://test', max_size=2)
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        assert pool.getconn() is conn
+        assert len(fake_connect) == 1
+        assert pool.get_stats()['checkouts'] == 2
+
+    def test_checkout_times_out_when_exhausted(self, fake_connect):
+        """Test that checkouts beyond max_size wait and then fail"""
+        pool = ConnectionPool('postgres://test', max_size=1, checkout_timeout=0.05)
+        pool.getconn()
+
+        with pytest.raises(PoolError):
+            pool.getconn()
+
+        assert pool.get_stats()['checkout_timeouts'] == 1
+
+    def test_open_transaction_is_rolled_back_on_return(self, fake_connect):
+        """Test that connections go back to the pool without an open transaction"""
+        pool = ConnectionPool('postgres://test')
+        conn = pool.getconn()
+        conn.info.transaction_status = TRANSACTION_STATUS_INTRANS
+
+        pool.putconn(conn)
+
+        assert conn.rollbacks == 1
+
+    def test_closed_connection_is_replaced(self, fake_connect):
+        """Test that a connection closed while idle is discarded on checkout"""
+        pool = ConnectionPool('postgres://test', max_size=1)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.close()
+
+        replacement = pool.getconn()
+
+        assert replacement is not conn
+        assert pool.get_stats()['size'] == 1
+
+    def test_idle_connections_are_recycled(self, fake_connect):
+        """Test that connections idle past max_idle are closed down to min_size"""
+        pool = ConnectionPool('postgres://test', min_size=1, max_size=3, max_idle=0)
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+
+        stats = pool.get_stats()
+        assert stats['size'] == 1
+        assert stats['connections_recycled'] == 1
+
+class TestUnitOfWork:
+    def test_writes_share_one_transaction(self, fake_connect):
+        """Test model writes in a unit of work use savepoints and commit once"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        db.begin_unit_of_work()
+
+        with db.connection() as first:
+            first.commit()
+        with db.connection() as second:
+            second.commit()
+        assert first._conn is second._conn
+        assert first._conn.commits == 0
+
+        assert db.end_unit_of_work() is True
+        assert first._conn.commits == 1
+        assert first._conn.executed[-4:] == [
+            'SAVEPOINT unit_of_work_1', 'RELEASE SAVEPOINT unit_of_work_1',
+            'SAVEPOINT unit_of_work_2', 'RELEASE SAVEPOINT unit_of_work_2'
+        ]
+
+    def test_failed_write_rolls_back_to_savepoint(self, fake_connect):
+        """Test a model rollback only undoes its own savepoint"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        db.begin_unit_of_work()
+
+        with db.connection() as conn:
+            conn.rollback()
+        db.end_unit_of_work()
+
+        assert 'ROLLBACK TO SAVEPOINT unit_of_work_1' in conn._conn.executed
+        assert conn._conn.rollbacks == 0
+        assert conn._conn.commits == 1
+
+    def test_after_commit_callbacks_wait_for_commit(self, fake_connect):
+        """Test side effects run after a successful commit and are dropped on rollback"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        ran = []
+
+        db.begin_unit_of_work()
+        with db.connection() as conn:
+            conn.commit()
+        db.after_commit(lambda: ran.append(conn._conn.commits))
+        assert ran == []
+        db.end_unit_of_work()
+        assert ran == [1]
+
+        db.begin_unit_of_work()
+        with db.connection() as conn:
+            conn.commit()
+        db.after_commit(lambda: ran.append('rolled back'))
+        db.end_unit_of_work(commit=False)
+        assert ran == [1]
+
+    def test_after_commit_outside_unit_runs_immediately(self, fake_connect):
+        """Test callbacks registered without a unit of work are not deferred"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        ran = []
+
+        db.after_commit(lambda: ran.append(True))
+
+        assert ran == [True]
+
+    def test_readonly_connections_do_not_join(self, fake_connect):
+        """Test reads (e.g. streaming exports) keep their own connection"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        db.begin_unit_of_work()
+
+        with db.connection(readonly=True) as conn:
+            assert not hasattr(conn, '_conn')
+        db.end_unit_of_work()
+
+class TestReplicaRouting:
+    def test_readonly_uses_replica_within_lag(self, fake_connect):
+        """Test read-only connections go to a replica that is caught up"""
+        db = DatabaseManager('postgres://primary', replica_url='postgres://replica', max_replica_lag=30)
+        db._measure_replica_lag = lambda: 2.0
+
+        with db.connection(readonly=True) as conn:
+            assert conn.dsn == 'postgres://replica'
+        with db.connection(readonly=False) as conn:
+            assert conn.dsn == 'postgres://primary'
+
+    def test_lagging_replica_falls_back_to_primary(self, fake_connect):
+        """Test reads go to the primary while the replica is too far behind"""
+        db = DatabaseManager('postgres://primary', replica_url='postgres://replica', max_replica_lag=30)
+        db._measure_replica_lag = lambda: 120.0
+
+        with db.connection(readonly=True) as conn:
+            assert conn.dsn == 'postgres://primary'
+        assert db.get_pool_stats()['replica']['lag_seconds'] == 120.0
+
+    def replica_reporting(self, db, row):
+        db._primary_wal_lsn = lambda: '0/3000060'
+        conn = db.replica_pool.getconn()
+        conn.rows = [row]
+        db.replica_pool.putconn(conn)
+
+    def test_replica_past_primary_position_has_no_lag(self, fake_connect):
+        """Test a streaming replica that replayed past the primary's LSN counts as caught up"""
+        db = DatabaseManager('postgres://primary', replica_url='postgres://replica', check_schema=False)
+        self.replica_reporting(db, (True, 'streaming', True, 900.0))
+
+        assert db._measure_replica_lag() == 0.0
+
+    def test_replica_without_wal_receiver_is_unhealthy(self, fake_connect):
+        """Test a replica whose WAL receiver is gone is not used even if replay looks caught up"""
+        db = DatabaseManager('postgres://primary', replica_url='postgres://replica', check_schema=False)
+        self.replica_reporting(db, (False, None, False, 5.0))
+
+        assert db._measure_replica_lag() is None
+
+    def test_behind_replica_reports_replay_age(self, fake_connect):
+        """Test lag is the age of the last replayed transaction while behind the primary"""
+        db = DatabaseManager('postgres://primary', replica_url='postgres://replica', check_schema=False)
+        self.replica_reporting(db, (True, 'streaming', False, 42.0))
+
+        assert db._measure_replica_lag() == 42.0
+
+    def test_no_replica_configured(self, fake_connect):
+        """Test read-only connections use the primary without a replica"""
+        db = DatabaseManager('postgres://primary')
+
+        with db.connection(readonly=True) as conn:
+            assert conn.dsn == 'postgres://primary'
+        assert 'replica' not in db.get_pool_stats()
+
+class TestMigrations:
+    def test_versions_are_sequential(self):
+        """Test migrations are numbered 1..N with no gaps or duplicates"""
+        versions = [version for version, _, _ in migrations.MIGRATIONS]
+
+        assert versions == list(range(1, len(versions) + 1))
+        assert migrations.LATEST_VERSION == versions[-1]
+
+    def test_advisory_lock_ids_are_distinct(self):
+        """Test every advisory lock the app takes has its own id"""
+        ids = [value for name, value in vars(migrations).items() if name.endswith('LOCK_ID')]
+
+        assert len(ids) == 4
+        assert len(set(ids)) == len(ids)
+        assert DatabaseManager.VECTOR_INDEX_LOCK_ID == migrations.VECTOR_INDEX_LOCK_ID
+        assert models.MetricRollups.ADVISORY_LOCK_ID == migrations.ROLLUP_LOCK_ID
+        assert models.PartitionManager.ADVISORY_LOCK_ID == migrations.PARTITION_LOCK_ID
+
+    def test_workers_do_not_migrate_by_default(self, fake_connect, monkeypatch):
+        """Test that constructing a DatabaseManager runs no DDL unless asked to"""
+        monkeypatch.setattr(models, 'run_migrations', lambda db: pytest.fail('migrations ran at boot'))
+
+        db = DatabaseManager('postgres://test')
+
+        assert db.schema_version is None
+
+def render(query):
+    """Readable text of a psycopg2.sql composition, without a connection"""
+    if isinstance(query, sql.Composed):
+        return ''.join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in query.strings)
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    if isinstance(query, sql.SQL):
+        return query.string
+    return query
+
+class ScriptedCursor:
+    """Cursor answering queries from a list of (substring, rows) rules"""
+    def __init__(self, rules):
+        self.rules = rules
+        self.executed = []
+        self.rows = []
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        query = render(query)
+        self.executed.append((' '.join(query.split()), params))
+        self.rows = []
+        for fragment, rows in self.rules:
+            if fragment in query and (not callable(rows) or rows(params) is not None):
+                if isinstance(rows, Exception):
+                    raise rows
+                self.rows = rows(params) if callable(rows) else rows
+                break
+        self.rowcount = len(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+class ScriptedDatabase:
+    """db_manager stand-in whose only connection answers from a ScriptedCursor"""
+    def __init__(self, cursor):
+        self.cur = cursor
+        self.commits = 0
+        self.rollbacks = 0
+
+    @contextmanager
+    def connection(self, readonly=False):
+        yield self
+
+    def cursor(self, *args, **kwargs):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+class TestBulkEventInsert:
+    def test_staging_table_is_dropped_after_each_batch(self):
+        """Test two bulk inserts in one transaction do not collide on the staging table"""
+        class CopyCursor(ScriptedCursor):
+            def copy_expert(self, query, buffer):
+                self.executed.append((query, buffer.read()))
+
+        cur = CopyCursor([('RETURNING id', [(1,), (2,)])])
+        events = SecurityEvent(ScriptedDatabase(cur))
+
+        assert events.create_events([{'event_type': 'port_scan'}, {'event_type': 'port_scan'}]) == [1, 2]
+        assert events.create_events([{'event_type': 'port_scan'}]) == [1, 2]
+
+        statements = [query for query, _ in cur.executed]
+        creates = [i for i, q in enumerate(statements) if q.startswith('CREATE TEMP TABLE security_events_staging')]
+        drops = [i for i, q in enumerate(statements) if q == 'DROP TABLE security_events_staging']
+        assert len(creates) == len(drops) == 2
+        assert creates[0] < drops[0] < creates[1] < drops[1]
+
+class TestLegacyPartitioning:
+    def rules(self, kinds):
+        return [
+            ('SELECT relkind', lambda params: [(kinds[params[0]],)] if kinds.get(params[0]) else []),
+            ('SELECT conname', [('security_events_pkey',)]),
+            ('SELECT MAX(timestamp)', [(None,)]),
+            ('information_schema.columns', [('id',), ('timestamp',), ('event_type',)]),
+        ]
+
+    def test_plain_table_is_converted(self):
+        """Test a pre-partitioning table is renamed, copied into the partitioned table and dropped"""
+        cur = ScriptedCursor(self.rules({'security_events': 'r'}))
+
+        migrations._baseline_schema(cur)
+
+        statements = [query for query, _ in cur.executed]
+        rename = statements.index('ALTER TABLE security_events RENAME TO security_events_legacy')
+        create = next(i for i, q in enumerate(statements) if q.startswith('CREATE TABLE IF NOT EXISTS security_events ('))
+        copy = statements.index('INSERT INTO security_events (id, timestamp, event_type) '
+                                'SELECT id, COALESCE(timestamp, CURRENT_TIMESTAMP), event_type FROM security_events_legacy')
+        drop = statements.index('DROP TABLE security_events_legacy')
+        index = next(i for i, q in enumerate(statements) if 'idx_security_events_timestamp ' in q)
+        assert rename < create < copy < drop < index
+        assert 'ALTER TABLE security_events_legacy RENAME CONSTRAINT "security_events_pkey" TO security_events_legacy_pkey' in statements
+        assert not any('network_analytics_legacy' in q for q in statements)
+
+    def test_unexpected_relation_fails_clearly(self):
+        """Test a non-table relation in the way aborts with a clear message"""
+        cur = ScriptedCursor(self.rules({'network_analytics': 'v'}))
+
+        with pytest.raises(RuntimeError, match='network_analytics'):
+            migrations._baseline_schema(cur)
+
+class TestSourceIpMigration:
+    def test_index_is_built_concurrently_per_partition(self):
+        """Test the source IP index is an expression index built outside the migration transaction"""
+        autocommit = []
+
+        class RecordingCursor(ScriptedCursor):
+            def execute(self, query, params=None):
+                autocommit.append(self.connection.autocommit)
+                super().execute(query, params)
+
+        cur = RecordingCursor([
+            ('SELECT relkind', [('p',)]),
+            ('pg_inherits', [('network_analytics_p20240101',)]),
+        ])
+        cur.connection = FakeConnection()
+
+        migrations._network_analytics_source_ip(cur)
+
+        statements = [query for query, _ in cur.executed]
+        assert not any('ALTER TABLE' in q for q in statements)
+        assert 'CREATE INDEX CONCURRENTLY IF NOT EXISTS "network_analytics_p20240101_name_period_source_ip_timestamp_id" ' \
+               'ON "network_analytics_p20240101" (metric_name, period, (tags->>\'source_ip\'), timestamp DESC, id DESC)' in statements
+        assert all(autocommit)
+        assert cur.connection.autocommit is False
+
+class TestHalfvecMigration:
+    def cursor(self, column_types):
+        cur = ScriptedCursor([
+            ('FROM pg_attribute', lambda params: [column_types[params[0]]]),
+            ('SELECT MIN(id), MAX(id)', [(1, 25000)]),
+        ])
+        cur.connection = FakeConnection()
+        return cur
+
+    def test_tables_are_converted_online_in_batches(self, monkeypatch):
+        """Test embeddings are backfilled into a new column in committed batches, then swapped in"""
+        monkeypatch.setattr(migrations, 'HALFVEC_BATCH_SIZE', 10000)
+        cur = self.cursor({
+            'security_events': ('vector(1024)', False),
+            'network_analytics': ('halfvec(1024)', False),
+            'traffic_embeddings': ('halfvec(1024)', True),
+            'claude_guidance_responses': ('halfvec(1024)', True),
+        })
+
+        migrations._halfvec_embeddings(cur)
+
+        statements = [query for query, _ in cur.executed]
+        assert not any('ALTER COLUMN embedding TYPE' in q for q in statements)
+        assert not any('network_analytics' in q for q in statements if 'pg_attribute' not in q)
+        backfills = [params for query, params in cur.executed if query.startswith('UPDATE security_events')]
+        assert backfills == [(1, 10001), (10001, 20001), (20001, 30001)]
+        add = statements.index('ALTER TABLE security_events ADD COLUMN IF NOT EXISTS embedding_half halfvec(1024)')
+        drop = statements.index('ALTER TABLE security_events DROP COLUMN embedding')
+        rename = statements.index('ALTER TABLE security_events RENAME COLUMN embedding_half TO embedding')
+        assert add < drop < rename
+        assert cur.connection.commits >= 5
+
+    def test_not_null_is_restored_without_a_locked_scan(self):
+        """Test NOT NULL columns are re-constrained through a validated CHECK"""
+        cur = self.cursor({
+            'security_events': ('halfvec(1024)', False),
+            'network_analytics': ('halfvec(1024)', False),
+            'traffic_embeddings': ('vector(1024)', True),
+            'claude_guidance_responses': ('halfvec(1024)', True),
+        })
+
+        migrations._halfvec_embeddings(cur)
+
+        statements = [query for query, _ in cur.executed]
+        validate = statements.index('ALTER TABLE traffic_embeddings VALIDATE CONSTRAINT traffic_embeddings_embedding_half_not_null')
+        rename = statements.index('ALTER TABLE traffic_embeddings RENAME COLUMN embedding_half TO embedding')
+        not_null = statements.index('ALTER TABLE traffic_embeddings ALTER COLUMN embedding SET NOT NULL')
+        assert validate < rename < not_null
+
+class TestVectorIndexBuild:
+    def method(self):
+        return sql.SQL("USING hnsw (embedding halfvec_cosine_ops)")
+
+    def test_plain_table_is_indexed_concurrently(self, fake_connect):
+        """Test ANN indexes on ordinary tables do not block writes while building"""
+        cur = ScriptedCursor([])
+
+        migrations.create_index_concurrently(cur, 'traffic_embeddings', 'idx_traffic_embeddings_embedding_hnsw',
+                                      self.method(), partitioned=False)
+
+        assert [query for query, _ in cur.executed] == [
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_traffic_embeddings_embedding_hnsw" '
+            'ON "traffic_embeddings" USING hnsw (embedding halfvec_cosine_ops)'
+        ]
+
+    def test_partitioned_table_is_indexed_per_partition(self, fake_connect):
+        """Test partitioned tables get a parent index attached from concurrent partition builds"""
+        cur = ScriptedCursor([('pg_inherits', [('security_events_p20240101',), ('security_events_default',)])])
+
+        migrations.create_index_concurrently(cur, 'security_events', 'idx_security_events_embedding_hnsw',
+                                      self.method(), partitioned=True)
+
+        statements = [query for query, _ in cur.executed if 'indisvalid' not in query]
+        assert statements[0].startswith('CREATE INDEX IF NOT EXISTS "idx_security_events_embedding_hnsw" ON ONLY "security_events"')
+        assert statements[2].startswith('CREATE INDEX CONCURRENTLY IF NOT EXISTS "security_events_p20240101_embedding_hnsw" '
+                                        'ON "security_events_p20240101"')
+        assert statements[3] == ('ALTER INDEX "idx_security_events_embedding_hnsw" '
+                                 'ATTACH PARTITION "security_events_p20240101_embedding_hnsw"')
+        assert statements[5] == ('ALTER INDEX "idx_security_events_embedding_hnsw" '
+                                 'ATTACH PARTITION "security_events_default_embedding_hnsw"')
+
+    def test_builds_run_outside_a_transaction(self, fake_connect, monkeypatch):
+        """Test the build switches the connection to autocommit and back"""
+        db = DatabaseManager('postgres://test', check_schema=False)
+        seen = []
+        monkeypatch.setattr(models, 'is_partitioned', lambda cur, table: seen.append(cur.conn.autocommit) or False)
+
+        conn = db.pool.getconn()
+        conn.rows = [(True,)]
+        db.pool.putconn(conn)
+        db.build_vector_indexes(index_type='hnsw')
+
+        assert seen and all(seen)
+        assert conn.autocommit is False
+
+    def test_partitioned_tables_get_hnsw_for_ivfflat(self, fake_connect, monkeypatch):
+        """Test ivfflat is only trained on ordinary tables; partitioned ones get HNSW"""
+        db = DatabaseManager('postgres://test', check_schema=False, vector_index='ivfflat')
+        created = []
+        monkeypatch.setattr(models, 'is_partitioned', lambda cur, table: table in migrations.PARTITIONED_TABLES)
+        monkeypatch.setattr(models, 'index_valid', lambda cur, name: None)
+        monkeypatch.setattr(models, 'drop_index', lambda cur, name, partitioned: None)
+        monkeypatch.setattr(models, 'create_index_concurrently',
+                            lambda cur, table, name, method, partitioned: created.append(name))
+
+        conn = db.pool.getconn()
+        conn.rows = [(True,), (5000,), (5000,)]
+        db.pool.putconn(conn)
+        db.build_vector_indexes()
+
+        assert created == [
+            'idx_security_events_embedding_hnsw',
+            'idx_network_analytics_embedding_hnsw',
+            'idx_traffic_embeddings_embedding',
+            'idx_claude_guidance_embedding'
+        ]
+
+class TestVectorSearchSettings:
+    def test_ef_search_covers_limit(self, fake_connect):
+        """Test ef_search is raised so HNSW can return `limit` candidates"""
+        db = DatabaseManager('postgres://test', hnsw_ef_search=40, ivfflat_probes=10)
+
+        assert db.vector_search_settings(10) == "SET LOCAL hnsw.ef_search = 40; SET LOCAL ivfflat.probes = 10;"
+        assert 'hnsw.ef_search = 100;' in db.vector_search_settings(100)
+
+    def test_per_query_overrides(self, fake_connect):
+        """Test per-query tuning overrides the defaults"""
+        db = DatabaseManager('postgres://test')
+
+        settings = db.vector_search_settings(5, ef_search=200, probes=25)
+
+        assert 'hnsw.ef_search = 200;' in settings
+        assert 'ivfflat.probes = 25;' in settings
+
+    def test_ef_search_is_capped_at_pgvector_maximum(self, fake_connect):
+        """Test large limits or overrides never produce an ef_search pgvector rejects"""
+        db = DatabaseManager('postgres://test')
+
+        assert 'hnsw.ef_search = 1000;' in db.vector_search_settings(4000)
+        assert 'hnsw.ef_search = 1000;' in db.vector_search_settings(5, ef_search=5000)
+
+    def test_halfvec_query_uses_cosine_distance(self, fake_connect):
+        """Test halfvec storage orders candidates by cosine distance with no over-fetch"""
+        db = DatabaseManager('postgres://test', vector_storage='halfvec')
+
+        query, params = db.nearest_query('traffic_embeddings', [0.5, 0.5], limit=10, similarity_threshold=0.75)
+
+        assert 'ORDER BY embedding <=> %(embedding)s::halfvec(1024)' in query
+        assert params['candidates'] == 10
+        assert params['max_distance'] == 0.25
+        assert params['embedding'] == '[0.5,0.5]'
+
+    def test_binary_query_reranks_candidates(self, fake_connect):
+        """Test binary storage over-fetches by Hamming distance, then re-ranks"""
+        db = DatabaseManager('postgres://test', vector_storage='binary', rerank_factor=4)
+
+        query, params = db.nearest_query('claude_guidance_responses', [0.5], limit=5,
+                                         conditions="AND status = 'active'")
+
+        assert '<~> binary_quantize(' in query
+        assert params['candidates'] == 20
+        assert params['limit'] == 5
+        assert 'SET LOCAL' not in query
+
+    def test_unknown_storage_mode(self, fake_connect):
+        """Test an unsupported storage mode is rejected up front"""
+        with pytest.raises(ValueError):
+            DatabaseManager('postgres://test', vector_storage='int8')
+
+class PreparingCursor(FakeCursor):
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.connection = conn
+        self.calls = []
+
+    def execute(self, query, params=None):
+        self.calls.append((query, params))
+
+class TestPreparedStatements:
+    def test_prepares_once_per_connection(self):
+        """Test a statement is PREPAREd on first use and EXECUTEd afterwards"""
+        conn = FakeConnection()
+        conn.prepared = set()
+        cur = PreparingCursor(conn)
+        statements = PreparedStatements()
+
+        statements.execute(cur, 'lookup', "SELECT * FROM t WHERE a = %s AND b = %s", ['x', 2])
+        statements.execute(cur, 'lookup', "SELECT * FROM t WHERE a = %s AND b = %s", ['y', 3])
+
+        assert cur.calls == [
+            ("PREPARE lookup AS SELECT * FROM t WHERE a = $1 AND b = $2", None),
+            ("EXECUTE lookup (%s, %s)", ['x', 2]),
+            ("EXECUTE lookup (%s, %s)", ['y', 3])
+        ]
+        stats = statements.get_stats()['lookup']
+        assert stats['calls'] == 2
+        assert stats['prepares'] == 1
+
+    def test_named_placeholders_are_numbered_once(self):
+        """Test a repeated named parameter maps to a single $n"""
+        conn = FakeConnection()
+        conn.prepared = set()
+        cur = PreparingCursor(conn)
+
+        PreparedStatements().execute(cur, 'nearest', "SELECT %(v)s, %(k)s, %(v)s", {'k': 5, 'v': 'q'})
+
+        assert cur.calls[0][0] == "PREPARE nearest AS SELECT $1, $2, $1"
+        assert cur.calls[1] == ("EXECUTE nearest (%s, %s)", ['q', 5])
+
+    def test_plain_execute_without_prepared_connection(self):
+        """Test connections that cannot track statements fall back to a plain execute"""
+        cur = PreparingCursor(FakeConnection())
+
+        PreparedStatements().execute(cur, 'lookup', "SELECT %s", [1])
+
+        assert cur.calls == [("SELECT %s", [1])]
+
+    def test_filter_shapes_are_enumerable(self):
+        """Test each filter combination maps to its own statement name"""
+        assert SecurityEvent._filter_shape(None) == 0
+        assert SecurityEvent._filter_shape({'severity': 'high', 'end_time': 'x'}) == 0b100001
+        assert SecurityEvent._filter_shape({}, cursor='abc') == 0b1000000
+
+class TestSecurityEventRows:
+    def test_vector_literal(self):
+        """Test embeddings are rendered in pgvector text format"""
+        assert to_vector_literal([0.5, 1, -2.25]) == '[0.5,1.0,-2.25]'
+        assert to_vector_literal(None) is None
+
+    def test_event_row_matches_insert_columns(self):
+        """Test rows line up with the INSERT column list and apply defaults"""
+        row = SecurityEvent._event_row({'event_type': 'port_scan', 'embedding': [0.1]})
+        values = dict(zip(SecurityEvent.INSERT_COLUMNS, row))
+
+        assert len(row) == len(SecurityEvent.INSERT_COLUMNS)
+        assert values['severity'] == 'medium'
+        assert values['risk_score'] == 0
+        assert values['threat_indicators'] == '[]'
+        assert values['embedding'] == '[0.1]'
+
+class TestColumnProjection:
+    def test_default_columns_leave_out_embedding(self):
+        """Test embeddings are not selected unless requested"""
+        assert 'embedding' not in SecurityEvent.COLUMNS
+        assert select_list(('id', 'timestamp', 'severity')) == 'id, timestamp, severity'
+
+    def test_fields_pick_columns_and_keep_sort_key(self):
+        """Test requested fields are selected along with the keyset columns"""
+        columns = select_list(SecurityEvent.COLUMNS, ['severity', 'embedding'], required=('id', 'timestamp'))
+
+        assert columns == 'id, timestamp, severity, embedding'
+
+    def test_unknown_field(self):
+        """Test unknown field names are rejected"""
+        with pytest.raises(ValueError):
+            select_list(SecurityEvent.COLUMNS, ['severity; DROP TABLE security_events'])
+
+class TestKeysetCursor:
+    def test_cursor_round_trip(self):
+        """Test page tokens decode back to the row's sort key"""
+        row = {'timestamp': datetime(2025, 1, 2, 3, 4, 5, 678), 'id': 42}
+
+        assert decode_cursor(encode_cursor(row)) == (row['timestamp'], 42)
+
+    def test_invalid_cursor(self):
+        """Test malformed tokens raise ValueError"""
+        with pytest.raises(ValueError):
+            decode_cursor('not-a-cursor')
+
+    def test_next_cursor_only_for_full_pages(self):
+        """Test a short page signals the end of the results"""
+        rows = [{'timestamp': datetime(2025, 1, 2), 'id': i} for i in (3, 2)]
+
+        assert next_cursor(rows, limit=2) == encode_cursor(rows[-1])
+        assert next_cursor(rows, limit=5) is None
+
+class TestIndicatorCheck:
+    def test_prepared_lookup_selects_explicit_columns(self):
+        """Test the prepared indicator lookup names its columns instead of SELECT *"""
+        class PreparingDatabase(ScriptedDatabase):
+            def execute_prepared(self, cur, name, query, params=()):
+                cur.execute(query, params)
+
+        cur = ScriptedCursor([('FROM threat_intelligence', [{'id': 7, 'indicator_value': '203.0.113.7'}])])
+        record = models.ThreatIntelligence(PreparingDatabase(cur)).check_indicator('203.0.113.7')
+
+        assert record == {'id': 7, 'indicator_value': '203.0.113.7'}
+        query, params = cur.executed[0]
+        assert query.startswith('SELECT id, indicator_type, indicator_value, confidence_level, threat_category, source FROM')
+        assert params == ['203.0.113.7']
+
+class TestPartitionManager:
+    def test_partition_names_round_trip(self):
+        """Test daily partition names encode and decode their day"""
+        name = PartitionManager.partition_name('security_events', date(2025, 3, 9))
+
+        assert name == 'security_events_p20250309'
+        assert PartitionManager._partition_day('security_events', name) == date(2025, 3, 9)
+
+    def test_default_partition_has_no_day(self):
+        """Test the catch-all partition is never treated as expired"""
+        assert PartitionManager._partition_day('network_analytics', 'network_analytics_default') is None
+
+    def test_retention_overrides(self):
+        """Test per-table retention can be overridden"""
+        manager = PartitionManager(None, retention_days={'network_analytics': 7})
+
+        assert manager.retention_days == {'security_events': 90, 'network_analytics': 7}
+
+class TestPartitionMaintenance:
+    def rules(self, partitions=(), failing=None):
+        rules = [
+            ('pg_try_advisory_xact_lock', [(True,)]),
+            ('SELECT relname, relkind FROM pg_class', [('security_events', 'p')]),
+            ('FROM pg_inherits', [(name,) for name in partitions]),
+        ]
+        if failing:
+            rules.insert(0, (failing, psycopg2.errors.LockNotAvailable('canceling statement due to lock timeout')))
+        return rules
+
+    def test_creates_missing_upcoming_partitions(self):
+        """Test today's and the next days_ahead partitions are created, skipping existing ones"""
+        cur = ScriptedCursor(self.rules(partitions=['security_events_p20250101', 'security_events_default']))
+        manager = PartitionManager(ScriptedDatabase(cur), days_ahead=2)
+
+        created = manager.ensure_partitions(today=date(2025, 1, 1))
+
+        assert created == ['security_events_p20250102', 'security_events_p20250103']
+        bounds = [params for query, params in cur.executed if 'PARTITION OF' in query]
+        assert bounds == [(date(2025, 1, 2), date(2025, 1, 3)), (date(2025, 1, 3), date(2025, 1, 4))]
+
+    def test_only_partitions_past_retention_are_dropped(self):
+        """Test retention drops whole expired days and never the default partition"""
+        cur = ScriptedCursor(self.rules(partitions=[
+            'security_events_default',
+            'security_events_p20241001',
+            'security_events_p20241002',
+            'security_events_p20241003',
+            'security_events_p20250101',
+        ]))
+        manager = PartitionManager(ScriptedDatabase(cur), retention_days={'security_events': 90})
+
+        dropped = manager.drop_expired_partitions(today=date(2024, 12, 31))
+
+        # Cutoff is 2024-10-02: that day and later are kept
+        assert dropped == ['security_events_p20241001']
+        assert not any('security_events_default' in query for query, _ in cur.executed if 'DROP' in query)
+
+    def test_unpartitioned_tables_are_skipped(self):
+        """Test maintenance leaves a table that was never converted alone"""
+        cur = ScriptedCursor([
+            ('pg_try_advisory_xact_lock', [(True,)]),
+            ('SELECT relname, relkind FROM pg_class', [('security_events', 'r')]),
+        ])
+        manager = PartitionManager(ScriptedDatabase(cur))
+
+        assert manager.ensure_partitions(today=date(2025, 1, 1)) == []
+        assert manager.drop_expired_partitions(today=date(2025, 1, 1)) == []
+        assert not any('PARTITION OF' in query or 'DROP' in query for query, _ in cur.executed)
+
+    def test_skipped_when_another_worker_holds_the_lock(self):
+        """Test maintenance does nothing without the advisory lock"""
+        cur = ScriptedCursor([('pg_try_advisory_xact_lock', [(False,)])])
+        manager = PartitionManager(ScriptedDatabase(cur))
+
+        assert manager.run_maintenance() == {'created': [], 'dropped': []}
+        assert all('advisory' in query for query, _ in cur.executed)
+
+    def test_failed_partition_does_not_block_the_others(self):
+        """Test a partition that cannot be created is skipped and the rest are still created"""
+        cur = ScriptedCursor(self.rules(failing='"security_events_p20250102" PARTITION OF'))
+        db = ScriptedDatabase(cur)
+        manager = PartitionManager(db, days_ahead=2)
+
+        created = manager.ensure_partitions(today=date(2025, 1, 1))
+
+        assert created == ['security_events_p20250101', 'security_events_p20250103']
+        statements = [query for query, _ in cur.executed]
+        assert statements.count('ROLLBACK TO SAVEPOINT partition_ddl') == 1
+        assert db.commits == 1
+
+    def test_drops_wait_at_most_lock_timeout(self):
+        """Test partition drops give up after lock_timeout and leave the partition for the next run"""
+        cur = ScriptedCursor(self.rules(
+            partitions=['security_events_p20240101', 'security_events_p20240102'],
+            failing='DROP TABLE IF EXISTS "security_events_p20240101"'))
+        db = ScriptedDatabase(cur)
+        manager = PartitionManager(db, lock_timeout='2s')
+
+        dropped = manager.drop_expired_partitions(today=date(2025, 1, 1))
+
+        assert dropped == ['security_events_p20240102']
+        assert ('SET LOCAL lock_timeout = %s', ('2s',)) in cur.executed
+        assert db.commits == 1
+
+class TestMetricRollups:
+    def test_rollup_periods_are_date_trunc_units(self):
+        """Test every rollup period is a valid date_trunc field"""
+        assert set(MetricRollups.PERIODS) <= {'minute', 'hour', 'day', 'week', 'month'}
+
+    def test_finer_periods_expire_sooner(self):
+        """Test minute buckets are kept for less time than hour buckets"""
+        assert MetricRollups.PERIODS['minute'] < MetricRollups.PERIODS['hour']
+        assert MetricRollups.PERIODS['day'] is None
+
+class TestMetricRollupRuns:
+    WATERMARK = datetime(2025, 1, 1, 12, 0)
+
+    def run(self, watermark=WATERMARK, settled=WATERMARK + timedelta(minutes=10), locked=True,
+            first_row=None, **kwargs):
+        cur = ScriptedCursor([
+            ('pg_try_advisory_xact_lock', [(locked,)]),
+            ('SELECT watermark FROM rollup_watermarks', [(watermark,)] if watermark else []),
+            ('SELECT MIN(timestamp) FROM network_analytics', [(first_row,)]),
+            ('SELECT LOCALTIMESTAMP', [(settled,)]),
+        ])
+        db = ScriptedDatabase(cur)
+        return MetricRollups(db, **kwargs).run(), cur, db
+
+    @staticmethod
+    def rollup_windows(cur):
+        return [params for query, params in cur.executed if query.startswith('INSERT INTO network_analytics_rollups')]
+
+    def test_watermark_advances_to_settled_time(self):
+        """Test a run rolls up every period from the watermark to now - settle_lag and stores the new watermark"""
+        end = self.WATERMARK + timedelta(minutes=10)
+        result, cur, db = self.run(settle_lag=30)
+
+        assert result == {'window_start': self.WATERMARK.isoformat(), 'window_end': end.isoformat()}
+        assert ("SELECT LOCALTIMESTAMP - %s * INTERVAL '1 second'", (30,)) in cur.executed
+        assert self.rollup_windows(cur) == [(period, period, self.WATERMARK, end) for period in MetricRollups.PERIODS]
+        watermark = next(params for query, params in cur.executed if query.startswith('INSERT INTO rollup_watermarks'))
+        assert watermark == (MetricRollups.WATERMARK_NAME, end)
+        assert db.commits == 1
+
+    def test_nothing_settled_since_watermark(self):
+        """Test rows newer than settle_lag are left for a later run"""
+        result, cur, db = self.run(settled=self.WATERMARK)
+
+        assert result is None
+        assert self.rollup_windows(cur) == []
+        assert not any(query.startswith('INSERT INTO rollup_watermarks') for query, _ in cur.executed)
+
+    def test_window_is_capped_at_max_window(self):
+        """Test a long backlog is rolled up in max_window steps"""
+        result, cur, _ = self.run(settled=self.WATERMARK + timedelta(days=2), max_window=timedelta(hours=1))
+
+        assert result['window_end'] == (self.WATERMARK + timedelta(hours=1)).isoformat()
+
+    def test_skipped_when_another_worker_holds_the_lock(self):
+        """Test a run that cannot take the advisory lock does nothing"""
+        result, cur, db = self.run(locked=False)
+
+        assert result is None
+        assert len(cur.executed) == 1
+        assert db.commits == 0
+
+    def test_first_run_starts_at_oldest_raw_row(self):
+        """Test the first run starts from the oldest realtime row, and an empty table is a no-op"""
+        first_row = self.WATERMARK - timedelta(minutes=5)
+        result, _, _ = self.run(watermark=None, first_row=first_row)
+        assert result['window_start'] == first_row.isoformat()
+
+        result, cur, _ = self.run(watermark=None, first_row=None)
+        assert result is None
+        assert self.rollup_windows(cur) == []
+
+class TestMetricReads:
+    def test_coarse_periods_read_rollups(self):
+        """Test hour/minute/day metrics come from the rollup table and realtime from raw rows"""
+        cur = ScriptedCursor([('FROM network_analytics', [{'id': 1}])])
+        analytics = models.NetworkAnalytics(ScriptedDatabase(cur))
+
+        assert analytics.get_metrics('bandwidth', period='hour') == [{'id': 1}]
+        assert analytics.get_metrics('bandwidth', period='realtime') == [{'id': 1}]
+
+        hourly, realtime = [query for query, _ in cur.executed]
+        assert 'FROM network_analytics_rollups' in hourly
+        assert 'ORDER BY bucket_start DESC, id DESC' in hourly
+        assert 'FROM network_analytics WHERE' in realtime
+        assert 'ORDER BY timestamp DESC, id DESC' in realtime
+
+class RecordingAnalytics:
+    """Collects batches passed to record_metrics"""
+    def __init__(self):
+        self.batches = []
+
+    def record_metrics(self, batch):
+        self.batches.append(batch)
+        return len(batch)
+
+class TestMetricWriteBuffer:
+    def test_close_flushes_queued_metrics_in_batches(self):
+        """Test that queued metrics are written in batches on shutdown"""
+        analytics = RecordingAnalytics()
+        buffer = MetricWriteBuffer(analytics, batch_size=2, flush_interval=60)
+        buffer._ensure_started = lambda: None  # keep the flusher thread out of the way
+
+        for value in range(5):
+            buffer.enqueue({'metric_name': 'test_metric', 'metric_value': value})
+        buffer.close()
+
+        assert [len(batch) for batch in analytics.batches] == [2, 2, 1]
+        assert all('timestamp' in metric for batch in analytics.batches for metric in batch)
+        assert buffer.get_stats()['flushed'] == 5
+
+    def test_full_queue_writes_synchronously(self):
+        """Test backpressure falls back to a synchronous write"""
+        analytics = RecordingAnalytics()
+        buffer = MetricWriteBuffer(analytics, max_size=1, put_timeout=0)
+        buffer._ensure_started = lambda: None
+
+        buffer.enqueue({'metric_name': 'first', 'metric_value': 1})
+        buffer.enqueue({'metric_name': 'second', 'metric_value': 2})
+
+        assert analytics.batches[0][0]['metric_name'] == 'second'
+        assert buffer.get_stats()['sync_writes'] == 1
+
+if __name__ == '__main__':
+    pytest.main([__file__])
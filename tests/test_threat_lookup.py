@@ -0,0 +1,140 @@
+import pytest
+from threat_lookup import BloomFilter, ThreatLookup
+
+class FakeThreatIntelligence:
+    def __init__(self, indicators):
+        self.indicators = dict(indicators)
+        self.checked = []
+        self.pages = []
+
+    def get_indicators_since(self, last_id, limit=10000):
+        self.pages.append(last_id)
+        rows = [{'id': id, 'indicator_value': value} for id, value in sorted(self.indicators.items()) if id > last_id]
+        return rows[:limit]
+
+    def check_indicator(self, indicator_value, indicator_type=None):
+        self.checked.append(indicator_value)
+        for id, value in self.indicators.items():
+            if value == indicator_value:
+                return {'id': id, 'indicator_value': value}
+        return None
+
+class FakeCache:
+    def __init__(self):
+        self.values = {}
+
+    def check_threat_indicator(self, indicator_value):
+        return self.values.get(indicator_value)
+
+    def cache_threat_check(self, indicator_value, result, ttl=3600):
+        self.values[indicator_value] = result
+        return True
+
+@pytest.fixture
+def lookup():
+    intel = FakeThreatIntelligence({1: '203.0.113.15', 2: '198.51.100.67'})
+    lookup = ThreatLookup(intel, FakeCache(), capacity=100, page_size=1, refresh_overlap=0)
+    # Refresh by hand instead of from the background thread
+    lookup._ensure_started = lambda: None
+    lookup.refresh()
+    return lookup
+
+class TestBloomFilter:
+    def test_no_false_negatives(self):
+        """Test every added item is reported as present"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        assert all(item in bloom for item in items)
+
+    def test_false_positive_rate_near_target(self):
+        """Test the filter stays close to its configured error rate when full"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"10.0.{i // 256}.{i % 256}")
+
+        false_positives = sum(f"172.16.{i // 256}.{i % 256}" in bloom for i in range(10000))
+
+        assert false_positives < 300
+        assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+class TestThreatLookup:
+    def test_clean_ip_needs_no_io(self, lookup):
+        """Test IPs rejected by the filter skip the cache and database"""
+        assert lookup.check('192.168.1.45') is None
+
+        assert lookup.threat_intelligence.checked == []
+        assert lookup.cache_manager.values == {}
+        assert lookup.get_stats()['filter_rejections'] == 1
+
+    def test_known_threat_is_read_through_and_cached(self, lookup):
+        """Test a filter hit goes to the database once and is then cached"""
+        assert lookup.check('203.0.113.15')['id'] == 1
+        assert lookup.check('203.0.113.15')['id'] == 1
+
+        assert lookup.threat_intelligence.checked == ['203.0.113.15']
+        assert lookup.get_stats()['threats_found'] == 2
+
+    def test_non_string_values_are_checked_as_text(self, lookup):
+        """Test numbers and null from request JSON are handled instead of raising"""
+        lookup.threat_intelligence.indicators[3] = '12345'
+        lookup.refresh()
+
+        assert lookup.check(12345)['id'] == 3
+        assert lookup.check(3232235777) is None
+        assert lookup.check(None) is None
+
+    def test_negative_results_are_cached(self, lookup):
+        """Test a filter false positive is remembered as clean"""
+        del lookup.threat_intelligence.indicators[2]
+
+        assert lookup.check('198.51.100.67') is None
+        assert lookup.check('198.51.100.67') is None
+
+        assert lookup.threat_intelligence.checked == ['198.51.100.67']
+        assert lookup.cache_manager.values['198.51.100.67'] == {'threat': False}
+        assert lookup.get_stats()['false_positives'] == 2
+
+    def test_refresh_loads_only_new_indicators(self, lookup):
+        """Test refreshes page forward from the last seen id"""
+        lookup.threat_intelligence.indicators[3] = '192.0.2.1'
+        lookup.threat_intelligence.pages = []
+
+        lookup.refresh()
+
+        assert lookup.threat_intelligence.pages == [2, 3]
+        assert '192.0.2.1' in lookup._filter
+        assert lookup.get_stats()['last_indicator_id'] == 3
+
+    def test_refresh_picks_up_late_committed_ids(self):
+        """Test an id that becomes visible after a higher one is still loaded"""
+        intel = FakeThreatIntelligence({1: '203.0.113.15', 3: '192.0.2.3'})
+        lookup = ThreatLookup(intel, FakeCache(), capacity=100, refresh_overlap=10)
+        lookup._ensure_started = lambda: None
+        lookup.refresh()
+
+        intel.indicators[2] = '192.0.2.2'
+        lookup.refresh()
+
+        assert '192.0.2.2' in lookup._filter
+        assert lookup._filter.count == 3
+        assert lookup.get_stats()['last_indicator_id'] == 3
+
+    def test_added_indicator_replaces_negative_entry(self, lookup):
+        """Test a new indicator is visible at once despite a cached miss"""
+        lookup.cache_manager.values['192.0.2.1'] = {'threat': False}
+
+        lookup.add({'id': 3, 'indicator_value': '192.0.2.1'})
+
+        assert lookup.check('192.0.2.1')['id'] == 3
+
+    def test_database_used_until_filter_loaded(self):
+        """Test lookups fall through while the filter is not built yet"""
+        intel = FakeThreatIntelligence({1: '203.0.113.15'})
+        lookup = ThreatLookup(intel, FakeCache())
+        lookup._ensure_started = lambda: None
+
+        assert lookup.check('192.168.1.45') is None
+        assert intel.checked == ['192.168.1.45']
@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for capacity items at error_rate.
+
+    Membership tests never give false negatives; false positives occur at
+    roughly error_rate while no more than capacity items have been added.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        # Byte updates are read-modify-write; concurrent adds must not lose bits
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Add an item; re-adding one already present leaves count unchanged"""
+        positions = self._positions(item)
+        with self._lock:
+            added = False
+            for position in positions:
+                mask = 1 << (position & 7)
+                if not self._bits[position >> 3] & mask:
+                    self._bits[position >> 3] |= mask
+                    added = True
+            if added:
+                self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def false_positive_rate(self):
+        """Expected false-positive rate at the current number of items"""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+    def get_stats(self):
+        return {
+            'items': self.count,
+            'capacity': self.capacity,
+            'bits': self.size,
+            'hashes': self.hash_count,
+            'expected_false_positive_rate': round(self.false_positive_rate(), 6)
+        }
+
+class ThreatLookup:
+    """Read-through threat indicator lookup: Bloom filter, cache, then Postgres.
+
+    The Bloom filter holds every active indicator value, so a value it
+    rejects is definitely clean and is answered in memory. Values it accepts
+    are looked up through the cache manager (in-process L1, then Redis) and
+    finally threat_intelligence; both hits and misses are cached, misses for
+    the shorter negative_ttl.
+
+    A background thread adds new indicators to the filter every
+    refresh_interval seconds and rebuilds it from scratch
+    every rebuild_interval seconds, dropping deactivated indicators and
+    growing it if it has filled past capacity. Until the first load finishes
+    every lookup goes to the cache and database.
+
+    Refreshes page by id, but ids are assigned before commit and reads may
+    go to a lagging replica, so a lower id can become visible after a
+    higher one. Each refresh therefore re-reads the last refresh_overlap ids
+    before its watermark; adding a value twice is harmless.
+    """
+
+    def __init__(self, threat_intelligence, cache_manager, capacity=100000, error_rate=0.001,
+                 refresh_interval=10, rebuild_interval=3600, positive_ttl=3600, negative_ttl=300,
+                 page_size=10000, refresh_overlap=1000):
+        self.threat_intelligence = threat_intelligence
+        self.cache_manager = cache_manager
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.page_size = page_size
+        self.refresh_overlap = refresh_overlap
+
+        self._filter = None
+        self._last_id = 0
+        self._built_at = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread_pid = None
+        self._stopped = threading.Event()
+        self._stats = {
+            'lookups': 0,
+            'filter_rejections': 0,
+            'cache_hits': 0,
+            'database_lookups': 0,
+            'threats_found': 0,
+            'false_positives': 0
+        }
+
+    def check(self, indicator_value):
+        """Return the active threat indicator record for a value, or None.
+        
+        Values come straight from request JSON; None is never a threat and
+        other non-strings (e.g. numbers) are compared as text.
+        """
+        if indicator_value is None:
+            return None
+        indicator_value = str(indicator_value)
+        self._ensure_started()
+        self._count('lookups')
+
+        bloom = self._filter
+        if bloom is not None and indicator_value not in bloom:
+            self._count('filter_rejections')
+            return None
+
+        cached = self.cache_manager.check_threat_indicator(indicator_value) if self.cache_manager else None
+        if cached is not None:
+            self._count('cache_hits')
+            record = cached.get('indicator') if cached.get('threat') else None
+        else:
+            self._count('database_lookups')
+            record = self.threat_intelligence.check_indicator(indicator_value)
+            self._cache_result(indicator_value, record)
+
+        if record:
+            self._count('threats_found')
+        elif bloom is not None:
+            self._count('false_positives')
+        return record
+
+    def add(self, record):
+        """Make a newly stored indicator visible to lookups in this worker immediately.
+
+        Other workers see it after their next refresh; the positive cache
+        entry replaces any negative one they may hold.
+        """
+        if not record or not record.get('indicator_value'):
+            return
+        bloom = self._filter
+        if bloom is not None:
+            bloom.add(record['indicator_value'])
+        self._cache_result(record['indicator_value'], record)
+
+    def refresh(self):
+        """Add indicators created since the last refresh, or rebuild when due"""
+        with self._refresh_lock:
+            due = (self._filter is None
+                   or time.monotonic() - self._built_at >= self.rebuild_interval
+                   or self._filter.count > self._filter.capacity)
+            if due:
+                self._rebuild()
+            else:
+                start = max(0, self._last_id - self.refresh_overlap)
+                self._last_id = max(self._last_id, self._load_since(self._filter, start))
+
+    def close(self):
+        self._stopped.set()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        negatives = stats['filter_rejections'] + stats['false_positives']
+        stats['observed_false_positive_rate'] = round(stats['false_positives'] / negatives, 6) if negatives else 0.0
+        bloom = self._filter
+        stats['filter'] = bloom.get_stats() if bloom is not None else None
+        stats['last_indicator_id'] = self._last_id
+        return stats
+
+    def _rebuild(self):
+        count = self._filter.count if self._filter is not None else 0
+        bloom = BloomFilter(max(self.capacity, count * 2), self.error_rate)
+        last_id = self._load_since(bloom, 0)
+        if last_id is None:
+            return
+        # Swap in whole; readers see either the old or the new filter
+        self._filter = bloom
+        self._last_id = last_id
+        self._built_at = time.monotonic()
+        logger.info(f"Threat indicator filter built with {bloom.count} indicators")
+
+    def _load_since(self, bloom, last_id):
+        """Add active indicators with id > last_id to bloom; returns the new watermark"""
+        while True:
+            rows = self.threat_intelligence.get_indicators_since(last_id, self.page_size)
+            if rows is None:
+                return last_id if bloom is self._filter else None
+            for row in rows:
+                bloom.add(row['indicator_value'])
+                last_id = row['id']
+            if len(rows) < self.page_size:
+                return last_id
+
+    def _cache_result(self, indicator_value, record):
+        if not self.cache_manager:
+            return
+        if record:
+            self.cache_manager.cache_threat_check(indicator_value, {'threat': True, 'indicator': record},
+                                                  ttl=self.positive_ttl)
+        else:
+            self.cache_manager.cache_threat_check(indicator_value, {'threat': False}, ttl=self.negative_ttl)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _ensure_started(self):
+        """Start the refresher once per process (gunicorn forks workers)"""
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+        with self._refresh_lock:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+            thread = threading.Thread(target=self._run, name='threat-filter-refresh', daemon=True)
+            thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing threat indicator filter: {e}")
+            self._stopped.wait(self.refresh_interval)